@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# Benchmark the word-level copied text removal in copied_text.py against the character-level
+# difflib removal it replaced, on synthetic prompt/answer pairs.
+#
+# Each answer is the prompt as copied into a student's tile, with the student's own sentences written
+# after some of the questions, a few prompt words deleted or re-cased, and a few words appended to sentences.
+# Since the student-written words are known, both methods are scored by how many of them they keep
+# (recall) and how much of what they keep was really written by the student (precision).
+
+import os
+import sys
+import time
+import random
+import argparse
+import collections
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from copied_text import CopiedTextRemover
+
+parser = argparse.ArgumentParser(description="Compare word-level copied text removal with difflib on synthetic prompt/answer pairs")
+parser.add_argument("-n", "--pairs", default=50, type=int, help="Number of prompt/answer pairs per size (default: 50)")
+parser.add_argument("-s", "--size", action="append", type=int, help="Prompt length in words (default: 50, 500 and 2000)")
+parser.add_argument("-m", "--min-match", default=3, type=int, help="Minimum match length in words (default: 3)")
+
+PROMPT_WORDS = ("what do you notice about the ratio of the two numbers in each table explain how you know "
+                + "use the diagram to show your thinking then compare your answer with a partner").split()
+STUDENT_WORDS = ("i think it is because when you double one side the other side doubles too so they grow "
+                 + "at the same rate and we saw that in our drawing of apples oranges").split()
+
+def sentence(rand, words, length):
+  return " ".join(rand.choice(words) for i in range(length)).capitalize() + rand.choice([".", "?"])
+
+# Return the prompt, the answer, and the list of words the student wrote
+def make_pair(rand, size):
+  prompt_sentences = []
+  words = 0
+  while words < size:
+    length = rand.randint(6, 15)
+    prompt_sentences.append(sentence(rand, PROMPT_WORDS, length))
+    words += length
+  answer = []
+  written = []
+  for prompt_sentence in prompt_sentences:
+    prompt_tokens = prompt_sentence.split()
+    if rand.random() < 0.1 and len(prompt_tokens) > 4:
+      # Delete a word of the prompt
+      del prompt_tokens[rand.randrange(len(prompt_tokens))]
+    if rand.random() < 0.1:
+      prompt_tokens[0] = prompt_tokens[0].lower()
+    if rand.random() < 0.1:
+      # Add a word to the end of the prompt's sentence
+      extra = rand.choice(STUDENT_WORDS)
+      prompt_tokens.append(extra)
+      written.append(extra)
+    answer.extend(prompt_tokens)
+    if rand.random() < 0.5:
+      student_sentence = sentence(rand, STUDENT_WORDS, rand.randint(4, 20)).split()
+      answer.extend(student_sentence)
+      written.extend(student_sentence)
+  return " ".join(prompt_sentences), " ".join(answer), written
+
+# The character-level removal that copied_text.py replaced
+def difflib_removal(student_text, copied_text):
+  if not copied_text or not student_text:
+    return student_text
+  matcher = SequenceMatcher(None, copied_text, student_text)
+  result = []
+  for tag, _, _, j1, j2 in matcher.get_opcodes():
+    if tag in ('insert', 'replace'):
+      result.append(student_text[j1:j2])
+  return ''.join(result).strip()
+
+def score(kept_text, written):
+  kept = collections.Counter(kept_text.split())
+  expected = collections.Counter(written)
+  correct = sum((kept & expected).values())
+  precision = correct / max(1, sum(kept.values()))
+  recall = correct / max(1, sum(expected.values()))
+  return precision, recall
+
+def run(method, pairs):
+  start = time.perf_counter()
+  results = [method(answer, prompt) for prompt, answer, written in pairs]
+  elapsed = time.perf_counter() - start
+  scores = [score(result, written) for result, (prompt, answer, written) in zip(results, pairs)]
+  precision = sum(s[0] for s in scores) / len(scores)
+  recall = sum(s[1] for s in scores) / len(scores)
+  return elapsed, precision, recall
+
+if __name__ == '__main__':
+  args = parser.parse_args()
+  sizes = args.size or [50, 500, 2000]
+
+  def word_removal(answer, prompt):
+    return CopiedTextRemover(prompt, args.min_match).remove(answer)
+
+  print(f"{args.pairs} pairs per size; minimum match {args.min_match} words")
+  print(f"{'words':>6} {'method':8} {'seconds':>9} {'precision':>10} {'recall':>8}")
+  for size in sizes:
+    rand = random.Random(42)
+    pairs = [make_pair(rand, size) for i in range(args.pairs)]
+    for name, method in [("difflib", difflib_removal), ("words", word_removal)]:
+      elapsed, precision, recall = run(method, pairs)
+      print(f"{size:6d} {name:8} {elapsed:9.3f} {precision:10.3f} {recall:8.3f}")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# Generate a synthetic log file in the format of Concord Consortium log exports, for benchmarking
+# without real (identifiable) student data.  The same options always produce the same file.
+#
+# Rows come from simulated classes of students and teachers working on documents over a school year:
+# most are small navigation events, TEXT_TOOL_CHANGE events carry the whole serialized text of a tile,
+# and COPY_TILE events carry a large serializedObject.  A few rows belong to other applications, and
+# some JSON cells are pretty-printed so that the CSV has quoted fields spanning several lines.
+
+import io
+import sys
+import csv
+import json
+import random
+import argparse
+import datetime
+
+parser = argparse.ArgumentParser(description="Generate a synthetic CLUE log CSV file")
+parser.add_argument("-n", "--rows", default=100000, type=int, help="Number of rows (default: 100000)")
+parser.add_argument("-o", "--output", help="Path to the CSV file (default: standard output)")
+parser.add_argument("-s", "--seed", default=42, type=int, help="Random seed (default: 42)")
+parser.add_argument("-p", "--payload", default=20, type=int, help="Average size of serializedObject payloads in KB (default: 20)")
+parser.add_argument("--classes", default=20, type=int, help="Number of classes (default: 20)")
+parser.add_argument("--tile-column", action="store_true",
+                    help="Add a tileId column copied from the parameters, as read by the top-level text processing scripts")
+
+HEADER = ["id", "session", "username", "application", "activity", "event", "time", "timestamp",
+          "teachers", "class", "school", "parameters", "extras"]
+
+# Events and their relative frequencies
+EVENTS = [("TEXT_TOOL_CHANGE", 20), ("VIEW_SHOW_DOCUMENT", 12), ("SELECT_TILE", 12), ("VIEW_SHOW_TAB", 10),
+          ("CREATE_TILE", 6), ("COPY_TILE", 4), ("GRAPH_TOOL_CHANGE", 8), ("DRAWING_TOOL_CHANGE", 8),
+          ("TABLE_TOOL_CHANGE", 6), ("ADD_COMMENT", 2), ("VIEW_INSTANCE", 8), ("LOGIN", 4)]
+APPLICATIONS = [("CLUE", 92), ("CLUE-dev", 3), ("LARA-log-poc", 3), ("rigse-log", 2)]
+FIRST_NAMES = ["Ana", "Ben", "Chloé", "Dev", "Emma", "Femi", "Gus", "Hana", "Ivan", "Jo", "Kai", "Lena", "Mo", "Noor"]
+LAST_NAMES = ["Garcia", "Nguyen", "Smith", "O'Brien", "Kowalski", "Okafor", "Chen", "Haddad", "Müller", "Singh"]
+WORDS = ("the ratio of apples to oranges is three to two so when we double the recipe we need six apples "
+         + "and four oranges I think the graph shows a line because the table goes up by the same amount").split()
+TILE_TYPES = ["Text", "Text", "Geometry", "Table", "Drawing", "Graph"]
+
+def weighted(rand, choices):
+  return rand.choices([choice for choice, weight in choices], [weight for choice, weight in choices])[0]
+
+def sentence(rand, words):
+  return " ".join(rand.choice(WORDS) for i in range(words)).capitalize() + "."
+
+def slate(rand, paragraphs):
+  return json.dumps({"object": "value", "document": {"children": [
+    {"type": "paragraph", "children": [{"text": sentence(rand, rand.randint(4, 16))}]} for i in range(paragraphs)]}})
+
+class Simulation:
+  def __init__(self, rand, classes, payload_kb):
+    self.rand = rand
+    self.payload_kb = payload_kb
+    self.classes = []
+    for number in range(classes):
+      teachers = [(f"{rand.choice(FIRST_NAMES)} {rand.choice(LAST_NAMES)}", str(1000 + number * 3 + i))
+                  for i in range(rand.choice([1, 1, 1, 2, 3]))]
+      self.classes.append({
+        "class": f"Class {number} - Period {number % 7 + 1}",
+        "classHash": f"{rand.getrandbits(64):016x}",
+        "school": f"School {number // 4}",
+        "teachers": "" if rand.random() < 0.05 else ", ".join(f"{name} ({user_id})" for name, user_id in teachers),
+        "students": [f"{2000 + number * 40 + i}@learn.example.org" for i in range(rand.randint(15, 30))],
+        "teacher": f"{teachers[0][1]}@learn.example.org",
+      })
+    self.tiles = []
+    # Start at the beginning of a school year
+    self.timestamp = datetime.datetime(2023, 8, 21, 8, 0, tzinfo=datetime.timezone.utc).timestamp()
+
+  def payload(self):
+    kb = max(1, int(self.rand.expovariate(1 / self.payload_kb)))
+    return slate(self.rand, kb * 1024 // 90)
+
+  def parameters(self, event, username):
+    rand = self.rand
+    if event in ("VIEW_SHOW_TAB", "LOGIN", "VIEW_INSTANCE"):
+      return {"tab_name": rand.choice(["Problems", "My Work", "Class Work"]), "tab_section_name": "Introduction"}
+    document = {"documentUid": username.split("@")[0], "documentKey": f"-N{rand.getrandbits(40):010x}",
+                "documentType": rand.choice(["problem", "personal", "planning"])}
+    if event == "ADD_COMMENT":
+      return {**document, "commentText": sentence(rand, rand.randint(3, 20))}
+    if event == "COPY_TILE" or not self.tiles:
+      tile = {"tileId": f"{rand.getrandbits(48):012x}", "tileType": rand.choice(TILE_TYPES)}
+      self.tiles.append(tile)
+      if event == "COPY_TILE":
+        return {**document, **tile, "sourceDocumentKey": f"-N{rand.getrandbits(40):010x}",
+                "sourceTileId": f"{rand.getrandbits(48):012x}",
+                "serializedObject": {"type": tile["tileType"], "text": self.payload()}}
+    tile = rand.choice(self.tiles[-50:])
+    if event == "TEXT_TOOL_CHANGE":
+      return {**document, "tileId": tile["tileId"], "tileType": "Text",
+              "args": [{"text": slate(rand, rand.randint(1, 8))}]}
+    if event.endswith("_TOOL_CHANGE"):
+      return {**document, **tile, "operation": "update",
+              "change": {"op": "replace", "path": f"/points/{rand.randint(0, 20)}", "value": [rand.random(), rand.random()]}}
+    return {**document, **tile}
+
+  def row(self, id):
+    rand = self.rand
+    cls = rand.choice(self.classes)
+    self.timestamp += rand.expovariate(1 / 20)
+    # Skip nights and weekends
+    date = datetime.datetime.fromtimestamp(self.timestamp, datetime.timezone.utc)
+    if date.hour >= 22 or date.weekday() >= 5:
+      self.timestamp += 10 * 3600 if date.weekday() < 5 else 48 * 3600
+      date = datetime.datetime.fromtimestamp(self.timestamp, datetime.timezone.utc)
+    is_teacher = rand.random() < 0.05
+    username = cls["teacher"] if is_teacher else rand.choice(cls["students"])
+    event = weighted(rand, EVENTS)
+    parameters = self.parameters(event, username)
+    self.tile_id = parameters.get("tileId", "")
+    extras = {"role": "teacher" if is_teacher else "student", "classHash": cls["classHash"], "appMode": "authed",
+              "problem": f"{rand.randint(1, 4)}.{rand.randint(1, 5)}", "problemPath": "msa/1/1",
+              "url": "https://collaborative-learning.example.org/?class=" + cls["classHash"],
+              "navTabsOpen": rand.random() < 0.5, "selectedNavTab": "problems"}
+    # Some exports are in seconds, others in milliseconds
+    timestamp = int(self.timestamp * 1000) if id % 2 else int(self.timestamp)
+    indent = 2 if rand.random() < 0.02 else None
+    return [id, f"{rand.getrandbits(32):08x}", username, weighted(rand, APPLICATIONS), "msa-1-1", event,
+            date.strftime("%Y-%m-%d %H:%M:%S UTC"), timestamp, cls["teachers"], cls["class"], cls["school"],
+            json.dumps(parameters, ensure_ascii=False, indent=indent), json.dumps(extras, indent=indent)]
+
+def generate(out, rows, seed, payload_kb, classes, tile_column=False):
+  simulation = Simulation(random.Random(seed), classes, payload_kb)
+  writer = csv.writer(out, lineterminator='\n')
+  writer.writerow(HEADER + ["tileId"] if tile_column else HEADER)
+  for id in range(rows):
+    row = simulation.row(id)
+    if tile_column:
+      row.append(simulation.tile_id)
+    writer.writerow(row)
+
+
+if __name__ == '__main__':
+  args = parser.parse_args()
+  if args.output:
+    with open(args.output, encoding="utf-8", mode="w", newline='') as out:
+      generate(out, args.rows, args.seed, args.payload, args.classes, args.tile_column)
+  else:
+    generate(io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8'), args.rows, args.seed, args.payload, args.classes, args.tile_column)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# Benchmark the targeted JSON field extraction in src/jsonfields.py against decoding the whole cell
+# with json.loads, on synthetic parameters cells that carry large serializedObject/documentChanges payloads.
+#
+# The requested keys are placed before the payloads, after them, in random order, or left out,
+# since that decides how much of each cell the extractor can avoid decoding.  The `logs` layout is
+# the parameters column of generate_logs.py, where most cells are small and only COPY_TILE events
+# carry a large payload, to show what the extractor gains on a whole log file.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from jsonfields import FieldExtractor
+from generate_logs import HEADER, Simulation
+
+parser = argparse.ArgumentParser(description="Benchmark targeted JSON field extraction on synthetic large-payload rows")
+parser.add_argument("-n", "--rows", default=200, type=int, help="Number of synthetic rows per layout (default: 200)")
+parser.add_argument("-s", "--size", default=100, type=int, help="Approximate payload size per row in KB (default: 100)")
+parser.add_argument("-l", "--log-rows", default=20000, type=int, help="Number of rows of the logs layout (default: 20000)")
+parser.add_argument("-f", "--field", action="append", help="Field(s) to extract (default: tileId and documentKey)")
+
+LAYOUTS = ["first", "last", "random", "missing", "logs"]
+WORDS = ["the", "plant", "grows", "light", "water", "\"quoted\"", "été", "ratio", "{x}", "[y"]
+
+def random_text(rand, words):
+  return " ".join(rand.choice(WORDS) for i in range(words))
+
+def make_row(rand, size, layout):
+  kb = size * 1024
+  changes = []
+  while len(json.dumps(changes)) < kb // 2:
+    changes.append({"op": "replace", "path": f"/tiles/{rand.randint(0, 99)}/content",
+                    "value": {"text": random_text(rand, 20), "n": rand.random()}})
+  document = {"document": {"children": [{"type": "paragraph", "children": [{"text": random_text(rand, 30)}]}
+                                        for i in range(kb // 600)]}}
+  small = {"tileId": f"tile-{rand.randint(0, 1000)}", "documentKey": f"doc-{rand.randint(0, 1000)}",
+           "args": [{"text": random_text(rand, 5)}], "sourceTile": {"id": "s1", "type": "Text"}}
+  large = {"documentChanges": changes, "serializedObject": {"type": "Text", "text": json.dumps(document)}}
+  if layout == "first":
+    parameters = {**small, **large}
+  elif layout == "last":
+    parameters = {**large, **small}
+  elif layout == "random":
+    items = list(small.items()) + list(large.items())
+    rand.shuffle(items)
+    parameters = dict(items)
+  else:
+    parameters = {**large, "args": small["args"]}
+  return json.dumps(parameters, ensure_ascii=False)
+
+def time_it(function, cells):
+  start = time.perf_counter()
+  results = [function(cell) for cell in cells]
+  return time.perf_counter() - start, results
+
+if __name__ == '__main__':
+  args = parser.parse_args()
+  fields = args.field or ["tileId", "documentKey"]
+  extractor = FieldExtractor(fields)
+
+  def full_parse(cell):
+    return extractor.extract_data(json.loads(cell))
+
+  print(f"{args.rows} rows of ~{args.size} KB per layout; fields: {', '.join(fields)}")
+  print(f"{'layout':8} {'json.loads MB/s':>16} {'extractor MB/s':>16} {'speedup':>8}")
+  for layout in LAYOUTS:
+    rand = random.Random(42)
+    if layout == "logs":
+      simulation = Simulation(rand, 20, args.size)
+      cells = [simulation.row(i)[HEADER.index("parameters")] for i in range(args.log_rows)]
+    else:
+      cells = [make_row(rand, args.size, layout) for i in range(args.rows)]
+    megabytes = sum(len(cell.encode("utf-8")) for cell in cells) / 1e6
+    full_time, expected = time_it(full_parse, cells)
+    scan_time, actual = time_it(extractor.extract, cells)
+    if actual != expected:
+      sys.stderr.write(f"Error: extracted values differ from json.loads for layout {layout}\n")
+      exit(1)
+    print(f"{layout:8} {megabytes / full_time:16.1f} {megabytes / scan_time:16.1f} {full_time / scan_time:7.2f}x")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# Run the scripts of this repository on a synthetic log file (see generate_logs.py) and record
+# how fast each one goes and how much memory it uses, in a JSON results file.
+#
+# Each script runs in its own process, with its output written to a temporary directory.
+# Peak memory is the maximum resident set size of that process, as reported by the OS.
+
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+from generate_logs import generate
+
+parser = argparse.ArgumentParser(description="Benchmark the log processing scripts on a synthetic log file")
+parser.add_argument("-n", "--rows", default=100000, type=int, help="Number of rows to generate (default: 100000)")
+parser.add_argument("-p", "--payload", default=20, type=int, help="Average size of serializedObject payloads in KB (default: 20)")
+parser.add_argument("--seed", default=42, type=int, help="Random seed for the generated file (default: 42)")
+parser.add_argument("-i", "--input", help="Use this log file instead of generating one")
+parser.add_argument("-o", "--output", default="benchmark-results.json", help="Path to the JSON results file (default: benchmark-results.json)")
+parser.add_argument("-s", "--script", action="append", help="Only run this script (eg check-date-range). Can be specified more than once.")
+parser.add_argument("-k", "--keep", action="store_true", help="Keep the temporary directory with the generated and output files")
+
+# Name, command and the file it reads: the raw log, or (for the top-level text processing scripts)
+# the log with an extra tileId column.
+# In commands, {input} is that file and {tmp} is the temporary directory.
+SCRIPTS = [
+  ("check-date-range", ["src/check-date-range.py", "{input}"], "raw"),
+  ("analyze-json-column", ["src/analyze-json-column.py", "-c", "parameters", "{input}"], "raw"),
+  ("split-by-date", ["src/split-by-date.py", "-b", "month", "-o", "{tmp}/split", "{input}"], "raw"),
+  ("sort-by-column", ["src/sort-by-column.py", "--memory", "64", "--temp-dir", "{tmp}", "{input}"], "raw"),
+  ("expand-json-fields", ["src/expand-json-fields.py", "-c", "parameters", "-f", "tileId", "-f", "documentKey",
+                          "-f", "serializedObject", "{input}"], "raw"),
+  ("deidentify-columns", ["src/deidentify-columns.py", "-c", "class", "-c", "school", "-m", "{tmp}/mapping.csv", "{input}"], "raw"),
+  ("process-teacher-column", ["src/process-teacher-column.py", "-m", "{tmp}/teacher_map.csv", "{input}"], "raw"),
+  ("process-file-student", ["src/process-file.py", "-r", "student", "-o", "{tmp}/student.csv", "{input}"], "raw"),
+  ("updated_text_process", ["updated_text_process.py", "{input}", "{tmp}/text.csv"], "text"),
+  ("process_student_logs", ["process_student_logs.py", "{input}", "{tmp}/logs.csv"], "text"),
+]
+
+def count_rows(filename):
+  csv.field_size_limit(sys.maxsize)
+  with open(filename, encoding="utf-8", mode="r", newline='') as file:
+    return sum(1 for row in csv.reader(file)) - 1
+
+# Run a command, returning the elapsed seconds, the peak resident set size in MB and the exit status
+def measure(command, stdout, stderr, cwd):
+  start = time.perf_counter()
+  process = subprocess.Popen(command, stdout=stdout, stderr=stderr, cwd=cwd)
+  _, status, usage = os.wait4(process.pid, 0)
+  elapsed = time.perf_counter() - start
+  # ru_maxrss is in KB on Linux and in bytes on macOS
+  peak_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+  return elapsed, peak_mb, os.waitstatus_to_exitcode(status)
+
+if __name__ == '__main__':
+  args = parser.parse_args()
+  tmp = tempfile.mkdtemp(prefix="log-benchmark-")
+  try:
+    inputs = {}
+    if args.input:
+      input_file = os.path.abspath(args.input)
+      inputs["raw"] = inputs["text"] = (input_file, count_rows(input_file), os.path.getsize(input_file) / 1e6)
+    for kind in ["raw", "text"]:
+      if kind not in inputs:
+        input_file = os.path.join(tmp, f"input-{kind}.csv")
+        sys.stderr.write(f"Generating {args.rows} rows in {input_file}\n")
+        with open(input_file, encoding="utf-8", mode="w", newline='') as out:
+          generate(out, args.rows, args.seed, args.payload, 20, tile_column=kind == "text")
+        inputs[kind] = (input_file, args.rows, os.path.getsize(input_file) / 1e6)
+    input_file, rows, megabytes = inputs["raw"]
+
+    results = []
+    print(f"{rows} rows, {megabytes:.1f} MB")
+    print(f"{'script':24} {'seconds':>9} {'rows/s':>10} {'MB/s':>8} {'peak MB':>8}")
+    for name, command, kind in SCRIPTS:
+      if args.script and name not in args.script:
+        continue
+      script_input, script_rows, script_megabytes = inputs[kind]
+      command = [sys.executable, os.path.join(REPO_DIR, command[0])] + [part.format(input=script_input, tmp=tmp) for part in command[1:]]
+      with open(os.path.join(tmp, name + ".out"), mode="wb") as stdout, open(os.path.join(tmp, name + ".err"), mode="w+b") as stderr:
+        elapsed, peak_mb, exit_code = measure(command, stdout, stderr, tmp)
+        if exit_code != 0:
+          stderr.seek(0)
+          sys.stderr.write(f"Error: {name} exited with status {exit_code}:\n{stderr.read().decode('utf-8', errors='replace')}\n")
+      results.append({"script": name, "command": command[1:], "input": kind, "rows": script_rows, "exit_code": exit_code,
+                      "seconds": round(elapsed, 3), "rows_per_second": round(script_rows / elapsed, 1),
+                      "mb_per_second": round(script_megabytes / elapsed, 3), "peak_rss_mb": round(peak_mb, 1)})
+      print(f"{name:24} {elapsed:9.2f} {script_rows / elapsed:10.0f} {script_megabytes / elapsed:8.2f} {peak_mb:8.1f}")
+
+    summary = {"date": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+               "platform": platform.platform(), "cpus": os.cpu_count(), "input": args.input or f"generated (seed {args.seed}, payload {args.payload} KB)",
+               "rows": rows, "megabytes": round(megabytes, 3), "results": results}
+    with open(args.output, encoding="utf-8", mode="w") as file:
+      json.dump(summary, file, indent=2)
+      file.write("\n")
+    print(f"Results written to {args.output}")
+  finally:
+    if args.keep:
+      sys.stderr.write(f"Files kept in {tmp}\n")
+    else:
+      shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,96 @@
+import re
+
+# A word token: any run of non-whitespace characters
+TOKEN_PATTERN = re.compile(r'\S+')
+
+def tokenize(text):
+    """
+    Splits text into word tokens.
+
+    Returns:
+        - The list of tokens, in order.
+    """
+    return TOKEN_PATTERN.findall(text)
+
+def token_key(token):
+    """
+    Normalizes a token for comparison, so that a change of case or of surrounding
+    punctuation does not stop a copied word from matching.
+    """
+    return token.strip('.,;:!?"\'()[]').casefold() or token
+
+def shingles(keys, length):
+    """
+    Collects every run of 'length' consecutive keys.
+
+    Returns:
+        - A set of tuples of keys.
+    """
+    return set(zip(*(keys[i:] for i in range(length))))
+
+class CopiedTextRemover:
+    """
+    Removes the parts of student texts that were copied from one text (eg, the prompt of a copied tile).
+
+    The copied text is broken into shingles of 'min_match' consecutive words, which are
+    hashed into a set once. A student text is then scanned word by word: every word that
+    is part of a run of 'min_match' words also found in the copied text is removed.
+    Each text is processed in time proportional to its number of words.
+
+    A copied text of fewer than 'min_match' words is only removed when it is the whole
+    student text, since its words alone (eg a one-word title) are likely to be used by the
+    student elsewhere.
+    """
+
+    def __init__(self, copied_text, min_match=3):
+        copied_keys = [token_key(token) for token in tokenize(copied_text)]
+        self.length = max(1, min_match)
+        self.short_keys = copied_keys if len(copied_keys) < self.length else None
+        self.shingles = shingles(copied_keys, self.length) if self.short_keys is None else set()
+
+    def copied_mask(self, tokens):
+        """
+        Marks the student tokens that are part of a copied run.
+
+        Returns:
+            - A list of booleans, True for each copied token.
+        """
+        if self.short_keys is not None:
+            whole = bool(self.short_keys) and [token_key(token) for token in tokens] == self.short_keys
+            return [whole] * len(tokens)
+        length = self.length
+        copied = [False] * len(tokens)
+        if not self.shingles:
+            return copied
+        keys = [token_key(token) for token in tokens]
+        covered_until = 0
+        for start, shingle in enumerate(zip(*(keys[i:] for i in range(length)))):
+            if shingle in self.shingles:
+                for position in range(max(start, covered_until), start + length):
+                    copied[position] = True
+                covered_until = start + length
+        return copied
+
+    def remove(self, student_text):
+        """
+        Removes copied runs of words from a student text.
+
+        Returns:
+            - The remaining words of the student text, separated by single spaces.
+        """
+        if not student_text:
+            return student_text
+        tokens = tokenize(student_text)
+        copied = self.copied_mask(tokens)
+        return ' '.join(token for token, is_copied in zip(tokens, copied) if not is_copied)
+
+def remove_copied_text(student_text, copied_text, min_match=3):
+    """
+    Removes the runs of at least 'min_match' words that the student text shares with the copied text.
+
+    Returns:
+        - Student text with copied portions removed.
+    """
+    if not copied_text or not student_text:
+        return student_text  # If either text is empty, return original student text
+    return CopiedTextRemover(copied_text, min_match).remove(student_text)
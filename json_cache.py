@@ -0,0 +1,34 @@
+import functools
+
+# Decoded JSON cells are memoized, so that a cell that repeats is only decoded once. Cells longer than
+# MAX_CACHED_LENGTH are rarely repeated and are decoded every time, which bounds the memory the cache uses.
+DECODE_CACHE_SIZE = 10000
+MAX_CACHED_LENGTH = 4096
+
+def memoize_decoding(function):
+    """
+    Wraps a function whose last argument is the raw JSON text of a cell, caching its results.
+
+    Returns:
+        - The wrapped function, with the cache_info() of its cache.
+    """
+    cached = functools.lru_cache(maxsize=DECODE_CACHE_SIZE)(function)
+
+    def decode(*args):
+        if isinstance(args[-1], str) and len(args[-1]) <= MAX_CACHED_LENGTH:
+            return cached(*args)
+        return function(*args)
+    decode.cache_info = cached.cache_info
+    return decode
+
+def cache_stats(name, function):
+    """
+    Describes how many of the cells passed to a memoized function were decoded.
+
+    Returns:
+        - A line such as "parameters: 1,000 of 1,200 cells decoded (16.7% repeats)".
+    """
+    info = function.cache_info()
+    cells = info.hits + info.misses
+    repeats = info.hits / cells if cells else 0
+    return f"{name}: {info.misses:,} of {cells:,} cells decoded ({repeats:.1%} repeats)"
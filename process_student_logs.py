@@ -1,6 +1,11 @@
 import json
+import sys
+import collections
+import numpy as np
 import pandas as pd
 import argparse
+from text_state import TileTextTracker
+from json_cache import memoize_decoding, cache_stats
 
 def extract_text(json_obj):
     """Recursively extract 'text' entries from a JSON-like structure."""
@@ -12,21 +17,23 @@ def extract_text(json_obj):
         return [text for item in json_obj for text in extract_text(item)]
     return []
 
-def text_change_text(row):
-    """Extract raw text-change-related data from the 'parameters' column."""
+def text_change_text(event, parameters_json):
+    """Extract raw text-change-related data and its tileId from the 'parameters' column."""
     try:
-        parameters = json.loads(row['parameters'])
+        parameters = json.loads(parameters_json)
         
         # Check for the specific event and conditions
-        if row['event'] == 'TEXT_TOOL_CHANGE' and isinstance(parameters.get('args'), list):
+        if event == 'TEXT_TOOL_CHANGE' and isinstance(parameters.get('args'), list):
             if isinstance(parameters['args'][0].get('text'), list):
-                return ''
-            return parameters['args'][0].get('text', '')
+                return '', parameters.get('tileId', '')
+            return parameters['args'][0].get('text', ''), parameters.get('tileId', '')
         
     except (json.JSONDecodeError, KeyError, TypeError):
         pass
     
-    return ''
+    return '', ''
+
+cached_text_change_text = memoize_decoding(text_change_text)
 
 def combine_text(text_change_content):
     """Combine all 'text' entries from the text_change_text content."""
@@ -39,6 +46,8 @@ def combine_text(text_change_content):
         pass
     return ''
 
+cached_combine_text = memoize_decoding(combine_text)
+
 def compute_removed_text(row):
     """Compute text that is in text_change_text but not in combined_text."""
     try:
@@ -49,23 +58,109 @@ def compute_removed_text(row):
     except AttributeError:
         return ''
 
-def process_student_logs(input_file, output_file):
-    """Process student logs to extract and combine text while preserving the original column."""
+def track_text_changes(df, tile_ids, tracker, student_column):
+    """
+    Feed the text changes to the tracker in timestamp order, returning lists of the words each row added and removed.
+    Without a student_column, texts are tracked by tile alone.
+    """
+    order = np.flatnonzero((df['event'] == 'TEXT_TOOL_CHANGE').to_numpy())
+    timestamps = None
+    if 'timestamp' in df.columns:
+        # The columns are read as text, so the timestamps are converted to compare them as numbers
+        timestamps = pd.to_numeric(df['timestamp'], errors='coerce').to_numpy()
+        order = order[np.argsort(timestamps[order], kind='stable')]
+    students = df[student_column].to_numpy() if student_column else None
+    tiles = tile_ids.to_numpy()
+    texts = df['combined_text'].to_numpy()
+    words_added = [''] * len(df)
+    words_removed = [''] * len(df)
+    for position in order.tolist():
+        student = students[position] if students is not None else ''
+        timestamp = timestamps[position] if timestamps is not None else None
+        words_added[position], words_removed[position] = tracker.update(student, tiles[position], texts[position], timestamp)
+    return words_added, words_removed
 
-    df = pd.read_csv(input_file)
+def write_final_texts(tracker, student_column, output_file):
+    """Write the latest text of each student's tile."""
+    final_texts = pd.DataFrame(tracker.final_texts(), columns=[student_column, 'tileId', 'final_text'])
+    final_texts.to_csv(output_file, index=False)
 
-    df['text_change_text'] = df.apply(text_change_text, axis=1)
+def process_chunk(df, tracker, student_column):
+    """Add the extracted text columns to a DataFrame of log rows; only TEXT_TOOL_CHANGE rows are decoded."""
+    changes = (df['event'] == 'TEXT_TOOL_CHANGE').to_numpy()
+    tile_ids = pd.Series('', index=df.index, dtype=object)
+    for column in ['text_change_text', 'combined_text', 'removed_text']:
+        df[column] = ''
+    if changes.any():
+        selected = df.loc[changes]
+        extracted = pd.DataFrame([cached_text_change_text(event, parameters) for event, parameters in zip(selected['event'], selected['parameters'])],
+                                 index=selected.index)
+        df.loc[changes, 'text_change_text'] = extracted[0]
+        tile_ids[changes] = extracted[1]
 
-    df['combined_text'] = df['text_change_text'].apply(combine_text)
+        df.loc[changes, 'combined_text'] = df.loc[changes, 'text_change_text'].apply(cached_combine_text)
 
-    df['removed_text'] = df.apply(compute_removed_text, axis=1)
-    
-    df.to_csv(output_file, index=False)
+        df.loc[changes, 'removed_text'] = df.loc[changes].apply(compute_removed_text, axis=1)
+
+    df['words_added'], df['words_removed'] = track_text_changes(df, tile_ids, tracker, student_column)
+    return df
+
+def process_student_logs(input_file, output_file, student_column='username', final_text_file=None, chunksize=None, columns=None):
+    """
+    Process student logs to extract and combine text while preserving the original column.
+
+    With a chunksize, the log is read and written that many rows at a time, so memory use
+    does not depend on the size of the file. The text state of each tile is kept across chunks,
+    so the log should already be sorted by timestamp.
+    """
+    header = list(pd.read_csv(input_file, nrows=0).columns)
+    # The student column is only needed for the final texts; without it, text changes are tracked by tile alone
+    required = ['event', 'parameters'] + ([student_column] if final_text_file else [])
+    for column in required:
+        if column not in header:
+            sys.stderr.write("Error: Could not find " + column + " column; columns are: " + ", ".join(header) + "\n")
+            exit(1)
+    if student_column not in header:
+        student_column = None
+
+    usecols = None
+    if columns:
+        # Load only the columns that are used, plus the requested pass-through columns
+        needed = set(columns) | {'event', 'parameters', 'timestamp', student_column}
+        usecols = lambda column: column in needed
+    # Low-cardinality columns take much less memory as categories. The other columns are read as text, so that they
+    # are written as they were read: types inferred per chunk could differ between chunks (eg 7 and 7.0).
+    dtype = collections.defaultdict(lambda: str, {'event': 'category', 'application': 'category'})
+
+    tracker = TileTextTracker()
+    if chunksize:
+        reader = pd.read_csv(input_file, usecols=usecols, dtype=dtype, chunksize=chunksize)
+        for number, chunk in enumerate(reader):
+            process_chunk(chunk, tracker, student_column)
+            chunk.to_csv(output_file, mode='w' if number == 0 else 'a', header=number == 0, index=False)
+    else:
+        df = pd.read_csv(input_file, usecols=usecols, dtype=dtype)
+        process_chunk(df, tracker, student_column)
+        df.to_csv(output_file, index=False)
+
+    if tracker.out_of_order:
+        sys.stderr.write(f"Warning: {tracker.out_of_order} text changes are older than an earlier change to the same tile\n")
+    if final_text_file:
+        write_final_texts(tracker, student_column, final_text_file)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process student logs to extract and combine text.")
     parser.add_argument("input_file", help="Path to the input CSV file containing student logs.")
     parser.add_argument("output_file", help="Path to save the processed CSV file.")
+    parser.add_argument("--student-column", default="username", help="Column identifying the student (default: username).")
+    parser.add_argument("--final-text", help="Path to save the final text of each student's text tile.")
+    parser.add_argument("--chunksize", type=int, help="Read and write the log this many rows at a time, to keep memory use constant.")
+    parser.add_argument("--columns", action="append",
+                        help="Column to copy to the output file. Can be specified more than once; by default all columns are copied.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print how many JSON cells were decoded and how many were repeats.")
     args = parser.parse_args()
 
-    process_student_logs(args.input_file, args.output_file)
\ No newline at end of file
+    process_student_logs(args.input_file, args.output_file, args.student_column, args.final_text, args.chunksize, args.columns)
+    if args.verbose:
+        sys.stderr.write(cache_stats("parameters", cached_text_change_text) + "\n")
+        sys.stderr.write(cache_stats("text changes", cached_combine_text) + "\n")
@@ -4,12 +4,25 @@ import sys
 import csv
 import json
 import argparse
+from csvreader import column_index
+from decodecache import DecodeCache
+import decodecache
+import instrumentation
+import rowfilter
 
 parser = argparse.ArgumentParser(description="Extract a list of fields from a JSON column of a CSV file.",
                                  epilog="The fields are output in a sorted list, one per line, with dots separating nested fields.")
 parser.add_argument("filename", help="CSV file")
 parser.add_argument("-c", "--column", default="parameters", help="Heading of the column containing JSON data")
+parser.add_argument("-p", "--field-profile", action="store_true",
+                    help="For each field, also show the number and percentage of rows that contain it, the types of its values, and their maximum length")
+parser.add_argument("-s", "--sample", type=int, help="Only read this many rows of the file")
+parser.add_argument("-u", "--until-stable", type=int, metavar="ROWS",
+                    help="Stop reading once this many rows in a row have not contained any new fields")
 parser.add_argument("-v", "--verbose", action="store_true", help="Print information while running")
+rowfilter.add_arguments(parser)
+decodecache.add_arguments(parser)
+instrumentation.add_arguments(parser)
 
 # Skip any descendants of these keys
 skip_values_of = ["serializedObject"]
@@ -17,47 +30,109 @@ skip_values_of = ["serializedObject"]
 # Some log files have very long data in the columns
 csv.field_size_limit(10000000)
 
-def find_fields(data: any, fields, prefix: str = ""):
-  for key in data:
-    if isinstance(data[key], dict) and not (key in skip_values_of):
-      find_fields(data[key], fields, prefix + key + ".")
+JSON_TYPES = {dict: "object", list: "array", str: "string", int: "number", float: "number", bool: "boolean", type(None): "null"}
+
+# Statistics kept for each field
+class FieldStats:
+  def __init__(self):
+    self.count = 0
+    self.types = set()
+    self.max_length = 0
+
+# Length of a value: characters for strings, elements for arrays and objects
+def value_length(value):
+  if isinstance(value, (str, list, dict)):
+    return len(value)
+  return len(json.dumps(value))
+
+# Append (field, type, length) for each field in data to a list
+def flatten_fields(data: any, found, prefix: str = ""):
+  for key, value in data.items():
+    if isinstance(value, dict) and not (key in skip_values_of):
+      flatten_fields(value, found, prefix + key + ".")
     else:
-      if prefix + key not in fields:
-          if args.verbose:
-            sys.stderr.write(f"Found field: {prefix + key}\n")
-          fields.append(prefix + key)
+      found.append((prefix + key, JSON_TYPES.get(type(value), type(value).__name__), value_length(value)))
+  return found
+
+# Decode a JSON cell into a tuple of (field, type, length); empty if it is not an object
+def decode_fields(json_data):
+  data = json.loads(json_data)
+  if not isinstance(data, dict):
+    return ()
+  return tuple(flatten_fields(data, []))
 
-def parse_file(filename, json_field):
-  fields = []
+# Add the fields found in a cell to the fields dict; returns the number of fields not seen before
+def add_fields(found, fields):
+  new_fields = 0
+  for field, value_type, length in found:
+    stats = fields.get(field)
+    if stats is None:
+      if args.verbose:
+        sys.stderr.write(f"Found field: {field}\n")
+      stats = fields[field] = FieldStats()
+      new_fields += 1
+    stats.count += 1
+    stats.types.add(value_type)
+    if length > stats.max_length:
+      stats.max_length = length
+  return new_fields
+
+def parse_file(filename, json_field, sample=None, until_stable=None, row_filter=None,
+               cache_size=decodecache.DEFAULT_ENTRIES, cache_mb=decodecache.DEFAULT_MB):
+  fields = {}
+  json_rows = 0
+  # Repeated cells are only decoded once
+  cache = DecodeCache(decode_fields, cache_size, cache_mb)
   # Read file line-by-line as a CSV
-  with open(filename, encoding="utf-8", mode="r") as file:
-      csv_reader = csv.reader(file)
-      # Get the header
-      header = next(csv_reader)
-      try:
-        param_index = header.index(json_field)
-      except ValueError:
-        sys.stderr.write("Error: Could not find " + json_field + " column; columns are: " + ", ".join(header))
-        exit(1)
-
-      rows = 0
-      for row in csv_reader:
-        rows += 1
-        if (args.verbose and rows % 1000 == 0):
-          sys.stderr.write(f"Processed {rows} rows\n")
+  with rowfilter.open_rows(filename, row_filter) as (file, header, csv_reader):
+      param_index = column_index(header, json_field)
+
+      progress = instrumentation.Progress(file, args.verbose, args.summary)
+      decode = progress.timed("decode", cache.get)
+      add_found = progress.timed("transform", add_fields)
+      stable_rows = 0
+      for row in progress.track(csv_reader):
+        rows = progress.rows
+        if sample and rows > sample:
+          progress.rows -= 1
+          break
         json_data = row[param_index]
         if (json_data):
           try:
-            data = json.loads(json_data)
+            found = decode(json_data)
           except json.JSONDecodeError:
             sys.stderr.write(f"Error: Could not decode JSON data in row {rows}: {json_data}\n")
             continue
-          find_fields(data, fields)
-  return fields
+          json_rows += 1
+          if add_found(found, fields):
+            stable_rows = 0
+          else:
+            stable_rows += 1
+          if until_stable and stable_rows >= until_stable:
+            sys.stderr.write(f"No new fields in the last {stable_rows} rows; stopped after {rows} rows\n")
+            break
+      progress.finish(json_rows=json_rows, fields=len(fields), decode_cache=cache.summary())
+  if (args.verbose):
+    sys.stderr.write(cache.stats() + "\n")
+  return fields, json_rows
+
+def print_profile(fields, json_rows):
+  width = max([len("field")] + [len(field) for field in fields])
+  print(f"{'field':{width}} {'rows':>10} {'percent':>8} {'max length':>10}  types")
+  for field in sorted(fields):
+    stats = fields[field]
+    percent = 100 * stats.count / json_rows
+    print(f"{field:{width}} {stats.count:10d} {percent:7.2f}% {stats.max_length:10d}  {', '.join(sorted(stats.types))}")
+  print(f"Rows with JSON data: {json_rows}")
 
 
 if __name__ == '__main__':
   args = parser.parse_args()
-  fields = parse_file(args.filename, args.column)
-  fields.sort()
-  print("\n".join(fields))
+  row_filter = rowfilter.from_arguments(parser, args)
+  with instrumentation.profiled(args.cprofile, args.cprofile_output):
+    fields, json_rows = parse_file(args.filename, args.column, args.sample, args.until_stable, row_filter,
+                                   args.decode_cache, args.decode_cache_mb)
+  if args.field_profile:
+    print_profile(fields, json_rows)
+  else:
+    print("\n".join(sorted(fields)))
@@ -1,76 +1,145 @@
 #!/usr/bin/env python3
 
+import calendar
 import datetime
+import time
 import sys
-import csv
 import argparse
+import numpy as np
+from timestamps import MS_THRESHOLD
+from csvreader import ColumnReader
+import instrumentation
+import rowfilter
 
 parser = argparse.ArgumentParser(description="Show the dates included in a timestamp column of a CSV file.",
                                  epilog="Either unix-style timestamps or milliseconds since the epoch are accepted.")
 parser.add_argument("filename", help="CSV file")
 parser.add_argument("-c", "--column", default="timestamp", help="Heading of the column containing timestamp data")
+parser.add_argument("-g", "--granularity", default="month", choices=["day", "week", "month", "school-year"],
+                    help="Size of the periods that rows are counted in (default: month)")
+parser.add_argument("-m", "--month", default=8, type=int,
+                    help="Month that the school year is considered to begin, as a number; default is 8 (August)")
+parser.add_argument("--chunk-size", default=100000, type=int, help="Number of rows to convert at a time (default: 100000)")
 parser.add_argument("-v", "--verbose", action="store_true", help="Print information while running")
+rowfilter.add_arguments(parser)
+instrumentation.add_arguments(parser)
 
-# Some log files have very long data in the columns
-csv.field_size_limit(10000000)
+# Time zone offsets are multiples of 15 minutes, and only change on a 15-minute boundary
+MS_PER_QUARTER_HOUR = 15 * 60 * 1000
+MS_PER_DAY = 24 * 3600 * 1000
 
-def parse_file(filename, timestamp_field):
-  non_numeric = 0
-  earliest = None
-  latest = None
-  months = {}
-  # Read file line-by-line as a CSV
-  with open(filename, encoding="utf-8", mode="r") as file:
-      csv_reader = csv.reader(file)
-      # Get the header
-      header = next(csv_reader)
+# Counts rows per period, converting a whole chunk of timestamps at once with numpy
+class DateHistogram:
+  def __init__(self, granularity, start_month):
+    self.granularity = granularity
+    self.start_month = start_month
+    self.counts = {}
+    self.earliest = None
+    self.latest = None
+    self.non_numeric = 0
+
+  def add_chunk(self, values):
+    try:
+      timestamps = np.array(values, dtype=np.int64)
+    except (ValueError, OverflowError):
+      timestamps = self.parse_slowly(values)
+    timestamps = timestamps[timestamps != 0]
+    if len(timestamps) == 0:
+      return
+    # Values above 10^10 must be formatted in milliseconds; convert everything else to milliseconds too
+    ms = np.where(timestamps > MS_THRESHOLD, timestamps, timestamps * 1000)
+    earliest = int(ms.min())
+    latest = int(ms.max())
+    if self.earliest is None or earliest < self.earliest:
+      self.earliest = earliest
+    if self.latest is None or latest > self.latest:
+      self.latest = latest
+    keys, counts = np.unique(self.period_keys(local_time(ms)), return_counts=True)
+    for key, count in zip(keys.tolist(), counts.tolist()):
+      self.counts[key] = self.counts.get(key, 0) + count
+
+  # Parse one value at a time, counting the ones that are not integers
+  def parse_slowly(self, values):
+    timestamps = []
+    for value in values:
       try:
-        col_index = header.index(timestamp_field)
+        timestamp = int(value)
       except ValueError:
-        sys.stderr.write("Error: Could not find " + timestamp_field + " column; columns are: " + ", ".join(header))
-        exit(1)
+        self.non_numeric += 1
+        continue
+      if -2**62 < timestamp < 2**62:
+        timestamps.append(timestamp)
+      else:
+        self.non_numeric += 1
+    return np.array(timestamps, dtype=np.int64)
+
+  # Integer key of the period containing each local time in milliseconds
+  def period_keys(self, local_ms):
+    days = local_ms // MS_PER_DAY
+    if self.granularity == "day":
+      return days
+    if self.granularity == "week":
+      # Day 0 (Jan 1 1970) was a Thursday; weeks start on Monday
+      return days - (days + 3) % 7
+    months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    if self.granularity == "month":
+      return months
+    # School years are keyed by the calendar year they begin in
+    return (months - (self.start_month - 1)) // 12 + 1970
+
+  def label(self, key):
+    if self.granularity == "day" or self.granularity == "week":
+      return str(np.datetime64(key, "D"))
+    if self.granularity == "month":
+      return str(np.datetime64(key, "M"))
+    if self.start_month == 1:
+      return str(key)
+    return f"{key}-{(key + 1) % 100:02d}"
+
+# Shift UTC milliseconds to the local time zone, the same way datetime.fromtimestamp does.
+# The offset is looked up once per distinct quarter hour.
+def local_time(ms):
+  quarters, index = np.unique(ms // MS_PER_QUARTER_HOUR, return_inverse=True)
+  offsets = np.array([utc_offset(quarter * 900) for quarter in quarters.tolist()], dtype=np.int64)
+  return ms + offsets[index.reshape(ms.shape)] * 1000
+
+def utc_offset(seconds):
+  return calendar.timegm(time.localtime(seconds)) - seconds
 
-      rows = 0
-      for row in csv_reader:
-        rows += 1
-        if (args.verbose and rows % 1000 == 0):
-          sys.stderr.write(f"Processed {rows} rows\n")
-        try:
-          timestamp = int(row[col_index])
-        except ValueError:
-          non_numeric += 1
-          continue
-        if (timestamp):
-          if (timestamp > 10000000000):
-            # Must be formatted in milliseconds
-            timestamp = timestamp / 1000
-          date = datetime.datetime.fromtimestamp(timestamp)
-          if (earliest is None or date < earliest):
-            earliest = date
-          if (latest is None or date > latest):
-            latest = date
-          month = date.strftime("%Y-%m")
-          if month not in months:
-            months[month] = 0
-          months[month] += 1
-  if non_numeric > 0:
-    sys.stderr.write("Non-numeric values found: " + str(non_numeric) + "\n")
-  return earliest, latest, months
+def parse_file(filename, timestamp_field, histogram, chunk_size, row_filter=None):
+  # Read only the timestamp column of each row
+  with ColumnReader(filename, [timestamp_field], row_filter) as reader:
+      progress = instrumentation.Progress(reader, args.verbose, args.summary)
+      add_chunk = progress.timed("transform", histogram.add_chunk)
+      chunk = []
+      for (timestamp,), start, end in progress.track(reader):
+        chunk.append(timestamp)
+        if len(chunk) >= chunk_size:
+          add_chunk(chunk)
+          chunk = []
+      if chunk:
+        add_chunk(chunk)
+      progress.finish(non_numeric=histogram.non_numeric)
+  if histogram.non_numeric > 0:
+    sys.stderr.write("Non-numeric values found: " + str(histogram.non_numeric) + "\n")
+  return histogram
 
 
 if __name__ == '__main__':
   args = parser.parse_args()
-  earliest, latest, months = parse_file(args.filename, args.column)
-  if (len(months) == 0):
+  row_filter = rowfilter.from_arguments(parser, args)
+  with instrumentation.profiled(args.cprofile, args.cprofile_output):
+    histogram = parse_file(args.filename, args.column, DateHistogram(args.granularity, args.month), args.chunk_size, row_filter)
+  if (len(histogram.counts) == 0):
     sys.stderr.write("No dates found\n")
     exit(1)
-  print(f"Earliest date: {earliest}")
-  print(f"Latest date:   {latest}")
-  # Show the number of entries per month
+  print(f"Earliest date: {datetime.datetime.fromtimestamp(histogram.earliest / 1000)}")
+  print(f"Latest date:   {datetime.datetime.fromtimestamp(histogram.latest / 1000)}")
+  # Show the number of entries per period
   # Print 1 to 20 '#' characters to show the relative sizes of the numbers.
-  max_count = max(months.values())
-  for month in sorted(months.keys()):
-    count = months[month]
+  max_count = max(histogram.counts.values())
+  for key in sorted(histogram.counts.keys()):
+    count = histogram.counts[key]
     bar_length = int((count / max_count) * 20)+1
     bar = '#' * bar_length
-    print(f"{month}: {count:7d} {bar}")
+    print(f"{histogram.label(key)}: {count:7d} {bar}")
@@ -4,7 +4,10 @@ import shortuuid
 import argparse
 import csv
 import sys
-import io
+from csvreader import column_index
+import compressed
+import instrumentation
+import rowfilter
 
 parser = argparse.ArgumentParser(description="De-identify a list of columns from a CSV file.",
                                  epilog="The columns are masked using UUIDs and a separate mapping file is written to map.csv")
@@ -12,25 +15,19 @@ parser.add_argument("filename", help="CSV file")
 parser.add_argument("-i", "--identifier", action="store", help="Heading of a column to de-identify.")
 parser.add_argument("-t", "--to", action="store", help="Heading of a column to de-identify.")
 parser.add_argument("-v", "--verbose", action="store_true", help="Print information while running")
+parser.add_argument("--csv-output", help="Path to the CSV file with the column removed (default: standard output)")
 parser.add_argument("-o", "--output", required=True, action="store", help="Path to identifier mapping file")
+rowfilter.add_arguments(parser)
+instrumentation.add_arguments(parser)
 
-def remove_column(filename, identifier, to):
+def remove_column(filename, identifier, to, output=None, row_filter=None):
     id_map = {}
-    with open(filename, encoding="utf-8", mode="r") as file:
-        csv_reader = csv.reader(file)
-        writer = csv.writer(io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8'), lineterminator='\n')
-        
-        # Get the header
-        header = next(csv_reader)
+    with rowfilter.open_rows(filename, row_filter) as (file, header, csv_reader), compressed.open_output(output) as out:
+        writer = csv.writer(out, lineterminator='\n')
         col_indexes = []
 
-        try:
-            col_indexes.append(header.index(identifier))
-            col_indexes.append(header.index(to))
-            
-        except ValueError:
-            sys.stderr.write("Error: Could not find one or more specified columns; columns are: " + ", ".join(header))
-            exit(1)
+        col_indexes.append(column_index(header, identifier))
+        col_indexes.append(column_index(header, to))
         if (args.verbose):
             sys.stderr.write('Removing column: ' + identifier + '\n')
         id_map[identifier] = {}
@@ -38,12 +35,9 @@ def remove_column(filename, identifier, to):
         del header[col_indexes[1]]
         writer.writerow(header)
 
-        rows = 0
-        for row in csv_reader:
-            rows += 1
-            if (args.verbose and rows % 1000 == 0):
-                sys.stderr.write(f"Processed {rows} rows\n")
-            
+        progress = instrumentation.Progress(file, args.verbose, args.summary)
+        write_row = progress.timed("write", writer.writerow)
+        for row in progress.track(csv_reader):
             id = row[col_indexes[0]]
 
             if (id):
@@ -52,7 +46,8 @@ def remove_column(filename, identifier, to):
                 else:
                     id_map[identifier][id] = row[col_indexes[1]]
             del row[col_indexes[1]]
-            writer.writerow(row)
+            write_row(row)
+        progress.finish()
         return id_map
     
 def write_mapping_file(filename, map):
@@ -66,5 +61,7 @@ def write_mapping_file(filename, map):
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    id_map = remove_column(args.filename, args.identifier, args.to)
-    write_mapping_file(args.output, id_map)
+    row_filter = rowfilter.from_arguments(parser, args)
+    with instrumentation.profiled(args.cprofile, args.cprofile_output):
+        id_map = remove_column(args.filename, args.identifier, args.to, args.csv_output, row_filter)
+        write_mapping_file(args.output, id_map)
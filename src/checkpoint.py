@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+# Checkpoints for long runs over a file, so that an interrupted run can be continued instead of restarted,
+# and a quarantine file for rows that cannot be processed.
+#
+# While checkpointing, the input is read with csvreader.ColumnReader, which knows the byte offset of each
+# record.  Every CHECKPOINT_INTERVAL seconds the outputs are flushed and a checkpoint file records the input
+# offset after the last row processed, the size of each output file, the number of rows and any state the
+# script needs (eg the identifiers masked so far).  It is written to a temporary file and renamed, so there is
+# always one complete checkpoint.
+#
+# With --resume, the outputs are truncated to their sizes at the checkpoint and the input is read from its
+# offset, so the result is the same as for an uninterrupted run.  A compressed output file is ended and
+# restarted at each checkpoint (gzip, bz2 and xz files can hold several streams one after the other),
+# so that it can be truncated there.
+
+import os
+import sys
+import csv
+import json
+import time
+import contextlib
+import compressed
+from csvreader import ColumnReader
+import rowfilter
+
+CHECKPOINT_INTERVAL = 60
+
+def add_arguments(parser):
+  parser.add_argument("--checkpoint", metavar="PATH",
+                      help="Save progress to this file regularly, so that an interrupted run can be continued with --resume (requires --output)")
+  parser.add_argument("--checkpoint-interval", default=CHECKPOINT_INTERVAL, type=float, metavar="SECONDS",
+                      help=f"Time between checkpoints (default: {CHECKPOINT_INTERVAL})")
+  parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint file, if there is one")
+  parser.add_argument("--quarantine", metavar="PATH",
+                      help="Write rows that cannot be processed to this CSV file, with the error, instead of stopping")
+
+# Check the checkpoint options, exiting with a usage error if they cannot be used
+def check_arguments(parser, args):
+  if args.resume and not args.checkpoint:
+    parser.error("--resume needs a --checkpoint file")
+  if args.checkpoint and not args.output:
+    parser.error("--checkpoint needs an --output file")
+
+def truncate(filename, size):
+  with open(filename, mode="r+b") as file:
+    file.truncate(size)
+
+# Rows that could not be processed, in the same columns as the input with the row number and error first
+class Quarantine:
+  def __init__(self, filename, header, append=False):
+    self.filename = filename
+    self.file = compressed.open_output(filename, newline='', append=append)
+    self.writer = csv.writer(self.file, lineterminator='\n')
+    if not append:
+      self.writer.writerow(["row", "error"] + header)
+    self.count = 0
+
+  def add(self, row_number, error, row):
+    self.writer.writerow([row_number, f"{type(error).__name__}: {error}"] + row)
+    self.count += 1
+
+  def close(self):
+    self.file.close()
+
+# Reads the rows of a file and writes an output file, saving checkpoints if checkpoint_path is given.
+#
+# Use run.rows() to iterate over the input rows.  run.resumed is true if the run continues an earlier one,
+# in which case the output already has a header, and run.state is the state saved with the checkpoint.
+# Call run.quarantine() for rows that fail, and run.save(state) whenever run.due() is true.
+class Run:
+  def __init__(self, filename, output, config, row_filter=None, checkpoint_path=None, resume=False,
+               interval=CHECKPOINT_INTERVAL, quarantine_path=None):
+    self.filename = filename
+    self.output = output
+    self.checkpoint_path = checkpoint_path
+    self.interval = interval
+    stat = os.stat(filename)
+    # A checkpoint is only used for the same input and options
+    self.config = dict(config, input=os.path.abspath(filename), input_size=stat.st_size, input_mtime_ns=stat.st_mtime_ns,
+                       output=os.path.abspath(output) if output else None,
+                       quarantine=os.path.abspath(quarantine_path) if quarantine_path else None,
+                       filter=[[predicate.column, predicate.kind, predicate.values] for predicate in row_filter.predicates]
+                       if row_filter else None)
+    self.saved = self.load() if resume else None
+    self.resumed = self.saved is not None
+    self.state = self.saved["state"] if self.saved else None
+    self.row_number = self.saved["rows"] if self.saved else 0
+    self.offset = None
+    self.stack = contextlib.ExitStack()
+    if checkpoint_path:
+      self.reader = self.stack.enter_context(ColumnReader(filename, None, row_filter))
+      self.file = self.reader
+      self.header = self.reader.header
+      self.records = None
+      if self.saved:
+        self.reader.seek(self.saved["input_offset"])
+        truncate(output, self.saved["output_offset"])
+        if quarantine_path:
+          truncate(quarantine_path, self.saved["quarantine_offset"])
+    else:
+      self.reader = None
+      self.file, self.header, self.records = self.stack.enter_context(rowfilter.open_rows(filename, row_filter))
+    self.out = self.stack.enter_context(compressed.open_output(output, append=self.resumed))
+    self.quarantined = None
+    if quarantine_path:
+      self.quarantined = Quarantine(quarantine_path, self.header, append=self.resumed)
+      self.quarantined.count = self.saved["quarantined"] if self.saved else 0
+      self.stack.callback(self.quarantined.close)
+    self.next_save = time.monotonic() + interval
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, traceback):
+    self.stack.close()
+    if self.quarantined is not None and self.quarantined.count:
+      sys.stderr.write(f"{self.quarantined.count:,} rows could not be processed; see {self.quarantined.filename}\n")
+    # The checkpoint is only needed until the run is complete
+    if exc_type is None and self.checkpoint_path and os.path.exists(self.checkpoint_path):
+      os.remove(self.checkpoint_path)
+
+  def load(self):
+    if not os.path.exists(self.checkpoint_path):
+      sys.stderr.write(f"No checkpoint in {self.checkpoint_path}; starting from the beginning\n")
+      return None
+    with open(self.checkpoint_path, encoding="utf-8", mode="r") as file:
+      saved = json.load(file)
+    if saved["config"] != self.config:
+      changed = [key for key in self.config if saved["config"].get(key) != self.config[key]]
+      sys.stderr.write(f"Error: The checkpoint in {self.checkpoint_path} is for a different run (changed: {', '.join(changed)})\n")
+      exit(1)
+    sys.stderr.write(f"Resuming after row {saved['rows']}\n")
+    return saved
+
+  # Iterate over the rows after the header, keeping track of the input offset for checkpoints
+  def rows(self):
+    if self.reader is None:
+      for row in self.records:
+        self.row_number += 1
+        yield row
+      return
+    for row, start, end in self.reader:
+      self.row_number += 1
+      # A checkpoint saved while this row is being processed continues after it
+      self.offset = self.reader.position
+      yield row
+
+  # Write a row that failed to the quarantine file, or raise the error if there is none
+  def quarantine(self, row, error):
+    if self.quarantined is None:
+      raise error
+    self.quarantined.add(self.row_number, error, row)
+
+  def due(self):
+    return self.checkpoint_path is not None and time.monotonic() >= self.next_save
+
+  # Flush the outputs and save a checkpoint after the last row read
+  def save(self, state=None):
+    if self.offset is None:
+      return
+    saved = {"config": self.config, "rows": self.row_number, "input_offset": self.offset,
+             "output_offset": compressed.sync(self.out), "state": state}
+    if self.quarantined is not None:
+      saved["quarantine_offset"] = compressed.sync(self.quarantined.file)
+      saved["quarantined"] = self.quarantined.count
+    temporary = self.checkpoint_path + ".tmp"
+    with open(temporary, encoding="utf-8", mode="w") as file:
+      json.dump(saved, file)
+    os.replace(temporary, self.checkpoint_path)
+    self.next_save = time.monotonic() + self.interval
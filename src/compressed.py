@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+# Open input and output files that may be compressed, choosing gzip, bz2 or xz by the file extension.
+#
+# Compressed files are decompressed (or compressed) on a background thread, which passes blocks of data
+# to or from the main thread through a bounded queue, so the (de)compression overlaps with parsing and
+# writing the CSV.  zlib, bz2 and lzma release the GIL while they work, so the two threads run in parallel.
+# At most QUEUE_BLOCKS blocks are waiting at any time, which bounds the memory used.
+#
+# Other files are opened normally, and an output filename of None means standard output.
+
+import io
+import os
+import sys
+import bz2
+import gzip
+import lzma
+import queue
+import threading
+
+COMPRESSION = {".gz": gzip, ".bz2": bz2, ".xz": lzma}
+# Python's gzip defaults to level 9, which is much slower than the gzip command's default of 6 for a slightly smaller file
+WRITE_OPTIONS = {gzip: {"compresslevel": 6}}
+BLOCK_SIZE = 1 << 20
+QUEUE_BLOCKS = 8
+# Queued to a BackgroundWriter to end the current compressed stream
+SYNC = object()
+
+# The compression module for a filename (eg gzip for log.csv.gz), or None if it is not compressed
+def compression(filename):
+  if not filename:
+    return None
+  for extension, module in COMPRESSION.items():
+    if filename.lower().endswith(extension):
+      return module
+  return None
+
+# Decompresses a file on a background thread; read it through io.BufferedReader
+class BackgroundReader(io.RawIOBase):
+  def __init__(self, filename, module):
+    self.file = open(filename, mode="rb")
+    self.decompressed = module.open(self.file, mode="rb")
+    self.queue = queue.Queue(QUEUE_BLOCKS)
+    self.block = memoryview(b'')
+    self.done = False
+    self.stopping = False
+    # Position in the compressed file of the data read so far, for progress reporting
+    self.compressed_position = 0
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def run(self):
+    try:
+      while not self.stopping:
+        block = self.decompressed.read(BLOCK_SIZE)
+        self.queue.put((block, self.file.tell()))
+        if not block:
+          return
+    except Exception as error:
+      self.queue.put((error, None))
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    if not self.block:
+      if self.done:
+        return 0
+      block, position = self.queue.get()
+      if isinstance(block, Exception):
+        self.done = True
+        raise block
+      if not block:
+        self.done = True
+        return 0
+      self.block = memoryview(block)
+      self.compressed_position = position
+    size = min(len(buffer), len(self.block))
+    buffer[:size] = self.block[:size]
+    self.block = self.block[size:]
+    return size
+
+  def fileno(self):
+    return self.file.fileno()
+
+  def tell(self):
+    return self.compressed_position
+
+  def close(self):
+    if self.closed:
+      return
+    # Stop the thread, emptying the queue in case it is waiting to add a block
+    self.stopping = True
+    while self.thread.is_alive():
+      try:
+        self.queue.get(timeout=0.1)
+      except queue.Empty:
+        pass
+    self.decompressed.close()
+    self.file.close()
+    super().close()
+
+# Compresses data on a background thread; write to it through io.BufferedWriter
+class BackgroundWriter(io.RawIOBase):
+  def __init__(self, filename, module, mode="wb"):
+    self.filename = filename
+    self.module = module
+    self.compressed = module.open(filename, mode=mode, **WRITE_OPTIONS.get(module, {}))
+    self.queue = queue.Queue(QUEUE_BLOCKS)
+    self.synced = threading.Event()
+    self.error = None
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def run(self):
+    while True:
+      block = self.queue.get()
+      if block is None:
+        return
+      if self.error is None:
+        try:
+          if block is SYNC:
+            # End the compressed stream so that everything written so far can be read back, and start another one
+            self.compressed.close()
+            self.compressed = self.module.open(self.filename, mode="ab", **WRITE_OPTIONS.get(self.module, {}))
+            self.synced.set()
+            continue
+          self.compressed.write(block)
+        except Exception as error:
+          # Keep taking blocks so that the main thread is not blocked; the error is raised there
+          self.error = error
+      if block is SYNC:
+        self.synced.set()
+
+  def writable(self):
+    return True
+
+  def write(self, data):
+    if self.error is not None:
+      raise self.error
+    # The caller may reuse its buffer, so queue a copy
+    self.queue.put(bytes(data))
+    return len(data)
+
+  # Wait until all of the data written so far is in the file, as complete compressed streams
+  def sync(self):
+    self.synced.clear()
+    self.queue.put(SYNC)
+    self.synced.wait()
+    if self.error is not None:
+      raise self.error
+
+  def close(self):
+    if self.closed:
+      return
+    self.queue.put(None)
+    self.thread.join()
+    self.compressed.close()
+    super().close()
+    if self.error is not None:
+      raise self.error
+
+# Open a binary file for reading
+def open_binary_input(filename):
+  module = compression(filename)
+  if module is None:
+    return open(filename, mode="rb")
+  return io.BufferedReader(BackgroundReader(filename, module), BLOCK_SIZE)
+
+# Open a text file for reading, as open(filename, encoding="utf-8", mode="r", newline=newline) would
+def open_input(filename, newline=None):
+  if compression(filename) is None:
+    return open(filename, encoding="utf-8", mode="r", newline=newline)
+  return io.TextIOWrapper(open_binary_input(filename), encoding="utf-8", newline=newline)
+
+# Flush a file opened by open_output or open_binary_output, and return the size of the file
+def sync(file):
+  file.flush()
+  raw = file.buffer.raw if isinstance(file, io.TextIOWrapper) else file.raw
+  if isinstance(raw, BackgroundWriter):
+    raw.sync()
+    return os.path.getsize(raw.filename)
+  return os.fstat(file.fileno()).st_size
+
+# Open a binary file for writing (mode "wb") or appending (mode "ab")
+def open_binary_output(filename, mode="wb", buffering=BLOCK_SIZE):
+  module = compression(filename)
+  if module is None:
+    return open(filename, mode=mode, buffering=buffering)
+  return io.BufferedWriter(BackgroundWriter(filename, module, mode), buffering)
+
+# Open a text file for writing (or appending), or standard output if filename is None
+def open_output(filename, newline=None, append=False):
+  if not filename:
+    # Closing the returned file leaves standard output open
+    return io.TextIOWrapper(open(sys.stdout.fileno(), mode="wb", closefd=False), encoding="utf-8", newline=newline)
+  if compression(filename) is None:
+    return open(filename, encoding="utf-8", mode="a" if append else "w", newline=newline)
+  return io.TextIOWrapper(open_binary_output(filename, "ab" if append else "wb"), encoding="utf-8", newline=newline)
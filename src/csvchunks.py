@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# Split a CSV file into byte ranges that begin and end on record boundaries, so that each range
+# can be parsed on its own (eg by a worker process).
+#
+# A newline is a record boundary only if it is outside of a quoted field.  The file is memory-mapped and read
+# from the start with the regular expression that csvreader.py uses to find the end of a record, matching all
+# of the records up to each target in one call.  Only a quote at the start of a field opens a quoted field, as
+# with csv.reader, so a stray quote in an unquoted field (eg 12" ruler) does not hide the boundaries after it.
+
+import os
+import re
+import mmap
+from csvreader import RECORD, BOM, record_end
+
+# Whole records, each with its newline.  Matched up to a target offset, it stops at the last record boundary
+# before the target, since a quoted field that is cut off by the target cannot be followed by a newline.
+RECORDS_PATTERN = re.compile(rb'(?:' + RECORD + rb'\n)*')
+# Largest range returned by split_file, so that the memory a worker needs does not grow with the file
+MAX_CHUNK_SIZE = 64 << 20
+
+# Return the offsets of the first record boundary after each of the target offsets.
+# The result is sorted and has no duplicates; targets past the last record are dropped.
+def record_boundaries(filename, targets):
+  targets = sorted(targets)
+  boundaries = []
+  if not targets or os.path.getsize(filename) == 0:
+    return boundaries
+  with open(filename, mode="rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+    # A quote at the start of the first record is not recognized when matching several records, since it may follow
+    # a byte order mark, so the first record is always matched on its own
+    first = len(BOM) if data[:len(BOM)] == BOM else 0
+    search = first
+    for target in targets:
+      if boundaries and boundaries[-1] > target:
+        continue
+      while True:
+        if target > search > first:
+          search = RECORDS_PATTERN.match(data, search, target).end()
+        newline = record_end(data, search, True)
+        if newline == len(data):
+          return boundaries
+        search = newline + 1
+        if search > target:
+          break
+      boundaries.append(search)
+  return boundaries
+
+# Divide a CSV file into (start, end) byte ranges of roughly equal size, skipping the header row.  There are at least
+# `chunks` ranges, and more for a large file so that none is much over max_size (a single record can be longer).
+# Returns the length of the header in bytes along with the list of ranges.
+def split_file(filename, chunks, max_size=MAX_CHUNK_SIZE):
+  size = os.path.getsize(filename)
+  chunks = max(chunks, -(-size // max_size))
+  header_end = record_boundaries(filename, [0])
+  if not header_end:
+    return size, []
+  header_end = header_end[0]
+  step = (size - header_end) / max(chunks, 1)
+  targets = [header_end + int(step * i) for i in range(1, chunks)]
+  boundaries = [header_end] + [b for b in record_boundaries(filename, targets) if b > header_end] + [size]
+  ranges = []
+  for start, end in zip(boundaries, boundaries[1:]):
+    if end > start:
+      ranges.append((start, end))
+  return header_end, ranges
+
+def read_range(filename, start, end):
+  with open(filename, mode="rb") as file:
+    file.seek(start)
+    return file.read(end - start)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+# A CSV reader for scripts that only look at a few columns of each row.
+#
+# The file is memory-mapped and read as bytes.  Fields are parsed only up to the last requested column,
+# and only the requested columns are decoded into strings; the end of the record is then found by
+# looking for the first newline outside of a quoted field, jumping over quoted fields with a regular
+# expression, without parsing the remaining fields.  So a script that needs the timestamp column does
+# not pay for building strings out of the large parameters and extras columns.
+#
+# As with csv.reader, a field is quoted only if it starts with a quote; a quote anywhere else in an
+# unquoted field (eg 12" ruler) is an ordinary character.
+#
+# Each record is returned with its byte offsets in the file, so that a script can copy a row to its
+# output unchanged, as raw bytes, instead of re-quoting its fields with csv.writer.
+#
+# With columns=None, whole rows are returned instead, parsed by the csv module.
+#
+# A row filter (see rowfilter.py) can be given to skip records: its prefilter looks for the values it needs in
+# the raw bytes of each record, and only the records that may match are parsed and checked properly.
+#
+# Compressed files (see compressed.py) cannot be memory-mapped; they are decompressed as a stream instead.
+
+import os
+import re
+import csv
+import sys
+import mmap
+import compressed
+
+# One field: a quoted field (with quotes escaped by doubling them, and any characters after the closing quote)
+# or an unquoted field, which does not start with a quote but can contain them
+FIELD_PATTERN = re.compile(rb'"[^"]*(?:""[^"]*)*"[^,\r\n]*|(?:[^,"\r\n][^,\r\n]*)?')
+# The rest of a quoted field after its opening quote, up to and including the closing quote
+QUOTED_REST = re.compile(rb'[^"]*(?:""[^"]*)*"')
+# A record up to its line ending.  A quote opens a quoted field only at the start of a record or after a comma,
+# and a quoted field that is never closed runs to the end of the data; any other quote is an ordinary character.
+# The closing quote cannot be followed by another, so that in part of a file a doubled quote is never taken for it.
+QUOTED_FIELD = rb'"(?:[^"]*(?:""[^"]*)*"(?!")|[^"]*(?:""[^"]*)*\Z)'
+RECORD = rb'(?:' + QUOTED_FIELD + rb')?[^"\n]*(?:(?:(?<![^,\n])' + QUOTED_FIELD + rb'|(?<=[^,\n])")[^"\n]*)*'
+RECORD_PATTERN = re.compile(RECORD)
+BOM = b'\xef\xbb\xbf'
+
+# Return the index of a column in the header, or exit with an error listing the columns
+def column_index(header, column):
+  try:
+    return header.index(column)
+  except ValueError:
+    sys.stderr.write("Error: Could not find " + column + " column; columns are: " + ", ".join(header) + "\n")
+    exit(1)
+
+# Parse a whole record, translating line endings in quoted fields as a file opened in text mode would
+def parse_row(record):
+  text = record.decode("utf-8")
+  if "\r" in text:
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+  return next(csv.reader([text]))
+
+# The value of a field, translating line endings in quoted fields as parse_row does
+def field_value(field):
+  if field[:1] == b'"':
+    if field[-1:] == b'"':
+      field = field[1:-1].replace(b'""', b'"')
+    else:
+      # Characters after the closing quote are added to the value, as csv.reader does
+      closing = QUOTED_REST.match(field, 1).end()
+      field = field[1:closing - 1].replace(b'""', b'"') + field[closing:]
+    if b'\r' in field:
+      field = field.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+  return field.decode("utf-8")
+
+# Find the end of the record that starts at start in data: the offset of its newline, or of the end of the data.
+# Returns None if the data is not complete and the record may continue after it.
+def record_end(data, start, complete):
+  end = RECORD_PATTERN.match(data, start).end()
+  if end < len(data) or complete:
+    return end
+  return None
+
+class ColumnReader:
+  def __init__(self, filename, columns, row_filter=None):
+    self.base = 0
+    self.prefilter = None
+    if compressed.compression(filename) is None:
+      self.file = open(filename, mode="rb")
+      size = os.fstat(self.file.fileno()).st_size
+      # An empty file cannot be mapped
+      self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+      self.stream = None
+    else:
+      # A compressed file is read a block at a time, keeping only the data from the current record on.
+      # The data is a bytearray, so that blocks are added and old data dropped without copying the rest.
+      self.file = compressed.open_binary_input(filename)
+      self.data = bytearray()
+      self.stream = self.file
+      # Read enough to see whether the file starts with a byte order mark
+      while self.stream is not None and len(self.data) < len(BOM):
+        self.fill(0)
+    self.position = len(BOM) if self.data[:len(BOM)] == BOM else 0
+    record = self.next_record(None)
+    if record is None:
+      sys.stderr.write("Error: " + filename + " is empty\n")
+      exit(1)
+    self.header, self.header_start, self.header_end = record
+    self.header_raw = self.raw(self.header_start, self.header_end)
+    if columns is None:
+      self.indexes = None
+    else:
+      self.indexes = [column_index(self.header, column) for column in columns]
+    self.row_filter = row_filter
+    if row_filter is not None:
+      row_filter.setup(self.header)
+      if row_filter.needles:
+        self.prefilter = row_filter.prefilter
+      if self.indexes is not None:
+        # Parse the filter's columns after the requested ones
+        self.indexes = self.indexes + row_filter.indexes
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def close(self):
+    if isinstance(self.data, mmap.mmap):
+      self.data.close()
+    self.file.close()
+
+  def fileno(self):
+    return self.file.fileno()
+
+  # Offset of the next record, for progress reporting; for a compressed file, the offset in the compressed data
+  def tell(self):
+    if self.stream is not None:
+      return self.file.raw.tell()
+    return self.position
+
+  # Iterate over the records after the header, as (values of the requested columns, start offset, end offset),
+  # or (row, start offset, end offset) if no columns were requested
+  def __iter__(self):
+    indexes = self.indexes
+    row_filter = self.row_filter
+    if row_filter is None:
+      while True:
+        record = self.next_record(indexes)
+        if record is None:
+          return
+        yield record
+    elif indexes is None:
+      while True:
+        record = self.next_record(indexes)
+        if record is None:
+          return
+        if row_filter.matches(record[0]):
+          yield record
+    else:
+      count = len(indexes) - len(row_filter.indexes)
+      while True:
+        record = self.next_record(indexes)
+        if record is None:
+          return
+        values, start, end = record
+        if row_filter.test(values[count:]):
+          yield values[:count], start, end
+
+  # Continue reading at the start of a record, eg at an offset found by an earlier run
+  def seek(self, offset):
+    while self.stream is not None and self.base + len(self.data) < offset:
+      self.fill(len(self.data))
+    self.position = offset
+
+  # The bytes of a record, without its line ending.  For a compressed file, only the last record read is available.
+  def raw(self, start, end):
+    return bytes(self.data[start - self.base:end - self.base])
+
+  # Read the next block of a compressed file, dropping the data before offset (relative to the current data)
+  def fill(self, offset):
+    block = self.stream.read(compressed.BLOCK_SIZE)
+    if not block:
+      self.stream = None
+    del self.data[:offset]
+    self.data += block
+    self.base += offset
+    return offset
+
+  # Parse the next record that is not blank and passes the prefilter.  With indexes=None, all of the fields are returned.
+  def next_record(self, indexes):
+    prefilter = self.prefilter
+    while True:
+      data = self.data
+      start = self.position - self.base
+      newline = record_end(data, start, self.stream is None)
+      while newline is None:
+        # Read more of a compressed file, and search it again from the start of the record
+        start -= self.fill(start)
+        data = self.data
+        newline = record_end(data, start, self.stream is None)
+      if start >= len(data):
+        return None
+      self.position = self.base + newline + 1
+      end = newline
+      if end > start and data[end - 1] == 13:  # carriage return
+        end -= 1
+      # A blank line is a record with one empty field, as with csv.reader; skip it like csv.reader does
+      if end > start and (prefilter is None or prefilter(data, start, end)):
+        break
+    base = self.base
+    if indexes is None:
+      return parse_row(data[start:end]), base + start, base + end
+    last = max(indexes, default=-1)
+    fields = []
+    match = FIELD_PATTERN.match
+    position = start
+    # Parse fields up to the last one needed
+    while len(fields) <= last:
+      field = match(data, position, end)
+      fields.append(field.group())
+      position = field.end()
+      if position >= end or data[position] != 44:  # not a comma
+        break
+      position += 1
+    values = [field_value(fields[index]) if index < len(fields) else '' for index in indexes]
+    return values, base + start, base + end
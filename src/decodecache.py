@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# Memoize the decoding of JSON cells that repeat.
+#
+# The extras column is identical on long runs of rows from the same session, and many parameters cells
+# (eg of navigation events) are exact repeats, so the result of decoding a cell is kept in a bounded
+# LRU cache keyed on the raw cell text.  A repeated cell costs one dict lookup instead of a JSON decode.
+#
+# The cache holds at most max_entries results, and evicts the least recently used ones when the estimated
+# size of the cached text and results goes over max_mb.  Cells longer than MAX_CELL_FRACTION of the memory
+# budget, or than MAX_CELL_LENGTH, are decoded every time; they are rarely repeated, would evict everything
+# else, and hashing them to look them up costs about as much as decoding them.
+#
+# Caching a cell that never repeats costs more than it saves, so once WARMUP_LOOKUPS cells of a column have
+# been looked up, the cache is emptied if fewer than MIN_HIT_RATE of them were repeats, and every later cell
+# is just decoded.
+#
+# Cached results are shared between rows, so they must not be modified: the decode function should
+# return a tuple (or another immutable value).  Cells that fail to decode are not cached.
+
+import collections
+
+DEFAULT_ENTRIES = 100000
+DEFAULT_MB = 64
+MAX_CELL_FRACTION = 1 / 64
+MAX_CELL_LENGTH = 4096
+WARMUP_LOOKUPS = 20000
+MIN_HIT_RATE = 0.25
+# Estimated bytes used by a cache entry besides its text: the dict entries, the result tuple and the values in it
+ENTRY_OVERHEAD = 300
+
+def add_arguments(parser):
+  parser.add_argument("--decode-cache", default=DEFAULT_ENTRIES, type=int, metavar="ENTRIES",
+                      help=f"Number of decoded JSON cells to remember, so that repeated cells are only decoded once; 0 turns the cache off (default: {DEFAULT_ENTRIES})")
+  parser.add_argument("--decode-cache-mb", default=DEFAULT_MB, type=float, metavar="MB",
+                      help=f"Approximate memory limit of the decode cache (default: {DEFAULT_MB})")
+
+# Estimated memory used by a cached cell and its result.  Measuring the result with sys.getsizeof costs
+# more than decoding a small cell, so the values taken from a cell are assumed to be no longer than the cell.
+def entry_size(text):
+  return ENTRY_OVERHEAD + 2 * len(text)
+
+class DecodeCache:
+  def __init__(self, decode, max_entries=DEFAULT_ENTRIES, max_mb=DEFAULT_MB):
+    self.decode = decode
+    self.max_entries = max_entries
+    self.max_bytes = int(max_mb * 1e6)
+    self.max_length = min(MAX_CELL_LENGTH, int(self.max_bytes * MAX_CELL_FRACTION))
+    self.cache = collections.OrderedDict()
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.enabled = max_entries > 0
+    # Set to the number of cells looked up if the cache was turned off for too few repeats
+    self.disabled_after = None
+
+  # Decode a cell, or return the result for the same text from the cache
+  def get(self, text):
+    if not self.enabled or len(text) > self.max_length:
+      self.misses += 1
+      return self.decode(text)
+    value = self.cache.get(text)
+    if value is not None:
+      self.hits += 1
+      self.cache.move_to_end(text)
+      return value
+    self.misses += 1
+    value = self.decode(text)
+    self.cache[text] = value
+    self.bytes += entry_size(text)
+    while len(self.cache) > self.max_entries or self.bytes > self.max_bytes:
+      evicted, _ = self.cache.popitem(last=False)
+      self.bytes -= entry_size(evicted)
+    if self.hits + self.misses >= WARMUP_LOOKUPS and self.hit_rate() < MIN_HIT_RATE:
+      self.disable()
+    return value
+
+  # Stop caching, and free the cached results
+  def disable(self):
+    self.enabled = False
+    self.disabled_after = self.hits + self.misses
+    self.cache.clear()
+    self.bytes = 0
+
+  # Add the counts of another cache, eg one used by a worker process
+  def add_counts(self, hits, misses):
+    self.hits += hits
+    self.misses += misses
+
+  def hit_rate(self):
+    lookups = self.hits + self.misses
+    return self.hits / lookups if lookups else 0.0
+
+  # Statistics for a --summary file
+  def summary(self):
+    return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hit_rate(), 4),
+            "entries": len(self.cache), "mb": round(self.bytes / 1e6, 1), "disabled_after": self.disabled_after}
+
+  def stats(self):
+    message = f"Decode cache: {self.hits:,} hits of {self.hits + self.misses:,} cells ({self.hit_rate():.1%})"
+    if self.cache:
+      message += f", {len(self.cache):,} entries, {self.bytes / 1e6:.1f} MB"
+    if self.disabled_after is not None:
+      message += f"; turned off after {self.disabled_after:,} cells for too few repeats"
+    return message
@@ -4,58 +4,89 @@ import shortuuid
 import argparse
 import csv
 import sys
-import io
+from idstore import IdentifierStore
+from csvreader import column_index
+import checkpoint
+import instrumentation
+import rowfilter
 
 csv.field_size_limit(sys.maxsize)
 parser = argparse.ArgumentParser(description="De-identify a list of columns from a CSV file.",
-                                 epilog="The columns are masked using UUIDs and a separate mapping file is written to map.csv")
+                                 epilog="The columns are masked using UUIDs and a separate mapping file is written to map.csv.  "
+                                 + "With --store, mappings are kept in a database that is reused across runs, and only identifiers "
+                                 + "that are new to the store are appended to the mapping file.")
 parser.add_argument("filename", help="CSV file")
 parser.add_argument("-c", "--column", action="append", help="Heading of a column to de-identify. Can be specified more than once.")
 parser.add_argument("-v", "--verbose", action="store_true", help="Print information while running")
-parser.add_argument("-m", "--mapfile", required=True, action="store", help="Path to identifier mapping file")
+parser.add_argument("-o", "--output", help="Path to the de-identified CSV file (default: standard output)")
+parser.add_argument("-m", "--mapfile", action="store", help="Path to identifier mapping file")
+parser.add_argument("-s", "--store", action="store", help="Path to a persistent identifier store (an SQLite file, created if it does not exist)")
+parser.add_argument("--cache-size", default=1000000, type=int,
+                    help="Number of identifiers from the store to keep in memory (default: 1000000)")
+rowfilter.add_arguments(parser)
+checkpoint.add_arguments(parser)
+instrumentation.add_arguments(parser)
 
-def deidentify_fields(filename, columns):
-    id_map = {}
-    with open(filename, encoding="utf-8", mode="r") as file:
-        csv_reader = csv.reader(file)
-        writer = csv.writer(io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8'), lineterminator='\n')
-        
-        # Get the header
-        header = next(csv_reader)
+# Masks identifiers with an in-memory dict per column; used when there is no persistent store
+class MemoryMasker:
+    def __init__(self, columns):
+        self.id_map = {col: {} for col in columns}
+
+    def mask(self, column, data):
+        mapping = self.id_map[column]
+        mask = mapping.get(data)
+        if mask is None:
+            mask = shortuuid.uuid(name=data)
+            mapping[data] = mask
+        return mask
+
+    def state(self):
+        return {"id_map": self.id_map}
+
+    def restore(self, state):
+        self.id_map = state["id_map"]
+
+# With checkpoint_path, the state of a MemoryMasker is saved with each checkpoint.  An identifier store keeps its
+# own state: before_save is called before each checkpoint to write the new mappings to it.
+def deidentify_fields(filename, columns, masker, output=None, row_filter=None, checkpoint_path=None, resume=False,
+                      interval=checkpoint.CHECKPOINT_INTERVAL, quarantine_path=None, before_save=None):
+    config = {"script": "deidentify-columns", "columns": columns}
+    with checkpoint.Run(filename, output, config, row_filter, checkpoint_path, resume, interval, quarantine_path) as run:
+        header = run.header
+        if run.resumed and isinstance(masker, MemoryMasker):
+            masker.restore(run.state)
+        writer = csv.writer(run.out, lineterminator='\n')
         col_indexes = []
 
         for col in columns:
-            try:
-                col_indexes.append(header.index(col))
-            except ValueError:
-                sys.stderr.write("Error: Could not find " + col + " column; columns are: " + ", ".join(header))
-                exit(1)
+            col_indexes.append(column_index(header, col))
             if (args.verbose):
                 sys.stderr.write('De-identifying column: ' + col + '\n')
-            id_map[col] = {}
 
-        writer.writerow(header)
+        if not run.resumed:
+            writer.writerow(header)
 
-        rows = 0
-        for row in csv_reader:
-            rows += 1
-            if (args.verbose and rows % 1000 == 0):
-                sys.stderr.write(f"Processed {rows} rows\n")
-            
-            for col_index in col_indexes:
-                data = row[col_index]
+        progress = instrumentation.Progress(run.file, args.verbose, args.summary)
+        mask = progress.timed("transform", masker.mask)
+        write_row = progress.timed("write", writer.writerow)
+        for row in progress.track(run.rows()):
+            try:
+                for col_index in col_indexes:
+                    data = row[col_index]
 
-                if (data):
-                    # Use the value stored in id_map if there is one; otherwise generate a new masked value
-                    if (data in id_map):
-                        mask = id_map[header[col_index]][data]
-                    else:
-                        mask = shortuuid.uuid(name=data)
-                        id_map[header[col_index]][data] = mask
-                    row[col_index] = mask
+                    if (data):
+                        row[col_index] = mask(header[col_index], data)
+            except IndexError as error:
+                # A row with too few columns
+                run.quarantine(row, error)
+                continue
 
-            writer.writerow(row)
-        return id_map
+            write_row(row)
+            if run.due():
+                if before_save:
+                    before_save()
+                run.save(masker.state() if isinstance(masker, MemoryMasker) else None)
+        progress.finish()
     
 def write_mapping_file(filename, map):
     with open(filename, encoding="utf-8", mode="w") as file:
@@ -68,5 +99,32 @@ def write_mapping_file(filename, map):
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    id_map = deidentify_fields(args.filename, args.column)
-    write_mapping_file(args.mapfile, id_map)
+    row_filter = rowfilter.from_arguments(parser, args)
+    checkpoint.check_arguments(parser, args)
+    if not (args.mapfile or args.store):
+        parser.error("a mapping file (-m) or an identifier store (-s) is required")
+    with instrumentation.profiled(args.cprofile, args.cprofile_output):
+        options = (args.checkpoint, args.resume, args.checkpoint_interval, args.quarantine)
+        if args.store:
+            if args.checkpoint:
+                # New mappings are only written to the store just before a checkpoint, so that the rows after
+                # the checkpoint are the only ones whose new mappings can be lost, and they are masked again on resume
+                store = IdentifierStore(args.store, args.cache_size, batch_size=sys.maxsize, mapfile=args.mapfile)
+                before_save = store.flush
+            else:
+                store = IdentifierStore(args.store, args.cache_size, mapfile=args.mapfile)
+                before_save = None
+            try:
+                deidentify_fields(args.filename, args.column, store, args.output, row_filter, *options, before_save)
+            except BaseException:
+                if args.checkpoint:
+                    store.rollback()
+                raise
+            finally:
+                store.close()
+            if (args.verbose):
+                sys.stderr.write(f"New identifiers: {store.added}; cache hits: {store.hits}; store lookups: {store.lookups}\n")
+        else:
+            masker = MemoryMasker(args.column)
+            deidentify_fields(args.filename, args.column, masker, args.output, row_filter, *options)
+            write_mapping_file(args.mapfile, masker.id_map)
@@ -3,65 +3,163 @@
 import sys
 import io
 import csv
-import json
 import argparse
+import collections
+import multiprocessing
+import csvchunks
+from csvreader import column_index
+import compressed
+import checkpoint
+from jsonfields import FieldExtractor
+from decodecache import DecodeCache
+import decodecache
+import instrumentation
+import rowfilter
 
 parser = argparse.ArgumentParser(description="Extract fields from a JSON column of a CSV file into their own columns",
-                                 epilog="The modified CSV file (with JSON field removed and expanded columns included at the end) is sent to standard output.")
+                                 epilog="The modified CSV file (with JSON field removed and expanded columns included at the end) is sent to standard output unless --output is given.")
 parser.add_argument("filename", help="CSV file")
 parser.add_argument("-c", "--column", default="parameters", help="Heading of the column containing JSON data (default: 'parameters')")
 parser.add_argument("-f", "--field", required=True, action='append', help="Field(s) to extract. Nested fields should be named with dots separating the levels. " +
           "This argument can be repeated to extract multiple fields.")
+parser.add_argument("-o", "--output", help="Path to the expanded CSV file")
+parser.add_argument("-j", "--jobs", default=1, type=int, help="Number of worker processes; the file is split into chunks that are expanded in parallel (default: 1)")
 parser.add_argument("-v", "--verbose", action="store_true", help="Print progress information while running")
+rowfilter.add_arguments(parser)
+checkpoint.add_arguments(parser)
+decodecache.add_arguments(parser)
+instrumentation.add_arguments(parser)
 
 # Some log files have very long data in the columns
 csv.field_size_limit(10000000)
 
-# Get a field (provided as a list of keys) from a JSON object
-def get_from_json(data, field):
-  for component in field:
-    if component in data:
-      data = data[component]
-    else:
-      return None
-  return data
+# Extract the fields from JSON text through a cache, since the same cells are often repeated
+def field_cache(fields, cache_size, cache_mb):
+  extractor = FieldExtractor(fields)
+  return DecodeCache(lambda json_data: tuple(extractor.extract(json_data)), cache_size, cache_mb)
+
+# Remove the JSON column from a row and append the values of the fields.
+# The row is left as it was if the JSON cannot be decoded.
+def expand_row(row, param_index, cache, width):
+  json_data = row[param_index]
+  if (json_data):
+    values = cache.get(json_data)
+  else:
+    values = [None] * width
+  del row[param_index]
+  row.extend(values)
+  return row
 
-def process_file(filename, json_column, fields):
-  # Split fields on periods to make a list of components
-  field_components = [f.split(".") for f in fields]
+# Return the index of the JSON column and the output header
+def expanded_header(header, json_column, fields):
+  param_index = column_index(header, json_column)
+  # Remove the JSON column from the header and add columns for the new fields
+  header = header[:param_index] + header[param_index + 1:]
+  for f in fields:
+    header.append(f)
+  return header, param_index
+
+def process_file(filename, json_column, fields, output=None, row_filter=None, checkpoint_path=None, resume=False,
+                 interval=checkpoint.CHECKPOINT_INTERVAL, quarantine_path=None,
+                 cache_size=decodecache.DEFAULT_ENTRIES, cache_mb=decodecache.DEFAULT_MB):
+  cache = field_cache(fields, cache_size, cache_mb)
+  config = {"script": "expand-json-fields", "column": json_column, "fields": fields}
   # Read file line-by-line as a CSV
+  with checkpoint.Run(filename, output, config, row_filter, checkpoint_path, resume, interval, quarantine_path) as run:
+      header, param_index = expanded_header(run.header, json_column, fields)
+      writer = csv.writer(run.out, lineterminator='\n')
+      if not run.resumed:
+        writer.writerow(header)
+
+      progress = instrumentation.Progress(run.file, args.verbose, args.summary)
+      expand = progress.timed("decode", expand_row)
+      write_row = progress.timed("write", writer.writerow)
+      for row in progress.track(run.rows()):
+        try:
+          expanded = expand(row, param_index, cache, len(fields))
+        except (ValueError, IndexError) as error:
+          run.quarantine(row, error)
+          continue
+        write_row(expanded)
+        if run.due():
+          run.save()
+      progress.finish(decode_cache=cache.summary())
+  if (args.verbose):
+    sys.stderr.write(cache.stats() + "\n")
+
+# Expand the rows in one byte range of the file, returning the CSV text of the output rows and the cache counts
+def process_chunk(task):
+  filename, start, end, param_index, fields, cache_size, cache_mb, row_filter = task
+  cache = field_cache(fields, cache_size, cache_mb)
+  # Decode the bytes as they are parsed rather than keeping a decoded copy of the whole chunk
+  data = io.TextIOWrapper(io.BytesIO(csvchunks.read_range(filename, start, end)), encoding="utf-8", newline=None)
+  output = io.StringIO()
+  writer = csv.writer(output, lineterminator='\n')
+  rows = 0
+  for row in csv.reader(data):
+    rows += 1
+    if row_filter is None or row_filter.matches(row):
+      writer.writerow(expand_row(row, param_index, cache, len(fields)))
+  return rows, output.getvalue(), cache.hits, cache.misses
+
+def process_file_parallel(filename, json_column, fields, jobs, output=None, row_filter=None,
+                          cache_size=decodecache.DEFAULT_ENTRIES, cache_mb=decodecache.DEFAULT_MB):
+  # Each chunk has its own cache; this one only adds up their counts
+  cache = DecodeCache(None)
   with open(filename, encoding="utf-8", mode="r") as file:
-      csv_reader = csv.reader(file)
-      writer = csv.writer(io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8'), lineterminator='\n')
-      # Get the header
-      header = next(csv_reader)
-      try:
-        param_index = header.index(json_column)
-      except ValueError:
-        sys.stderr.write("Error: Could not find " + json_column + " column; columns are: " + ", ".join(header))
-        exit(1)
-      # Remove the JSON column from the header and add columns for the new fields
-      header.remove(json_column)
-      for f in fields:
-        header.append(f)
-      writer.writerow(header)
+    header = next(csv.reader(file))
+  if row_filter is not None:
+    row_filter.setup(header)
+  header, param_index = expanded_header(header, json_column, fields)
+  # Use several chunks per worker so that the workers stay busy until the end
+  header_size, ranges = csvchunks.split_file(filename, jobs * 4)
+  if (args.verbose):
+    sys.stderr.write(f"Expanding {len(ranges)} chunks with {jobs} processes\n")
+  out = compressed.open_output(output)
+  writer = csv.writer(out, lineterminator='\n')
+  writer.writerow(header)
+  tasks = [(filename, start, end, param_index, fields, cache_size, cache_mb, row_filter) for start, end in ranges]
+  progress = instrumentation.Progress(None, args.verbose, args.summary)
+  progress.total_bytes = ranges[-1][1] if ranges else None
+  write = progress.timed("write", out.write)
+  with multiprocessing.Pool(jobs) as pool:
+    # Only a few chunks are queued per worker, so that the results waiting to be written do not fill memory
+    # if writing is slower than expanding; they are written in the original order of the chunks
+    waiting = collections.deque()
 
-      rows = 0
-      for row in csv_reader:
-        rows += 1
-        if (args.verbose and rows % 1000 == 0):
-          sys.stderr.write(f"Processed {rows} rows\n")
-        json_data = row[param_index]
-        row.pop(param_index)
-        if (json_data):
-          data = json.loads(json_data)
-          for field in field_components:
-            row.append(get_from_json(data, field))
-        else:
-          for field in field_components:
-            row.append(None)
-        writer.writerow(row)
+    def write_next():
+      result, end = waiting.popleft()
+      chunk_rows, text, hits, misses = result.get()
+      write(text)
+      cache.add_counts(hits, misses)
+      progress.update(chunk_rows, end)
+
+    for task in tasks:
+      waiting.append((pool.apply_async(process_chunk, (task,)), task[2]))
+      if len(waiting) > jobs * 2:
+        write_next()
+    while waiting:
+      write_next()
+  out.close()
+  # Time spent waiting for the workers is counted as "other"
+  progress.finish(jobs=jobs, chunks=len(ranges), decode_cache=cache.summary())
+  if (args.verbose):
+    sys.stderr.write(cache.stats() + "\n")
 
 if __name__ == '__main__':
   args = parser.parse_args()
-  process_file(args.filename, args.column, args.field)
+  row_filter = rowfilter.from_arguments(parser, args)
+  checkpoint.check_arguments(parser, args)
+  if args.jobs > 1 and (args.checkpoint or args.quarantine):
+    parser.error("--checkpoint and --quarantine need a single process (-j 1)")
+  with instrumentation.profiled(args.cprofile, args.cprofile_output):
+    if args.jobs > 1 and compressed.compression(args.filename):
+      # The byte ranges of the chunks are offsets in the uncompressed file, which cannot be read directly
+      sys.stderr.write("Compressed input files are expanded by a single process\n")
+    if args.jobs > 1 and not compressed.compression(args.filename):
+      process_file_parallel(args.filename, args.column, args.field, args.jobs, args.output, row_filter,
+                            args.decode_cache, args.decode_cache_mb)
+    else:
+      process_file(args.filename, args.column, args.field, args.output, row_filter,
+                   args.checkpoint, args.resume, args.checkpoint_interval, args.quarantine,
+                   args.decode_cache, args.decode_cache_mb)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# A set of 64-bit fingerprints of rows, for finding duplicate rows in files too big to keep the rows themselves.
+#
+# A row (or the values of its key columns) is fingerprinted with an 8-byte BLAKE2 hash.  The fingerprints
+# are kept in sorted numpy arrays of uint64, so the set costs 8 bytes per distinct row (plus some room for
+# merging): 100 million rows take under 1 GB.  Two different rows have the same fingerprint with a probability
+# of about n^2 / 2^65 for n rows, ie roughly once in 3,000 runs of 100 million rows.
+#
+# New fingerprints go into a small Python set first.  When it fills up it becomes a sorted array (a "run"), and
+# runs of a similar size are merged, so there are only a few runs to search (as in a log-structured merge tree).
+# Fingerprints can be checked one at a time (add), or a batch at a time with numpy (add_array), which is much faster.
+
+import os
+import hashlib
+import numpy as np
+
+# Fingerprints kept in the Python set before it is sorted into an array
+BUFFER_SIZE = 1 << 18
+# A run is merged into the one before it once that one is less than this many times bigger
+MERGE_FACTOR = 4
+SEPARATOR = "\x1f"
+
+def fingerprint(data):
+  return hashlib.blake2b(data, digest_size=8).digest()
+
+# Fingerprint of the values of some columns.  Values that are not strings (eg from an expand stage) are taken
+# as csv.writer would write them, so that a row has the same fingerprint before and after it is written and read back.
+def values_fingerprint(values):
+  return fingerprint(SEPARATOR.join(value if isinstance(value, str) else ("" if value is None else str(value))
+                                    for value in values).encode("utf-8"))
+
+# Fingerprints as returned by fingerprint(), joined together, as an array
+def fingerprint_array(data):
+  return np.frombuffer(data, dtype="<u8")
+
+class FingerprintSet:
+  def __init__(self, buffer_size=BUFFER_SIZE):
+    self.buffer_size = buffer_size
+    self.buffer = set()
+    self.runs = []
+
+  def __len__(self):
+    return len(self.buffer) + sum(len(run) for run in self.runs)
+
+  # Approximate memory used, in bytes
+  def nbytes(self):
+    return sum(run.nbytes for run in self.runs) + len(self.buffer) * 64
+
+  # Check a fingerprint given as an integer
+  def __contains__(self, value):
+    if value in self.buffer:
+      return True
+    value = np.uint64(value)
+    for run in self.runs:
+      index = run.searchsorted(value)
+      if index < len(run) and run[index] == value:
+        return True
+    return False
+
+  # Add a fingerprint as returned by fingerprint(); returns True if it was not in the set
+  def add(self, digest):
+    value = int.from_bytes(digest, "little")
+    if value in self:
+      return False
+    self.buffer.add(value)
+    if len(self.buffer) >= self.buffer_size:
+      self.add_run(np.array(sorted(self.buffer), dtype=np.uint64))
+      self.buffer = set()
+    return True
+
+  # Add an array of fingerprints (see fingerprint_array); returns an array of booleans that is True for the first occurrence
+  # of each fingerprint that was not in the set
+  def add_array(self, values):
+    unique, first = np.unique(values, return_index=True)
+    found = np.zeros(len(unique), dtype=bool)
+    for run in self.runs:
+      index = run.searchsorted(unique)
+      index[index == len(run)] = 0
+      found |= run[index] == unique
+    if self.buffer:
+      found |= np.array([int(value) in self.buffer for value in unique.tolist()], dtype=bool)
+    new = np.zeros(len(values), dtype=bool)
+    new[first[~found]] = True
+    if not found.all():
+      self.add_run(unique[~found])
+    return new
+
+  def add_run(self, run):
+    # Eg the fingerprints saved from an empty file
+    if len(run) == 0:
+      return
+    self.runs.append(run)
+    while len(self.runs) > 1 and len(self.runs[-2]) < MERGE_FACTOR * len(self.runs[-1]):
+      last = self.runs.pop()
+      merged = np.concatenate([self.runs.pop(), last])
+      merged.sort()
+      self.runs.append(merged)
+
+  # All of the fingerprints, sorted
+  def array(self):
+    arrays = self.runs + [np.array(sorted(self.buffer), dtype=np.uint64)]
+    return np.sort(np.concatenate(arrays))
+
+  # Add the fingerprints saved by save()
+  def load(self, path):
+    with open(path, mode="rb") as file:
+      self.add_run(np.load(file))
+
+  # Save the fingerprints, writing a temporary file first so that an interrupted run never leaves half of one
+  def save(self, path):
+    temporary = path + ".tmp"
+    with open(temporary, mode="wb") as file:
+      np.save(file, self.array())
+    os.replace(temporary, path)
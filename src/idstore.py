@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# Persistent store of original identifier -> masked identifier mappings, kept in an SQLite file.
+#
+# Lookups go to a bounded in-memory LRU cache first, then to the database.  Identifiers that are not
+# in the store yet are masked with a short uuid and written to the database in batches, so re-running
+# over overlapping exports only does the hashing for identifiers that have never been seen before,
+# and memory stays flat no matter how many identifiers the store holds.
+#
+# With a mapping file, each batch of new mappings is appended to it before the batch is committed to the
+# database, so every identifier in the store is also in the mapping file, even if a run is interrupted.
+# (A run killed between the two can leave some rows in the mapping file twice, which is harmless.)
+
+import collections
+import csv
+import sqlite3
+import shortuuid
+
+class IdentifierStore:
+  def __init__(self, path, cache_size=1000000, batch_size=10000, mapfile=None):
+    self.connection = sqlite3.connect(path)
+    self.connection.execute("CREATE TABLE IF NOT EXISTS mapping "
+                            + "(column TEXT NOT NULL, original TEXT NOT NULL, masked TEXT NOT NULL, "
+                            + "PRIMARY KEY (column, original)) WITHOUT ROWID")
+    self.cache = collections.OrderedDict()
+    self.cache_size = cache_size
+    self.batch_size = batch_size
+    self.mapfile = mapfile
+    # New mappings that have not been written to the database yet, in the order they were found
+    self.pending = {}
+    # Number of new mappings written during this run
+    self.added = 0
+    self.hits = 0
+    self.lookups = 0
+
+  def mask(self, column, original):
+    key = (column, original)
+    masked = self.cache.get(key)
+    if masked is not None:
+      self.hits += 1
+      self.cache.move_to_end(key)
+      return masked
+    masked = self.pending.get(key)
+    if masked is None:
+      self.lookups += 1
+      result = self.connection.execute("SELECT masked FROM mapping WHERE column = ? AND original = ?", key).fetchone()
+      if result:
+        masked = result[0]
+      else:
+        masked = shortuuid.uuid(name=original)
+        self.pending[key] = masked
+        if len(self.pending) >= self.batch_size:
+          self.flush()
+    self.cache[key] = masked
+    if len(self.cache) > self.cache_size:
+      self.cache.popitem(last=False)
+    return masked
+
+  def flush(self):
+    if self.pending:
+      if self.mapfile:
+        append_mapping_file(self.mapfile, [(original, masked, column) for (column, original), masked in self.pending.items()])
+      self.connection.executemany("INSERT OR IGNORE INTO mapping (column, original, masked) VALUES (?, ?, ?)",
+                                  [(column, original, masked) for (column, original), masked in self.pending.items()])
+      self.added += len(self.pending)
+      self.pending = {}
+    self.connection.commit()
+
+  # Forget the mappings that have not been written to the database, eg when a run stops before its next checkpoint
+  def rollback(self):
+    for key in self.pending:
+      self.cache.pop(key, None)
+    self.pending = {}
+    self.connection.rollback()
+
+  # All mappings in the store, as (original, masked, column) rows
+  def mappings(self):
+    self.flush()
+    return self.connection.execute("SELECT original, masked, column FROM mapping ORDER BY column, original")
+
+  def close(self):
+    self.flush()
+    self.connection.close()
+
+# Append (original, masked, column) rows to a mapping CSV file, writing the header if the file is new
+def append_mapping_file(filename, rows):
+  with open(filename, encoding="utf-8", mode="a") as file:
+    writer = csv.writer(file, lineterminator='\n')
+    if file.tell() == 0:
+      writer.writerow(['original_identifier','masked_identifier','column'])
+    writer.writerows(rows)
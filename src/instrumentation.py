@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# Progress reporting and run statistics shared by the scripts.
+#
+# A Progress object wraps the CSV reader of a script and counts its rows.  In verbose mode it reports
+# the rows/s and MB/s so far and an estimate of the time left (from the position in the input file),
+# at most once every REPORT_INTERVAL seconds, and a summary at the end.
+#
+# When timing is on (in verbose mode, or when a --summary file is requested), the time spent reading and
+# parsing the CSV is counted as the "parse" stage, and functions wrapped with timed() count towards their
+# own stages (eg "decode", "transform", "write"); whatever is left is reported as "other".
+
+import os
+import sys
+import time
+import json
+import pstats
+import cProfile
+import contextlib
+try:
+  import resource
+except ImportError:
+  # Not available on Windows
+  resource = None
+
+REPORT_INTERVAL = 5.0
+
+def add_arguments(parser):
+  parser.add_argument("--summary", metavar="PATH",
+                      help="Write a JSON summary of the run (rows, rates, time per stage, peak memory) to this file")
+  parser.add_argument("--cprofile", action="store_true",
+                      help="Profile the run with cProfile and print the functions that take the most time")
+  parser.add_argument("--cprofile-output", metavar="PATH", help="With --cprofile, also save the full profile to this file")
+
+# Peak resident memory of this process in MB, or None where it cannot be measured
+def peak_memory_mb():
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # ru_maxrss is in KB on Linux and in bytes on macOS
+  return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def format_duration(seconds):
+  minutes, seconds = divmod(int(seconds), 60)
+  hours, minutes = divmod(minutes, 60)
+  return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+class Progress:
+  def __init__(self, file=None, verbose=False, summary=None):
+    self.file = file
+    self.verbose = verbose
+    self.summary = summary
+    self.timing = verbose or summary is not None
+    self.total_bytes = os.fstat(file.fileno()).st_size if file is not None else None
+    # Position in the input, for scripts that do not read through self.file
+    self.offset = None
+    self.rows = 0
+    self.stages = {}
+    # The generator returned by track(), which adds its parse time when it is closed
+    self.tracked = None
+    self.start = time.perf_counter()
+    self.next_report = self.start + REPORT_INTERVAL
+
+  # Iterate over the rows of a reader, counting them (and timing the parsing when timing is on)
+  def track(self, rows):
+    if self.timing:
+      self.tracked = self.timed_rows(rows)
+      return self.tracked
+    return self.read_rows(rows)
+
+  def read_rows(self, rows):
+    for row in rows:
+      self.rows += 1
+      yield row
+
+  def timed_rows(self, rows):
+    clock = time.perf_counter
+    rows = iter(rows)
+    parse = 0.0
+    try:
+      while True:
+        start = clock()
+        try:
+          row = next(rows)
+        except StopIteration:
+          break
+        now = clock()
+        parse += now - start
+        self.rows += 1
+        if now >= self.next_report:
+          self.report(now)
+        yield row
+    finally:
+      self.stages["parse"] = self.stages.get("parse", 0.0) + parse
+
+  # Return a version of function that adds the time it takes to a stage.  Timed functions should not call each other.
+  def timed(self, stage, function):
+    if not self.timing:
+      return function
+    clock = time.perf_counter
+    stages = self.stages
+    stages.setdefault(stage, 0.0)
+
+    def timed_function(*args):
+      start = clock()
+      try:
+        return function(*args)
+      finally:
+        stages[stage] += clock() - start
+    return timed_function
+
+  # For scripts that process the file in pieces: add rows done and the input position reached
+  def update(self, rows, offset=None):
+    self.rows += rows
+    if offset is not None:
+      self.offset = offset
+    now = time.perf_counter()
+    if self.timing and now >= self.next_report:
+      self.report(now)
+
+  def position(self):
+    if self.offset is not None:
+      return self.offset
+    try:
+      # The underlying binary file can report its position while the text file is being iterated
+      return self.file.buffer.tell()
+    except AttributeError:
+      pass
+    except (OSError, ValueError):
+      return None
+    try:
+      # Binary files and csvreader.ColumnReader
+      return self.file.tell()
+    except (AttributeError, OSError, ValueError):
+      return None
+
+  def report(self, now):
+    self.next_report = now + REPORT_INTERVAL
+    if not self.verbose:
+      return
+    elapsed = max(now - self.start, 1e-9)
+    message = f"Processed {self.rows:,} rows in {format_duration(elapsed)}, {self.rows / elapsed:,.0f} rows/s"
+    position = self.position()
+    if position:
+      message += f", {position / elapsed / 1e6:.1f} MB/s"
+      if self.total_bytes:
+        fraction = min(position / self.total_bytes, 1)
+        message += f", {fraction:.0%} of the file"
+        if 0 < fraction < 1:
+          message += f", about {format_duration(elapsed * (1 - fraction) / fraction)} left"
+    sys.stderr.write(message + "\n")
+
+  # Print the final statistics in verbose mode and write the summary file; extra values are included in the summary
+  def finish(self, **extra):
+    if self.tracked is not None:
+      # A script that stops reading early leaves the generator open; closing it counts its parse time
+      self.tracked.close()
+    elapsed = max(time.perf_counter() - self.start, 1e-9)
+    position = self.position() or self.total_bytes
+    # Reading comes first and everything else last; the other stages are in the order they were added
+    order = ["parse"] + [stage for stage in self.stages if stage != "parse"]
+    stages = {stage: round(self.stages[stage], 3) for stage in order if self.timing and stage in self.stages}
+    if stages:
+      stages["other"] = round(max(elapsed - sum(self.stages.values()), 0), 3)
+    peak = peak_memory_mb()
+    result = {"script": os.path.basename(sys.argv[0]), "rows": self.rows, "bytes": position, "seconds": round(elapsed, 3),
+              "rows_per_second": round(self.rows / elapsed, 1),
+              "bytes_per_second": round(position / elapsed, 1) if position else None,
+              "stages": stages, "peak_memory_mb": round(peak, 1) if peak is not None else None, **extra}
+    if self.verbose:
+      message = f"Processed {self.rows:,} rows in {format_duration(elapsed)}, {self.rows / elapsed:,.0f} rows/s"
+      if position:
+        message += f", {position / elapsed / 1e6:.1f} MB/s"
+      if peak is not None:
+        message += f"; peak memory {peak:.0f} MB"
+      sys.stderr.write(message + "\n")
+      if stages:
+        sys.stderr.write("Time: " + ", ".join(f"{stage} {seconds:.1f}s ({seconds / elapsed:.0%})"
+                                              for stage, seconds in stages.items()) + "\n")
+    if self.summary:
+      with open(self.summary, encoding="utf-8", mode="w") as file:
+        json.dump(result, file, indent=2)
+        file.write("\n")
+    return result
+
+# Run the body of a with statement under cProfile if enabled, optionally saving the profile to a file
+@contextlib.contextmanager
+def profiled(enabled, path=None):
+  if not enabled:
+    yield
+    return
+  profiler = cProfile.Profile()
+  profiler.enable()
+  try:
+    yield
+  finally:
+    profiler.disable()
+    stats = pstats.Stats(profiler, stream=sys.stderr)
+    stats.sort_stats("tottime").print_stats(20)
+    if path:
+      profiler.dump_stats(path)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+# Extract a set of fields from JSON text without decoding the whole document.
+#
+# Large cells are read one top-level key at a time: only the values that lead to a requested
+# field are kept, and the walk stops as soon as every requested top-level key has been found
+# (or none of the missing ones appear in the rest of the text).  Everything after that point,
+# eg a huge serializedObject or documentChanges value, is never decoded.
+#
+# Values that are passed over are still read by the json module's C decoder, because it is
+# faster than any scanner written in Python: skipping strings and brackets with regular expressions
+# took 3-4 times as long as decoding on serializedObject values, whose text is full of escaped quotes.  Log JSON never repeats a key, so the first
+# occurrence of a key is used (json.loads would keep the last one).
+#
+# If the text is not a JSON object, or it is malformed before the walk stops, the whole cell
+# is decoded with json.loads instead.
+#
+# Fields are dot-separated paths.  The paths are compiled once into a trie, so that fields with a
+# shared prefix (eg sourceTile.id and sourceTile.type) are found in a single walk of each value.
+# A numeric component indexes into an array (args.0.text), and a `*` component matches every
+# element of an array or every value of an object (sharedTiles.*.id); fields with a `*` give a
+# list of all the values found.
+
+import json
+
+_decoder = json.JSONDecoder()
+_scanstring = json.decoder.scanstring
+_whitespace = json.decoder.WHITESPACE.match
+
+# Cells shorter than this are decoded in one go, which is faster than walking their keys
+MIN_SCAN_LENGTH = 4096
+# Search the rest of the text for the missing top-level keys once there are this few of them
+MAX_FIND_KEYS = 3
+
+class ScanError(ValueError):
+  pass
+
+WILDCARD = "*"
+
+class _Node:
+  def __init__(self):
+    self.children = {}
+    # Indexes of the requested fields that end at this node
+    self.fields = []
+
+  # Split the children into named ones and the wildcard, once all fields have been added
+  def compile(self):
+    self.named = {key: child for key, child in self.children.items() if key != WILDCARD}
+    self.wildcard = self.children.get(WILDCARD)
+    for child in self.children.values():
+      child.compile()
+
+# Follow a path of keys (or array indexes) through decoded JSON, returning None if it is not there
+def _lookup(data, path):
+  for key in path:
+    if isinstance(data, dict):
+      if key not in data:
+        return None
+      data = data[key]
+    elif isinstance(data, list) and key.isdigit() and int(key) < len(data):
+      data = data[int(key)]
+    else:
+      return None
+  return data
+
+class FieldExtractor:
+  def __init__(self, fields):
+    self.fields = fields
+    self.root = _Node()
+    for index, field in enumerate(fields):
+      node = self.root
+      for component in field.split("."):
+        node = node.children.setdefault(component, _Node())
+      node.fields.append(index)
+    self.root.compile()
+    # Without wildcards, each field is a single path, which is quicker to follow than walking the trie
+    if any(WILDCARD in field.split(".") for field in fields):
+      self.paths = None
+    else:
+      self.paths = [field.split(".") for field in fields]
+    # A key can only be searched for in the raw text if JSON writes it without escapes
+    self.needles = {}
+    for key in self.root.children:
+      if json.dumps(key) == '"' + key + '"':
+        self.needles[key] = '"' + key + '"'
+
+  # Return a list with the value of each field (None for missing fields)
+  def extract(self, json_text):
+    if len(json_text) < MIN_SCAN_LENGTH or WILDCARD in self.root.children:
+      return self.extract_data(json.loads(json_text))
+    values = [None] * len(self.fields)
+    try:
+      idx = _whitespace(json_text, 0).end()
+      if json_text[idx] != '{':
+        raise ScanError("not an object")
+      end = self._scan_object(json_text, idx, self.root, values, dict.fromkeys(self.root.children))
+      if end is not None and _whitespace(json_text, end).end() != len(json_text):
+        raise ScanError("extra data")
+    except (ScanError, IndexError, ValueError):
+      return self.extract_data(json.loads(json_text))
+    return values
+
+  # Same as extract, for JSON that has already been decoded
+  def extract_data(self, data):
+    if self.paths is not None:
+      return [_lookup(data, path) for path in self.paths]
+    values = [None] * len(self.fields)
+    self._fill(data, self.root, values, False)
+    return values
+
+  # Store the values of all of the fields below a node, given the data at that node.
+  # Below a wildcard (`collect`), values are added to a list instead.
+  def _fill(self, data, node, values, collect):
+    for index in node.fields:
+      if not collect:
+        values[index] = data
+      elif values[index] is None:
+        values[index] = [data]
+      else:
+        values[index].append(data)
+    if not node.children:
+      return
+    named = node.named
+    if isinstance(data, dict):
+      if len(data) < len(named):
+        for key, value in data.items():
+          child = named.get(key)
+          if child is not None:
+            self._fill(value, child, values, collect)
+      else:
+        for key, child in named.items():
+          if key in data:
+            self._fill(data[key], child, values, collect)
+      items = data.values()
+    elif isinstance(data, list):
+      for key, child in named.items():
+        if key.isdigit() and int(key) < len(data):
+          self._fill(data[int(key)], child, values, collect)
+      items = data
+    else:
+      return
+    if node.wildcard is not None:
+      for item in items:
+        self._fill(item, node.wildcard, values, True)
+
+  # Walk the object starting at idx and return the index just past it.
+  # At the top level, `remaining` maps each requested key that has not been seen yet to the position
+  # of its next possible occurrence (-1 if there is none); the walk stops early (returning None)
+  # once all of them have been seen or cannot occur any more.
+  def _scan_object(self, text, idx, node, values, remaining=None):
+    idx = _whitespace(text, idx + 1).end()
+    if text[idx] == '}':
+      return idx + 1
+    while True:
+      if text[idx] != '"':
+        raise ScanError("expected a key")
+      key, idx = _scanstring(text, idx + 1)
+      idx = _whitespace(text, idx).end()
+      if text[idx] != ':':
+        raise ScanError("expected ':'")
+      idx = _whitespace(text, idx + 1).end()
+      child = node.children.get(key)
+      if child is None:
+        idx = _decoder.raw_decode(text, idx)[1]
+      elif child.fields or text[idx] != '{' or child.wildcard is not None:
+        # Decode this value and take the requested fields from it
+        value, idx = _decoder.raw_decode(text, idx)
+        self._fill(value, child, values, False)
+      else:
+        idx = self._scan_object(text, idx, child, values)
+      if remaining is not None:
+        remaining.pop(key, None)
+        if not remaining or (len(remaining) <= MAX_FIND_KEYS and self._missing(text, idx, remaining)):
+          return None
+      idx = _whitespace(text, idx).end()
+      if text[idx] == ',':
+        idx = _whitespace(text, idx + 1).end()
+      elif text[idx] == '}':
+        return idx + 1
+      else:
+        raise ScanError("expected ',' or '}'")
+
+  # Check whether none of the remaining keys occur anywhere after idx
+  def _missing(self, text, idx, remaining):
+    for key, position in remaining.items():
+      if position == -1:
+        continue
+      if key not in self.needles or (position is not None and position >= idx):
+        return False
+      position = text.find(self.needles[key], idx)
+      remaining[key] = position
+      if position != -1:
+        return False
+    return True
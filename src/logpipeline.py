@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+# Streaming row transforms that chain the processing steps of this repository
+# (csvgrep filter, expand-json-fields, deidentify-columns, process-teacher-column)
+# in a single process: the input is read once and the output is written once.
+#
+# A recipe is a list of stage configurations, eg
+#   [{"stage": "filter", "column": "application", "match": "CLUE"},
+#    {"stage": "expand", "column": "parameters", "fields": ["tileId", "documentKey"]}]
+#
+# Filter stages at the start of a recipe are applied while the input is read (see rowfilter.py),
+# so rows that they remove are mostly never parsed.
+
+import sys
+import csv
+import json
+import shortuuid
+from jsonfields import FieldExtractor
+from decodecache import DecodeCache
+import decodecache
+from idstore import IdentifierStore
+from teachers import TeacherParser
+from fingerprints import FingerprintSet, values_fingerprint
+from csvreader import column_index
+from rowfilter import Predicate, RowFilter, open_rows
+import compressed
+import instrumentation
+
+# Some log files have very long data in the columns
+csv.field_size_limit(10000000)
+
+# Keep only rows where a column contains the given text (`match`, the same as `csvgrep -c column -m match`),
+# or where it equals one of a list of values (`equals`) or matches a regular expression (`matches`)
+class FilterStage:
+  def __init__(self, column, match=None, equals=None, matches=None):
+    if [match, equals, matches].count(None) != 2:
+      sys.stderr.write("Error: A filter stage needs one of match, equals or matches\n")
+      exit(1)
+    self.column = column
+    if match is not None:
+      self.predicate = Predicate(column, "contains", match)
+    elif equals is not None:
+      self.predicate = Predicate(column, "equals", equals)
+    else:
+      self.predicate = Predicate(column, "matches", matches)
+
+  def setup(self, header):
+    self.index = self.predicate.setup(header)
+    return header
+
+  def process(self, row):
+    if self.predicate.test(row[self.index]):
+      return row
+    return None
+
+  def finish(self, verbose):
+    pass
+
+# Replace a JSON column with one column per requested field (same as expand-json-fields.py)
+class ExpandStage:
+  def __init__(self, column, fields, decode_cache=decodecache.DEFAULT_ENTRIES, decode_cache_mb=decodecache.DEFAULT_MB):
+    self.column = column
+    self.fields = fields
+    extractor = FieldExtractor(fields)
+    # Repeated cells (eg the extras of one session) are only decoded once
+    self.cache = DecodeCache(lambda json_data: tuple(extractor.extract(json_data)), decode_cache, decode_cache_mb)
+
+  def setup(self, header):
+    self.index = column_index(header, self.column)
+    header = header[:self.index] + header[self.index + 1:]
+    return header + self.fields
+
+  def process(self, row):
+    json_data = row.pop(self.index)
+    if (json_data):
+      row.extend(self.cache.get(json_data))
+    else:
+      row.extend([None] * len(self.fields))
+    return row
+
+  def finish(self, verbose):
+    if (verbose):
+      sys.stderr.write(f"{self.column}: {self.cache.stats()}\n")
+
+# Mask the values of some columns with short uuids (same as deidentify-columns.py)
+class DeidentifyStage:
+  def __init__(self, columns, mapfile=None, store=None, cache_size=1000000):
+    self.columns = columns
+    self.mapfile = mapfile
+    # With a persistent store, mappings are shared across runs and only new ones are appended to mapfile
+    self.store = IdentifierStore(store, cache_size, mapfile=mapfile) if store else None
+    self.id_map = {col: {} for col in columns}
+
+  def setup(self, header):
+    self.col_indexes = [(column_index(header, col), col, self.id_map[col]) for col in self.columns]
+    return header
+
+  def process(self, row):
+    for col_index, col, mapping in self.col_indexes:
+      data = row[col_index]
+      if (data):
+        if self.store:
+          row[col_index] = self.store.mask(col, data)
+          continue
+        mask = mapping.get(data)
+        if mask is None:
+          mask = shortuuid.uuid(name=data)
+          mapping[data] = mask
+        row[col_index] = mask
+    return row
+
+  def finish(self, verbose):
+    if self.store:
+      self.store.close()
+      if (verbose):
+        sys.stderr.write(f"New identifiers: {self.store.added}; cache hits: {self.store.hits}; store lookups: {self.store.lookups}\n")
+      return
+    if (verbose):
+      sys.stderr.write(f"Writing {self.mapfile}\n")
+    with open(self.mapfile, encoding="utf-8", mode="w") as file:
+      writer = csv.writer(file, lineterminator='\n')
+      writer.writerow(['original_identifier','masked_identifier','column'])
+      for column, mapping in self.id_map.items():
+        for identifier, mask in mapping.items():
+          writer.writerow([identifier, mask, column])
+
+# Drop rows that have been seen before, comparing whole rows or only some key columns (same as remove-duplicates.py)
+class DedupeStage:
+  def __init__(self, columns=None, seen=None):
+    self.columns = columns
+    self.seen_path = seen
+    self.seen = FingerprintSet()
+    if seen:
+      try:
+        self.seen.load(seen)
+      except FileNotFoundError:
+        pass
+    self.removed = 0
+
+  def setup(self, header):
+    self.indexes = [column_index(header, col) for col in self.columns] if self.columns else None
+    return header
+
+  def process(self, row):
+    values = [row[index] for index in self.indexes] if self.indexes is not None else row
+    if self.seen.add(values_fingerprint(values)):
+      return row
+    self.removed += 1
+    return None
+
+  def finish(self, verbose):
+    if self.seen_path:
+      self.seen.save(self.seen_path)
+    if (verbose):
+      sys.stderr.write(f"Duplicate rows removed: {self.removed}; fingerprints: {len(self.seen)}\n")
+
+# Replace the teachers column with the primary teacher's user id (same as process-teacher-column.py)
+class TeacherStage:
+  def __init__(self, mapfile, cache_size=100000):
+    self.mapfile = mapfile
+    self.parser = TeacherParser(cache_size)
+
+  def setup(self, header):
+    self.index = column_index(header, 'teachers')
+    return header + ['teacher']
+
+  def process(self, row):
+    # Cells without a teacher id are blanked so that no names are left
+    mask = self.parser.primary_id(row[self.index])
+    row[self.index] = mask
+    row.append(mask)
+    return row
+
+  def finish(self, verbose):
+    if (verbose):
+      sys.stderr.write(self.parser.stats() + "\n")
+      sys.stderr.write(f"Writing {self.mapfile}\n")
+    if self.parser.warning():
+      sys.stderr.write(self.parser.warning() + "\n")
+    with open(self.mapfile, encoding="utf-8", mode="w") as file:
+      writer = csv.writer(file, lineterminator='\n')
+      writer.writerow(['teacher_name','id'])
+      for identifier, mask in self.parser.id_map.items():
+        writer.writerow([identifier, mask])
+
+STAGES = {
+  "filter": FilterStage,
+  "expand": ExpandStage,
+  "deidentify": DeidentifyStage,
+  "teacher": TeacherStage,
+  "dedupe": DedupeStage,
+}
+
+def build_stages(recipe):
+  stages = []
+  for config in recipe:
+    options = dict(config)
+    name = options.pop("stage")
+    if name not in STAGES:
+      sys.stderr.write("Error: Unknown stage " + name + "; stages are: " + ", ".join(STAGES) + "\n")
+      exit(1)
+    stages.append(STAGES[name](**options))
+  return stages
+
+def load_recipe(path):
+  with open(path, encoding="utf-8", mode="r") as file:
+    return json.load(file)
+
+# Name of a stage for timing, eg "expand" for an ExpandStage
+def stage_name(stage):
+  return type(stage).__name__.replace("Stage", "").lower()
+
+# Combine the filter stages at the start of a recipe, and any other conditions, into a filter for reading the input.
+# Return the filter (or None) and the remaining stages.
+def input_filter(stages, predicates=()):
+  predicates = list(predicates)
+  while stages and isinstance(stages[0], FilterStage):
+    predicates.append(stages[0].predicate)
+    stages = stages[1:]
+  return (RowFilter(predicates) if predicates else None), stages
+
+def run_pipeline(filename, stages, output=None, verbose=False, summary=None, row_filter=None):
+  row_filter, stages = input_filter(stages, row_filter.predicates if row_filter else ())
+  with open_rows(filename, row_filter) as (file, header, csv_reader):
+    out = compressed.open_output(output)
+    writer = csv.writer(out, lineterminator='\n')
+
+    for stage in stages:
+      header = stage.setup(header)
+    writer.writerow(header)
+
+    progress = instrumentation.Progress(file, verbose, summary)
+    processors = [progress.timed(stage_name(stage), stage.process) for stage in stages]
+    write_row = progress.timed("write", writer.writerow)
+    written = 0
+    for row in progress.track(csv_reader):
+      for process in processors:
+        row = process(row)
+        if row is None:
+          break
+      else:
+        write_row(row)
+        written += 1
+    out.close()
+
+    for stage in stages:
+      stage.finish(verbose)
+    if row_filter:
+      # Count the rows that the filter skipped as read
+      progress.rows += row_filter.skipped + row_filter.rejected
+      if (verbose):
+        sys.stderr.write(row_filter.stats() + "\n")
+    rows = progress.rows
+    if (verbose):
+      sys.stderr.write(f"Read {rows} rows, wrote {written} rows\n")
+    progress.finish(written=written)
+  return rows, written
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import datetime
+import multiprocessing
+import logpipeline
+import compressed
+from recipes import RECIPES
+
+parser = argparse.ArgumentParser(description="Process many raw log files with a recipe of process-file.py, skipping files that are already done",
+                                 epilog="Each input can be a file, a directory (all CSV files in it, compressed or not) or a glob pattern. "
+                                 + "A manifest in the output directory records the content hash of each input and the recipe it was "
+                                 + "processed with; a file is processed again only if its contents or the recipe have changed, "
+                                 + "or one of its output files is missing.")
+parser.add_argument("inputs", nargs="+", help="CSV files, directories or glob patterns (quote patterns so that the shell does not expand them)")
+parser.add_argument("-r", "--recipe", required=True,
+                    help="Name of a built-in recipe (" + ", ".join(RECIPES) + ") or path to a JSON file listing the stages")
+parser.add_argument("-o", "--output", required=True, help="Directory for the processed files (created if it does not exist)")
+parser.add_argument("-x", "--extension", default=".csv",
+                    help="Extension of the processed files; use .csv.gz, .csv.bz2 or .csv.xz to compress them (default: .csv)")
+parser.add_argument("-j", "--jobs", default=os.cpu_count(), type=int, help="Number of files to process at once (default: number of CPUs)")
+parser.add_argument("-m", "--manifest", help="Path to the manifest (default: manifest.json in the output directory)")
+parser.add_argument("-f", "--force", action="store_true", help="Process every file, even if it has not changed")
+parser.add_argument("-n", "--dry-run", action="store_true", help="Only list the files that would be processed")
+parser.add_argument("-v", "--verbose", action="store_true", help="Print information while running")
+
+CSV_EXTENSIONS = [".csv"] + [".csv" + extension for extension in compressed.COMPRESSION]
+HASH_BLOCK_SIZE = 1 << 20
+
+# The input files named by the arguments, in order and without duplicates
+def find_inputs(inputs):
+  files = []
+  for name in inputs:
+    if os.path.isdir(name):
+      matches = sorted(os.path.join(name, entry) for entry in os.listdir(name))
+      matches = [match for match in matches if os.path.isfile(match) and csv_stem(match) is not None]
+    elif os.path.isfile(name):
+      matches = [name]
+    else:
+      matches = sorted(match for match in glob.glob(name) if os.path.isfile(match))
+      if not matches:
+        sys.stderr.write(f"Warning: No files match {name}\n")
+    files.extend(os.path.abspath(match) for match in matches)
+  return list(dict.fromkeys(files))
+
+# File name without the .csv extension (and compression extension), or None if it is not a CSV file
+def csv_stem(filename):
+  name = os.path.basename(filename)
+  for extension in CSV_EXTENSIONS:
+    if name.lower().endswith(extension):
+      return name[:-len(extension)]
+  return None
+
+def file_hash(filename):
+  digest = hashlib.sha256()
+  with open(filename, mode="rb") as file:
+    while True:
+      block = file.read(HASH_BLOCK_SIZE)
+      if not block:
+        break
+      digest.update(block)
+  return digest.hexdigest()
+
+# Hash of the recipe, so that a file is processed again when any stage or option changes
+def recipe_hash(recipe):
+  return hashlib.sha256(json.dumps(recipe, sort_keys=True).encode("utf-8")).hexdigest()
+
+def load_manifest(path):
+  if not os.path.exists(path):
+    return {"recipes": {}, "files": {}}
+  with open(path, encoding="utf-8", mode="r") as file:
+    return json.load(file)
+
+# Write the manifest to a temporary file first, so that an interrupted run never leaves half of one
+def save_manifest(path, manifest):
+  temporary = path + ".tmp"
+  with open(temporary, encoding="utf-8", mode="w") as file:
+    json.dump(manifest, file, indent=2)
+    file.write("\n")
+  os.replace(temporary, path)
+
+# Output files for one input: the processed file, then a mapping file for each stage that writes one.
+# Each input gets its own mapping files, so that files processed at the same time do not overwrite each other's.
+def file_recipe(recipe, stem, output_dir, extension):
+  stages = []
+  outputs = [os.path.join(output_dir, stem + extension)]
+  for config in recipe:
+    config = dict(config)
+    if config.get("mapfile"):
+      config["mapfile"] = os.path.join(output_dir, f"{stem}-{os.path.basename(config['mapfile'])}")
+      outputs.append(config["mapfile"])
+    stages.append(config)
+  return stages, outputs
+
+# Hash an input, reusing the hash in the manifest if the file's size and modification time have not changed
+def hash_task(task):
+  filename, entry = task
+  stat = os.stat(filename)
+  if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+    digest = entry["sha256"]
+  else:
+    digest = file_hash(filename)
+  return filename, digest, stat.st_size, stat.st_mtime_ns
+
+# Name the processed file is written to until it is complete, with the same extension so that it is compressed the same way
+def partial_path(output):
+  return os.path.join(os.path.dirname(output), "." + os.path.basename(output))
+
+# Process one input, returning its filename, an error message (or None if it succeeded), the rows read and written and the time.
+# Errors are returned rather than raised, so that one bad file (eg one without a column that the recipe needs, which
+# exits) does not stop the other files, or leave the pool waiting for a result that never comes.
+def process_task(task):
+  filename, recipe, outputs = task
+  start = time.perf_counter()
+  partial = partial_path(outputs[0])
+  try:
+    stages = logpipeline.build_stages(recipe)
+    rows, written = logpipeline.run_pipeline(filename, stages, partial)
+    os.replace(partial, outputs[0])
+  except BaseException as error:
+    if os.path.exists(partial):
+      os.remove(partial)
+    if isinstance(error, SystemExit):
+      message = f"exited with status {error.code}"
+    else:
+      message = f"{type(error).__name__}: {error}"
+    return filename, message, 0, 0, time.perf_counter() - start
+  return filename, None, rows, written, time.perf_counter() - start
+
+def is_current(entry, digest, config, outputs):
+  return (entry is not None and entry.get("sha256") == digest and entry.get("recipe") == config and not entry.get("failed")
+          and entry.get("outputs") == outputs and all(os.path.exists(output) for output in outputs))
+
+if __name__ == '__main__':
+  args = parser.parse_args()
+  if args.recipe in RECIPES:
+    recipe = RECIPES[args.recipe]
+  else:
+    recipe = logpipeline.load_recipe(args.recipe)
+  config = recipe_hash(recipe)
+  os.makedirs(args.output, exist_ok=True)
+  manifest_path = args.manifest or os.path.join(args.output, "manifest.json")
+  manifest = load_manifest(manifest_path)
+  manifest["recipes"][config] = recipe
+
+  inputs = find_inputs(args.inputs)
+  stems = {}
+  for filename in inputs:
+    stem = csv_stem(filename) or os.path.basename(filename)
+    if stem in stems:
+      sys.stderr.write(f"Error: {filename} and {stems[stem]} would both be written to {stem}{args.extension}\n")
+      exit(1)
+    stems[stem] = filename
+
+  jobs = max(1, min(args.jobs, len(inputs)))
+  if jobs > 1 and any(stage.get("store") or stage.get("seen") for stage in recipe):
+    # Processes sharing an identifier store would wait on each other's database locks, and
+    # each would save its own copy of a file of seen rows
+    sys.stderr.write("The recipe uses an identifier store or a file of seen rows, so files are processed one at a time\n")
+    jobs = 1
+  seen_paths = [stage["seen"] for stage in recipe if stage.get("seen")]
+  with multiprocessing.Pool(jobs) as pool:
+    tasks = []
+    # The manifest entry of each file to process; it is only recorded once the file is done, so that an interrupted
+    # run leaves the entries of the files it did not finish as they were
+    pending = {}
+    reprocessed = []
+    for filename, digest, size, mtime_ns in pool.imap(hash_task, [(filename, manifest["files"].get(filename)) for filename in inputs]):
+      stages, outputs = file_recipe(recipe, csv_stem(filename) or os.path.basename(filename), args.output, args.extension)
+      entry = manifest["files"].get(filename)
+      if not args.force and is_current(entry, digest, config, outputs):
+        if (args.verbose):
+          sys.stderr.write(f"Unchanged: {filename}\n")
+        continue
+      if seen_paths and entry is not None and entry.get("recipe") is not None:
+        reprocessed.append(filename)
+      pending[filename] = {"sha256": digest, "size": size, "mtime_ns": mtime_ns, "recipe": config, "outputs": outputs}
+      tasks.append((filename, stages, outputs))
+
+    if reprocessed:
+      # The rows of a file that has been processed are in the file of seen rows, so processing it again would remove all of them
+      for filename in reprocessed:
+        sys.stderr.write(f"Error: {filename} has already been processed, and its rows are in {', '.join(seen_paths)}\n")
+      sys.stderr.write("Remove them from the manifest and start from an earlier copy of the seen rows file to process them again\n")
+      exit(1)
+
+    sys.stderr.write(f"{len(tasks)} of {len(inputs)} files to process\n")
+    if args.dry_run:
+      for filename, stages, outputs in tasks:
+        print(filename)
+      exit(0)
+    # Larger files first, so that the last one to finish is not a big one started late
+    tasks.sort(key=lambda task: -os.path.getsize(task[0]))
+    failed = []
+    for filename, error, rows, written, seconds in pool.imap_unordered(process_task, tasks):
+      now = datetime.datetime.now().isoformat(timespec="seconds")
+      if error:
+        # Keep the entry of an earlier run, if there is one, but mark it so that the file is tried again next time
+        entry = manifest["files"].setdefault(filename, dict(pending[filename], recipe=None))
+        entry.update({"failed": error, "failed_at": now})
+        failed.append(filename)
+        sys.stderr.write(f"Failed {filename}: {error}\n")
+      else:
+        manifest["files"][filename] = dict(pending[filename], rows=rows, written=written, seconds=round(seconds, 3), processed=now)
+        sys.stderr.write(f"Processed {filename}: read {rows} rows, wrote {written} rows in {seconds:.1f}s\n")
+      save_manifest(manifest_path, manifest)
+  save_manifest(manifest_path, manifest)
+  if failed:
+    sys.stderr.write(f"{len(failed)} of {len(tasks)} files failed; they will be processed again on the next run\n")
+    exit(1)
@@ -1,6 +1,2 @@
 chcp 65001
-csvgrep -e utf-8 -z 10000000 -c application -m CLUE  %1 > .\student-logs-clue-only.csv
-python .\src\expand-json-fields.py -c parameters  -f documentUid -f documentKey -f documentType -f documentVisibility -f documentChanges -f tileId -f tileType -f objectId -f objectType -f sectionId -f sourceObjectId -f sourceUsername -f sourceDocumentKey -f sourceDocumentType -f sourceSectionId -f serializedObject -f title -f groupId -f studentId -f toolId -f target -f tileTitle -f tab_name -f tab_section_name -f arrowId -f sourceTileId -f sourceTileType -f targetTileId -f targetTileType -f showOrHide -f newTitle -f args -f sourceTile -f sharedTiles .\student-logs-clue-only.csv > .\student-logs-parameters-expanded.csv
-python .\src\expand-json-fields.py -c extras -f activityPage -f activityUrl -f appMode -f classHash -f disconnects -f interactive_id -f interactive_url -f investigation -f method -f navTabsOpen -f problem -f problemPath -f role -f selectedGroupId -f selectedNavTab -f sequence -f sequenceActivityIndex -f teacherPanel -f tzOffset -f url .\student-logs-parameters-expanded.csv > .\student-logs-extras-expanded.csv
-python .\src\deidentify-columns.py -c class -c school -m mapping.csv student-logs-extras-expanded.csv > student-logs-deidentified.csv
-python .\src\process-teacher-column.py student-logs-deidentified.csv -m teacher_map.csv > %2
+python .\src\process-file.py -r student -o %2 %1
@@ -1,4 +1,2 @@
 chcp 65001
-csvgrep -e utf-8 -z 10000000 -c application -m CLUE  %1 > .\teacher-logs-clue-only.csv
-python .\src\expand-json-fields.py -c parameters -f documentUid -f documentKey -f documentType -f documentVisibility -f documentChanges -f commentText -f curriculum -f tileId -f tileType -f objectId -f objectType -f sectionId -f sourceObjectId -f sourceUsername -f sourceDocumentKey -f sourceDocumentType -f sourceSectionId -f serializedObject -f title -f text -f type -f targetUserId -f targetGroupId -f groupId -f studentId -f toolId -f target -f tileTitle -f tab_name -f tab_section_name -f arrowId -f sourceTileId -f sourceTileType -f targetTileId -f targetTileType -f showOrHide -f newTitle -f networkClassHash -f networkUsername -f args -f sourceTile -f sharedTiles -f via -f group -f tags .\teacher-logs-clue-only.csv > .\teacher-logs-parameters-expanded.csv
-python .\src\expand-json-fields.py -c extras -f activityPage -f activityUrl -f appMode -f classHash -f disconnects -f interactive_id -f interactive_url -f investigation -f method -f navTabsOpen -f problem -f problemPath -f role -f selectedGroupId -f selectedNavTab -f sequence -f sequenceActivityIndex -f teacherPanel -f tzOffset -f url .\teacher-logs-parameters-expanded.csv > %2
\ No newline at end of file
+python .\src\process-file.py -r teacher -o %2 %1
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+# Processing recipes for raw CLUE log exports, run by process-file.py.
+# These are the same steps that process-student-file.bat and process-teacher-file.bat perform.
+
+EXTRAS_FIELDS = ["activityPage", "activityUrl", "appMode", "classHash", "disconnects", "interactive_id",
+                 "interactive_url", "investigation", "method", "navTabsOpen", "problem", "problemPath", "role",
+                 "selectedGroupId", "selectedNavTab", "sequence", "sequenceActivityIndex", "teacherPanel",
+                 "tzOffset", "url"]
+
+STUDENT_PARAMETERS_FIELDS = ["documentUid", "documentKey", "documentType", "documentVisibility", "documentChanges",
+                             "tileId", "tileType", "objectId", "objectType", "sectionId", "sourceObjectId",
+                             "sourceUsername", "sourceDocumentKey", "sourceDocumentType", "sourceSectionId",
+                             "serializedObject", "title", "groupId", "studentId", "toolId", "target", "tileTitle",
+                             "tab_name", "tab_section_name", "arrowId", "sourceTileId", "sourceTileType",
+                             "targetTileId", "targetTileType", "showOrHide", "newTitle", "args", "sourceTile",
+                             "sharedTiles"]
+
+TEACHER_PARAMETERS_FIELDS = ["documentUid", "documentKey", "documentType", "documentVisibility", "documentChanges",
+                             "commentText", "curriculum", "tileId", "tileType", "objectId", "objectType", "sectionId",
+                             "sourceObjectId", "sourceUsername", "sourceDocumentKey", "sourceDocumentType",
+                             "sourceSectionId", "serializedObject", "title", "text", "type", "targetUserId",
+                             "targetGroupId", "groupId", "studentId", "toolId", "target", "tileTitle", "tab_name",
+                             "tab_section_name", "arrowId", "sourceTileId", "sourceTileType", "targetTileId",
+                             "targetTileType", "showOrHide", "newTitle", "networkClassHash", "networkUsername", "args",
+                             "sourceTile", "sharedTiles", "via", "group", "tags"]
+
+RECIPES = {
+  "student": [
+    {"stage": "filter", "column": "application", "match": "CLUE"},
+    {"stage": "expand", "column": "parameters", "fields": STUDENT_PARAMETERS_FIELDS},
+    {"stage": "expand", "column": "extras", "fields": EXTRAS_FIELDS},
+    {"stage": "deidentify", "columns": ["class", "school"], "mapfile": "mapping.csv"},
+    {"stage": "teacher", "mapfile": "teacher_map.csv"},
+  ],
+  "teacher": [
+    {"stage": "filter", "column": "application", "match": "CLUE"},
+    {"stage": "expand", "column": "parameters", "fields": TEACHER_PARAMETERS_FIELDS},
+    {"stage": "expand", "column": "extras", "fields": EXTRAS_FIELDS},
+  ],
+}
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+import numpy as np
+from csvreader import ColumnReader
+from fingerprints import FingerprintSet, values_fingerprint, fingerprint_array
+import compressed
+import instrumentation
+import rowfilter
+
+parser = argparse.ArgumentParser(description="Remove duplicate rows from a CSV file, eg after concatenating log exports that overlap.",
+                                 epilog="The first copy of each row is kept, and rows are written as they are in the input. "
+                                 + "Only a 64-bit fingerprint of each distinct row is kept in memory (8 bytes per row), "
+                                 + "so files of hundreds of millions of rows can be processed.")
+parser.add_argument("filename", help="CSV file")
+parser.add_argument("-k", "--key", action="append",
+                    help="Column that identifies a row (eg id). Can be specified more than once; by default rows are compared in full")
+parser.add_argument("-o", "--output", help="Path to the CSV file without duplicates (default: standard output)")
+parser.add_argument("-d", "--duplicates", metavar="PATH", help="Write the rows that were removed to this CSV file")
+parser.add_argument("-s", "--seen", metavar="PATH",
+                    help="File of the fingerprints of rows seen in earlier runs (created if it does not exist); rows seen before "
+                    + "are removed too, and the file is updated with the new rows, eg to remove the overlap of each weekly export with the ones before")
+parser.add_argument("--batch-size", default=10000, type=int, help="Number of rows to check at a time (default: 10000)")
+parser.add_argument("-v", "--verbose", action="store_true", help="Print information while running")
+rowfilter.add_arguments(parser)
+instrumentation.add_arguments(parser)
+
+# Rows are also checked once this many bytes of them are waiting
+BATCH_BYTES = 16 << 20
+
+# Open a binary file for the raw rows, or standard output if filename is None
+def open_rows_output(filename):
+  if not filename:
+    return open(sys.stdout.fileno(), mode="wb", closefd=False)
+  return compressed.open_binary_output(filename)
+
+def remove_duplicates(filename, keys=None, output=None, duplicates_path=None, seen_path=None, batch_size=10000, row_filter=None):
+  seen = FingerprintSet()
+  if seen_path:
+    try:
+      seen.load(seen_path)
+    except FileNotFoundError:
+      if (args.verbose):
+        sys.stderr.write(f"Creating {seen_path}\n")
+  previous = len(seen)
+  removed = 0
+  # Read only the key columns, or whole rows; rows are fingerprinted by their values, as by the dedupe stage of
+  # process-file.py, so that a --seen file can be shared with it
+  with ColumnReader(filename, keys or None, row_filter) as reader, open_rows_output(output) as out:
+    duplicates = compressed.open_binary_output(duplicates_path) if duplicates_path else None
+    out.write(reader.header_raw + b'\n')
+    if duplicates:
+      duplicates.write(reader.header_raw + b'\n')
+    progress = instrumentation.Progress(reader, args.verbose, args.summary)
+    check = progress.timed("transform", seen.add_array)
+    write = progress.timed("write", out.write)
+    rows = []
+    digests = []
+    waiting = 0
+
+    def check_batch():
+      new = check(fingerprint_array(b''.join(digests)))
+      write(b''.join(row for row, keep in zip(rows, new.tolist()) if keep))
+      if duplicates:
+        duplicates.write(b''.join(row for row, keep in zip(rows, new.tolist()) if not keep))
+      return len(rows) - int(np.count_nonzero(new))
+
+    for values, start, end in progress.track(reader):
+      row = reader.raw(start, end) + b'\n'
+      digests.append(values_fingerprint(values))
+      rows.append(row)
+      waiting += len(row)
+      if len(rows) >= batch_size or waiting >= BATCH_BYTES:
+        removed += check_batch()
+        rows = []
+        digests = []
+        waiting = 0
+    if rows:
+      removed += check_batch()
+    if duplicates:
+      duplicates.close()
+    progress.finish(duplicates=removed, distinct=len(seen) - previous)
+  if seen_path:
+    seen.save(seen_path)
+  sys.stderr.write(f"Removed {removed:,} duplicate rows of {progress.rows:,}\n")
+  if (args.verbose):
+    sys.stderr.write(f"Fingerprints: {len(seen):,} in {seen.nbytes() / 1e6:.1f} MB\n")
+
+
+if __name__ == '__main__':
+  args = parser.parse_args()
+  row_filter = rowfilter.from_arguments(parser, args)
+  with instrumentation.profiled(args.cprofile, args.cprofile_output):
+    remove_duplicates(args.filename, args.key, args.output, args.duplicates, args.seen, args.batch_size, row_filter)
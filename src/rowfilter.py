@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Keep only the rows of a CSV file whose columns match a set of conditions, as the scripts read it.
+#
+# Each condition (a Predicate) tests one column: its value equals one of the given values, contains one
+# of them, or matches one of the given regular expressions.  A row is kept if every condition holds.
+# A column can also be a field of a JSON column, eg extras.role, which is taken from the JSON text
+# (see jsonfields.py) only for the rows that get that far.
+#
+# Before a record is parsed, its raw bytes are searched for the text that an equals or contains condition
+# needs (eg b"CLUE" for application=CLUE).  A record without it cannot match, and is skipped without
+# building any strings; the rest are parsed and checked properly.  Regular expressions, and values that the
+# CSV or JSON encoding would change, are only checked on parsed rows.
+
+import re
+import csv
+import json
+import contextlib
+import compressed
+from csvreader import ColumnReader, column_index
+from jsonfields import FieldExtractor
+
+KINDS = ["equals", "contains", "matches"]
+
+class Predicate:
+  def __init__(self, column, kind, values):
+    if kind not in KINDS:
+      raise ValueError("Unknown condition " + kind + "; conditions are: " + ", ".join(KINDS))
+    self.column = column
+    self.kind = kind
+    self.values = [values] if isinstance(values, str) else list(values)
+    self.patterns = [re.compile(value) for value in self.values] if kind == "matches" else None
+    self.json_field = None
+
+  # Find the column in the header; a name that is not a column but starts with one and a dot is a JSON field
+  def setup(self, header):
+    if self.column not in header and "." in self.column:
+      column, field = self.column.split(".", 1)
+      if column in header:
+        self.json_field = FieldExtractor([field])
+        return column_index(header, column)
+    return column_index(header, self.column)
+
+  # Byte strings of which at least one must be in any record that matches, or None if there are none
+  def needles(self):
+    if self.kind == "matches":
+      return None
+    needles = []
+    for value in self.values:
+      if not value or "\r" in value or "\n" in value:
+        return None
+      if self.json_field is not None:
+        # The value must appear as it is in the JSON text
+        if json.dumps(value) != '"' + value + '"' or json.dumps(value, ensure_ascii=False) != '"' + value + '"':
+          return None
+        needles.append(value.encode("utf-8"))
+      else:
+        # Quotes in a quoted CSV field are doubled
+        needles.append(value.replace('"', '""').encode("utf-8"))
+    return needles
+
+  def test(self, value):
+    if self.json_field is not None:
+      value = self.json_value(value)
+    if self.kind == "equals":
+      return value in self.values
+    if self.kind == "contains":
+      return any(text in value for text in self.values)
+    return any(pattern.search(value) for pattern in self.patterns)
+
+  # The field as expand-json-fields.py would write it
+  def json_value(self, json_text):
+    if not json_text:
+      return ''
+    try:
+      value = self.json_field.extract(json_text)[0]
+    except ValueError:
+      return ''
+    if value is None:
+      return ''
+    return value if isinstance(value, str) else str(value)
+
+class RowFilter:
+  def __init__(self, predicates):
+    self.predicates = predicates
+    self.needles = None
+    # Records skipped by the raw byte check, and parsed rows that did not match
+    self.skipped = 0
+    self.rejected = 0
+
+  def setup(self, header):
+    self.indexes = [predicate.setup(header) for predicate in self.predicates]
+    self.needles = [needles for needles in (predicate.needles() for predicate in self.predicates) if needles]
+
+  # Check the raw bytes of a record, data[start:end], for the text every match must contain.
+  # Only needed if self.needles is not empty after setup.
+  def prefilter(self, data, start, end):
+    for needles in self.needles:
+      for needle in needles:
+        if data.find(needle, start, end) != -1:
+          break
+      else:
+        self.skipped += 1
+        return False
+    return True
+
+  # Check the values of the filter's columns, in the order of self.indexes
+  def test(self, values):
+    for predicate, value in zip(self.predicates, values):
+      if not predicate.test(value):
+        self.rejected += 1
+        return False
+    return True
+
+  def matches(self, row):
+    return self.test([row[index] if index < len(row) else '' for index in self.indexes])
+
+  def stats(self):
+    return f"Rows skipped by the filter: {self.skipped:,} before parsing, {self.rejected:,} after"
+
+def add_arguments(parser):
+  parser.add_argument("--equals", action="append", metavar="COLUMN=VALUE",
+                      help="Only read rows where the column has this value. Can be specified more than once; "
+                      + "values given for the same column are alternatives. The column can be a JSON field, eg extras.role")
+  parser.add_argument("--contains", action="append", metavar="COLUMN=TEXT",
+                      help="Only read rows where the column contains this text (like csvgrep -m). Can be specified more than once")
+  parser.add_argument("--matches", action="append", metavar="COLUMN=REGEX",
+                      help="Only read rows where the column matches this regular expression. Can be specified more than once")
+
+# Build a filter from the command line arguments added by add_arguments, or return None if there are no conditions
+def from_arguments(parser, args):
+  conditions = {}
+  for kind in KINDS:
+    for condition in getattr(args, kind) or []:
+      column, separator, value = condition.partition("=")
+      if not separator or not column:
+        parser.error(f"--{kind} needs a COLUMN=VALUE argument, not {condition}")
+      conditions.setdefault((column, kind), []).append(value)
+  if not conditions:
+    return None
+  try:
+    return RowFilter([Predicate(column, kind, values) for (column, kind), values in conditions.items()])
+  except re.error as error:
+    parser.error(f"Invalid regular expression: {error}")
+
+# Open a CSV file, yielding (file, header, rows) where rows iterates over the rows after the header.
+# Without a filter the file is read with csv.reader; with one, the rows that do not match are skipped.
+# The file is for progress reporting.
+@contextlib.contextmanager
+def open_rows(filename, row_filter=None):
+  if row_filter is None:
+    with compressed.open_input(filename) as file:
+      csv_reader = csv.reader(file)
+      header = next(csv_reader)
+      yield file, header, csv_reader
+  else:
+    with ColumnReader(filename, None, row_filter) as reader:
+      yield reader, reader.header, (row for row, start, end in reader)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import csv
+import math
+import heapq
+import argparse
+import tempfile
+from timestamps import to_milliseconds
+from csvreader import column_index
+import compressed
+import instrumentation
+import rowfilter
+
+parser = argparse.ArgumentParser(description="Sort a CSV file by a column, using a bounded amount of memory.",
+                                 epilog="Rows are sorted in memory in runs that are written to temporary files and then merged, "
+                                 + "so files much larger than memory can be sorted.  The sort is stable.  "
+                                 + "The sorted CSV file is sent to standard output unless --output is given.")
+parser.add_argument("filename", help="CSV file")
+parser.add_argument("-c", "--column", default="timestamp", help="Heading of the column to sort by (default: timestamp)")
+parser.add_argument("-t", "--type", default="timestamp", choices=["timestamp", "number", "text"],
+                    help="How to compare values: timestamps in seconds or milliseconds since the epoch, numbers, or text (default: timestamp)")
+parser.add_argument("-r", "--reverse", action="store_true", help="Sort in descending order")
+parser.add_argument("-o", "--output", help="Path to the sorted CSV file")
+parser.add_argument("--memory", default=512, type=int, help="Approximate memory to use for each sorted run, in MB (default: 512)")
+parser.add_argument("--temp-dir", help="Directory for the temporary run files (default: the system temporary directory)")
+parser.add_argument("--max-merge", default=64, type=int, help="Maximum number of run files to merge at once (default: 64)")
+parser.add_argument("-v", "--verbose", action="store_true", help="Print information while running")
+rowfilter.add_arguments(parser)
+instrumentation.add_arguments(parser)
+
+# Some log files have very long data in the columns
+csv.field_size_limit(10000000)
+
+# Rough number of bytes Python uses for a row beyond the characters of its fields
+ROW_OVERHEAD = 100
+FIELD_OVERHEAD = 60
+
+# Return a function that gives the sort key of a row.  Timestamps are compared in milliseconds.
+# Values that cannot be compared as numbers, including nan and inf, sort after all of the numbers
+# (also when reverse is true), in their original order.
+def key_function(col_index, value_type, reverse=False):
+  if value_type == "text":
+    return lambda row: row[col_index]
+  convert = to_milliseconds if value_type == "timestamp" else (lambda number: number)
+  non_numeric = (-1, 0) if reverse else (1, 0)
+
+  def key(row):
+    value = row[col_index]
+    try:
+      return (0, convert(int(value)))
+    except ValueError:
+      pass
+    try:
+      number = float(value)
+    except ValueError:
+      return non_numeric
+    # nan would not compare consistently with the other keys, and inf is not a time
+    if not math.isfinite(number):
+      return non_numeric
+    return (0, convert(number))
+  return key
+
+def write_run(rows, temp_dir):
+  file = tempfile.NamedTemporaryFile(mode="w", encoding="utf-8", newline='', suffix=".csv", dir=temp_dir, delete=False)
+  try:
+    with file:
+      writer = csv.writer(file, lineterminator='\n')
+      writer.writerows(rows)
+  except BaseException:
+    os.remove(file.name)
+    raise
+  return file.name
+
+def read_run(filename):
+  with open(filename, encoding="utf-8", mode="r", newline='') as file:
+    yield from csv.reader(file)
+
+# Merge groups of run files until few enough are left to merge into the output in one pass.
+# If merging fails, all of the run files (including the ones it has written) are removed.
+def reduce_runs(runs, key, reverse, temp_dir, max_merge, verbose):
+  merged = []
+  try:
+    while len(runs) > max_merge:
+      if (verbose):
+        sys.stderr.write(f"Merging {len(runs)} runs\n")
+      merged = []
+      for start in range(0, len(runs), max_merge):
+        group = runs[start:start + max_merge]
+        merged.append(write_run(heapq.merge(*[read_run(run) for run in group], key=key, reverse=reverse), temp_dir))
+        for run in group:
+          os.remove(run)
+      runs = merged
+  except BaseException:
+    for run in runs + merged:
+      if os.path.exists(run):
+        os.remove(run)
+    raise
+  return runs
+
+def sort_file(filename, column, value_type, reverse, output, memory_mb, temp_dir, max_merge, row_filter=None):
+  memory_limit = memory_mb * 1024 * 1024
+  runs = []
+  try:
+    with rowfilter.open_rows(filename, row_filter) as (file, header, csv_reader):
+      col_index = column_index(header, column)
+      key = key_function(col_index, value_type, reverse)
+
+      progress = instrumentation.Progress(file, args.verbose, args.summary)
+      sort_run = progress.timed("transform", lambda run: run.sort(key=key, reverse=reverse))
+      save_run = progress.timed("write", write_run)
+      run = []
+      run_size = 0
+      for row in progress.track(csv_reader):
+        run.append(row)
+        run_size += ROW_OVERHEAD + sum(len(field) + FIELD_OVERHEAD for field in row)
+        if run_size >= memory_limit:
+          sort_run(run)
+          runs.append(save_run(run, temp_dir))
+          if (args.verbose):
+            sys.stderr.write(f"Wrote sorted run {len(runs)} of {len(run)} rows\n")
+          run = []
+          run_size = 0
+      sort_run(run)
+
+    out = compressed.open_output(output)
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(header)
+    merge_runs = progress.timed("write", lambda: reduce_runs(runs, key, reverse, temp_dir, max_merge, args.verbose))
+    write_rows = progress.timed("write", writer.writerows)
+    if not runs:
+      write_rows(run)
+    else:
+      if run:
+        runs.append(save_run(run, temp_dir))
+        run = []
+      runs = merge_runs()
+      if (args.verbose):
+        sys.stderr.write(f"Merging {len(runs)} runs\n")
+      write_rows(heapq.merge(*[read_run(run) for run in runs], key=key, reverse=reverse))
+    out.close()
+    progress.finish(runs=len(runs))
+  finally:
+    for run in runs:
+      if os.path.exists(run):
+        os.remove(run)
+
+
+if __name__ == '__main__':
+  args = parser.parse_args()
+  row_filter = rowfilter.from_arguments(parser, args)
+  with instrumentation.profiled(args.cprofile, args.cprofile_output):
+    sort_file(args.filename, args.column, args.type, args.reverse, args.output, args.memory, args.temp_dir, args.max_merge, row_filter)
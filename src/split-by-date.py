@@ -1,31 +1,73 @@
 #!/usr/bin/env python3
 
+import collections
 import datetime
 import sys
-import csv
 import argparse
-import io
+import re
+import hashlib
+from timestamps import to_seconds
+from csvreader import ColumnReader
+import compressed
+import instrumentation
+import rowfilter
 
 parser = argparse.ArgumentParser(description="Divide a CSV file into segments based on a timestamp column.",
-                                 epilog="The file must already be sorted by the indicated column (you can use csvsort from csvkit for this).\n"
+                                 epilog="The file does not need to be sorted; rows are appended to each segment's file in the order they are read.\n"
                                  + "Either unix-style timestamps or milliseconds since the epoch are accepted.")
 parser.add_argument("filename", help="CSV file")
 parser.add_argument("-c", "--column", default="timestamp", help="Heading of the column containing timestamp data")
 parser.add_argument("-o", "--output", required=True, help="Prefix for output files")
+parser.add_argument("-b", "--by", default="year", choices=["year", "month", "week"],
+                    help="Size of the segments (default: year); weeks begin on Monday")
 parser.add_argument("-m", "--month", default=1, type=int, help="Month that the year is considered to begin, as a number; default is 1 (January)")
+parser.add_argument("-k", "--key", help="Split on the values of this column (eg class) instead of by date")
+parser.add_argument("-x", "--extension", default=".csv",
+                    help="Extension of the output files; use .csv.gz, .csv.bz2 or .csv.xz to compress them (default: .csv)")
+parser.add_argument("--max-open", default=64, type=int,
+                    help="Maximum number of output files to keep open at once (default: 64). A compressed file gets a new compressed "
+                    + "stream each time it is reopened, so set this above the number of output files when compressing if possible")
 parser.add_argument("-v", "--verbose", action="store_true", help="Print information while running")
+rowfilter.add_arguments(parser)
+instrumentation.add_arguments(parser)
 
-# Some log files have very long data in the columns
-csv.field_size_limit(10000000)
+# Keeps a bounded number of output files open, closing the least recently used one when needed.
+# A file is created (with the header) the first time it is used and reopened for appending after that.
+# Appending to a compressed file starts a new compressed stream (eg a gzip member) after the ones before it.
+# Rows are written as the raw bytes of the input record, so their quoting is kept as it was.
+class WriterPool:
+  def __init__(self, output_stem, extension, header, max_open):
+    self.output_stem = output_stem
+    self.extension = extension
+    self.header = header
+    self.max_open = max_open
+    self.open_files = collections.OrderedDict()
+    self.created = set()
 
-def csv_writer_for_year(output_stem, year):
-  filename = f"{output_stem}-{year}.csv"
-  if (args.verbose):
-    sys.stderr.write(f"Creating {filename}\n")
-  # Create file and open in utf-8 text mode
-  file = io.open(filename, "w", newline='', encoding='utf-8')
-  writer = csv.writer(file, lineterminator='\n')
-  return writer
+  def file_for(self, segment):
+    file = self.open_files.get(segment)
+    if file is not None:
+      self.open_files.move_to_end(segment)
+      return file
+    if len(self.open_files) >= self.max_open:
+      _, old_file = self.open_files.popitem(last=False)
+      old_file.close()
+    filename = f"{self.output_stem}-{segment}{self.extension}"
+    if segment in self.created:
+      file = compressed.open_binary_output(filename, "ab")
+    else:
+      if (args.verbose):
+        sys.stderr.write(f"Creating {filename}\n")
+      file = compressed.open_binary_output(filename, "wb")
+      file.write(self.header + b'\n')
+      self.created.add(segment)
+    self.open_files[segment] = file
+    return file
+
+  def close(self):
+    for file in self.open_files.values():
+      file.close()
+    self.open_files.clear()
 
 def year_for_date(date, start_month):
   year = date.year
@@ -33,46 +75,65 @@ def year_for_date(date, start_month):
     year -= 1
   return year
 
-def parse_file(filename, timestamp_field, output_stem, start_month):
-  current_year = None
+def segment_for_date(date, by, start_month):
+  if by == "month":
+    return date.strftime("%Y-%m")
+  if by == "week":
+    return (date - datetime.timedelta(days=date.weekday())).strftime("%Y-%m-%d")
+  return str(year_for_date(date, start_month))
+
+# Makes column values usable as parts of file names.  A value that has to be changed for that (eg "a/b" -> "a_b"),
+# or whose name differs only in case from the name of another value, gets a short hash of the value added to its name,
+# so that different values never share a file (eg "a/b" and "a_b", or "A" and "a" on a case-insensitive file system).
+class SegmentNames:
+  def __init__(self):
+    self.names = {}
+    self.used = set()
+
+  def name(self, value):
+    name = self.names.get(value)
+    if name is None:
+      name = re.sub(r'[^\w.-]', '_', value) or "blank"
+      if name != value or name.lower() in self.used:
+        name += "-" + hashlib.blake2b(value.encode("utf-8"), digest_size=4).hexdigest()
+      self.used.add(name.lower())
+      self.names[value] = name
+    return name
+
+def parse_file(filename, timestamp_field, output_stem, extension, by, start_month, key_field, max_open, row_filter=None):
   non_numeric = 0
-  writer = None
-  # Read file line-by-line as a CSV
-  with open(filename, encoding="utf-8", mode="r") as file:
-      csv_reader = csv.reader(file)
-      # Get the header
-      header = next(csv_reader)
+  # Time zone offsets only change on a 15-minute boundary, so segments are cached by quarter hour
+  segments_by_quarter = {}
+  segment_names = SegmentNames()
+  split_field = key_field or timestamp_field
+  # Read only the column to split on; rows are copied to the output as they are
+  with ColumnReader(filename, [split_field], row_filter) as reader:
+      pool = WriterPool(output_stem, extension, reader.header_raw, max_open)
+      progress = instrumentation.Progress(reader, args.verbose, args.summary)
+      write_row = progress.timed("write", lambda segment, start, end: pool.file_for(segment).write(reader.raw(start, end) + b'\n'))
       try:
-        col_index = header.index(timestamp_field)
-      except ValueError:
-        sys.stderr.write("Error: Could not find " + timestamp_field + " column; columns are: " + ", ".join(header))
-        exit(1)
-
-      rows = 0
-      for row in csv_reader:
-        rows += 1
-        if (args.verbose and rows % 1000 == 0):
-          sys.stderr.write(f"Processed {rows} rows\n")
-        try:
-          timestamp = int(row[col_index])
-        except ValueError:
-          if (args.verbose):
-            sys.stderr.write(f"Non-numeric timestamp in row {rows}: {row[col_index]}\n")
-          non_numeric += 1
-          continue
-        if (timestamp):
-          if (timestamp > 10000000000):
-            # Must be formatted in milliseconds
-            timestamp = timestamp / 1000
-          date = datetime.datetime.fromtimestamp(timestamp)
-          year = year_for_date(date, start_month)
-          if year != current_year:
-            # if writer:
-            #   writer.close()
-            current_year = year
-            writer = csv_writer_for_year(output_stem, year)
-            writer.writerow(header)
-          writer.writerow(row)
+        for (value,), start, end in progress.track(reader):
+          if key_field:
+            write_row(segment_names.name(value), start, end)
+            continue
+          try:
+            timestamp = int(value)
+          except ValueError:
+            if (args.verbose):
+              sys.stderr.write(f"Non-numeric timestamp in row {progress.rows}: {value}\n")
+            non_numeric += 1
+            continue
+          if (timestamp):
+            timestamp = to_seconds(timestamp)
+            quarter = int(timestamp // 900)
+            segment = segments_by_quarter.get(quarter)
+            if segment is None:
+              date = datetime.datetime.fromtimestamp(quarter * 900)
+              segment = segments_by_quarter[quarter] = segment_for_date(date, by, start_month)
+            write_row(segment, start, end)
+      finally:
+        pool.close()
+      progress.finish(segments=len(pool.created), non_numeric=non_numeric)
 
   if non_numeric > 0:
     sys.stderr.write("Rows with non-numeric timestamps skipped: " + str(non_numeric) + "\n")
@@ -80,4 +141,8 @@ def parse_file(filename, timestamp_field, output_stem, start_month):
 
 if __name__ == '__main__':
   args = parser.parse_args()
-  parse_file(args.filename, args.column, args.output, args.month)
+  if args.max_open < 1:
+    parser.error("--max-open must be at least 1")
+  row_filter = rowfilter.from_arguments(parser, args)
+  with instrumentation.profiled(args.cprofile, args.cprofile_output):
+    parse_file(args.filename, args.column, args.output, args.extension, args.by, args.month, args.key, args.max_open, row_filter)
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+# Summarize a log file as sessions of activity: for each group (eg each student, or each student and tile),
+# the events are split into sessions wherever there is a gap of more than --gap minutes between them, and
+# each session is written with its start and end, time on task, number of events and tiles and problems touched.
+#
+# The file is read once, parsing only the columns that are needed (see csvreader.py), and a session is written
+# as soon as it ends.  Only the open session and the running totals of each group are kept in memory.  If the
+# estimated size of those goes over --memory-mb, the groups are divided into PARTITIONS by a hash of their key,
+# and the largest partitions are written to temporary files, together with the rows for them that are read
+# after that.  Each of those files is then summarized in the same way once the rest of the file is done,
+# so a whole school year can be summarized in a fixed amount of memory.
+#
+# Sessions are written in the order they end.  The rows of each group should be in time order (eg sorted with
+# sort-by-column.py); an event older than the one before it is added to the open session and counted.
+
+import sys
+import csv
+import zlib
+import pickle
+import argparse
+import datetime
+import tempfile
+from timestamps import to_seconds
+from csvreader import ColumnReader, column_index
+from jsonfields import FieldExtractor
+from decodecache import DecodeCache
+import compressed
+import instrumentation
+import rowfilter
+
+parser = argparse.ArgumentParser(description="Summarize the sessions of activity of each student (or class, or tile) in a log file.",
+                                 epilog="A session ends when there are no events in the group for more than the --gap. "
+                                 + "Columns can be fields of a JSON column, eg parameters.tileId.")
+parser.add_argument("filename", help="CSV file")
+parser.add_argument("-g", "--group", action="append",
+                    help="Column to group events by (default: username). Can be specified more than once, eg -g username -g tileId")
+parser.add_argument("-c", "--column", default="timestamp", help="Heading of the column containing timestamp data")
+parser.add_argument("-e", "--event", default="event", help="Heading of the column containing the event name (default: event)")
+parser.add_argument("-t", "--tile", help="Column with the tile of each event (default: tileId, or parameters.tileId if there is no tileId column)")
+parser.add_argument("-p", "--problem", help="Column with the problem of each event (default: problem, or extras.problem if there is no problem column)")
+parser.add_argument("--gap", default=30, type=float, help="Minutes without events that end a session (default: 30)")
+parser.add_argument("--count", action="append", metavar="EVENT",
+                    help="Add a column with the number of events of this type in each session. Can be specified more than once")
+parser.add_argument("-o", "--output", help="Path to the sessions CSV file (default: standard output)")
+parser.add_argument("--totals", metavar="PATH", help="Also write the totals of each group (sessions, time on task, events, tiles) to this CSV file")
+parser.add_argument("--memory-mb", default=512, type=float, help="Approximate memory for the open groups before some are written to disk (default: 512)")
+parser.add_argument("--spill-dir", help="Directory for the temporary files (default: the system temporary directory)")
+parser.add_argument("-v", "--verbose", action="store_true", help="Print information while running")
+rowfilter.add_arguments(parser)
+instrumentation.add_arguments(parser)
+
+# Columns that are used when they are in the file, for the options that are not given
+DEFAULT_TILE = ["tileId", "parameters.tileId"]
+DEFAULT_PROBLEM = ["problem", "extras.problem"]
+PARTITIONS = 16
+# Rough memory used by a group, and by each distinct tile or problem it holds
+GROUP_BYTES = 1000
+VALUE_BYTES = 100
+# Rows for a spilled partition are written in batches of this many
+SPILL_BATCH = 10000
+# A partition that is still too big after this many rounds of splitting is kept in memory
+MAX_LEVEL = 4
+
+# Reads the values of a set of columns from the columns of a ColumnReader.
+# A name that is not a column, but starts with a column and a dot, is a field of that JSON column.
+# A name of None has the value '' in every row.
+class ColumnValues:
+  def __init__(self, header, names):
+    self.columns = []
+    fields = {}
+    getters = []
+    for name in names:
+      if name is None:
+        getters.append((None, None))
+        continue
+      if name not in header and "." in name and name.split(".", 1)[0] in header:
+        column, field = name.split(".", 1)
+        fields.setdefault(column, []).append(field)
+        getters.append((column, len(fields[column]) - 1))
+      else:
+        column_index(header, name)
+        getters.append((name, None))
+      if getters[-1][0] not in self.columns:
+        self.columns.append(getters[-1][0])
+    caches = {column: json_cache(column_fields) for column, column_fields in fields.items()}
+    self.getters = [(self.columns.index(column) if column is not None else None,
+                     caches[column] if field is not None else None, field) for column, field in getters]
+
+  # The values of the named columns, given the values of self.columns
+  def get(self, values):
+    result = []
+    for index, cache, field in self.getters:
+      if index is None:
+        result.append('')
+        continue
+      value = values[index]
+      if cache is not None:
+        value = json_value(cache, value, field)
+      result.append(value)
+    return result
+
+# Decode the fields of a JSON column through a cache, since the same cells are often repeated
+def json_cache(fields):
+  extractor = FieldExtractor(fields)
+  return DecodeCache(lambda json_data: tuple(extractor.extract(json_data)))
+
+# A field of a JSON cell as expand-json-fields.py would write it, or '' if the cell cannot be decoded
+def json_value(cache, json_data, field):
+  if not json_data:
+    return ''
+  try:
+    value = cache.get(json_data)[field]
+  except ValueError:
+    return ''
+  if value is None:
+    return ''
+  return value if isinstance(value, str) else str(value)
+
+# The first of the default columns that is in the file, or None if none of them are
+def default_column(header, names):
+  for name in names:
+    if name in header or ("." in name and name.split(".", 1)[0] in header):
+      return name
+  return None
+
+# The open session and running totals of one group
+class GroupState:
+  __slots__ = ["sessions", "start", "last", "events", "counts", "tiles", "problems",
+               "total_seconds", "total_events", "all_tiles"]
+
+  def __init__(self, counted):
+    self.sessions = 0
+    self.start = None
+    self.last = None
+    self.events = 0
+    self.counts = [0] * counted
+    self.tiles = set()
+    self.problems = {}
+    self.total_seconds = 0
+    self.total_events = 0
+    self.all_tiles = set()
+
+# Groups events into sessions, keeping the groups in memory up to a budget and spilling partitions of them to disk
+class SessionAggregator:
+  def __init__(self, gap, counted_events, memory_bytes, spill_dir, write_session, write_totals, stats, level=0):
+    self.gap = gap
+    self.counted = {event: index for index, event in enumerate(counted_events)}
+    self.memory_bytes = memory_bytes
+    self.spill_dir = spill_dir
+    self.write_session = write_session
+    self.write_totals = write_totals
+    self.stats = stats
+    self.level = level
+    self.groups = {}
+    self.bytes = 0
+    # Partition number -> (file, rows waiting to be written)
+    self.spilled = {}
+
+  def partition(self, key):
+    return zlib.crc32("\x1f".join(key).encode("utf-8"), self.level) % PARTITIONS
+
+  def add(self, key, timestamp, event, tile, problem):
+    if self.spilled:
+      spill = self.spilled.get(self.partition(key))
+      if spill is not None:
+        spill[1].append((key, timestamp, event, tile, problem))
+        if len(spill[1]) >= SPILL_BATCH:
+          self.write_spill(spill)
+        return
+    state = self.groups.get(key)
+    if state is None:
+      state = self.groups[key] = GroupState(len(self.counted))
+      self.bytes += GROUP_BYTES
+    if state.start is None:
+      state.start = state.last = timestamp
+    elif timestamp - state.last > self.gap:
+      self.end_session(key, state)
+      state.start = state.last = timestamp
+    elif timestamp < state.last:
+      self.stats["out_of_order"] += 1
+      if timestamp < state.start:
+        state.start = timestamp
+    else:
+      state.last = timestamp
+    state.events += 1
+    index = self.counted.get(event)
+    if index is not None:
+      state.counts[index] += 1
+    if tile and tile not in state.tiles:
+      state.tiles.add(tile)
+      if tile not in state.all_tiles:
+        state.all_tiles.add(tile)
+        self.bytes += VALUE_BYTES
+      self.bytes += VALUE_BYTES
+    if problem and problem not in state.problems:
+      state.problems[problem] = None
+      self.bytes += VALUE_BYTES
+    if self.bytes > self.memory_bytes and self.level < MAX_LEVEL:
+      self.spill()
+
+  def end_session(self, key, state):
+    state.sessions += 1
+    seconds = state.last - state.start
+    self.write_session(key, state, seconds)
+    state.total_seconds += seconds
+    state.total_events += state.events
+    self.bytes -= VALUE_BYTES * (len(state.tiles) + len(state.problems))
+    state.events = 0
+    state.counts = [0] * len(state.counts)
+    state.tiles = set()
+    state.problems = {}
+    state.start = state.last = None
+
+  # Move the largest partitions to disk until the groups in memory are within half of the budget
+  def spill(self):
+    sizes = {}
+    for key, state in self.groups.items():
+      partition = self.partition(key)
+      sizes[partition] = sizes.get(partition, 0) + group_bytes(state)
+    if (args.verbose):
+      sys.stderr.write(f"Over the memory budget with {len(self.groups):,} groups; writing some of them to disk\n")
+    for partition in sorted(sizes, key=lambda partition: -sizes[partition]):
+      if self.bytes <= self.memory_bytes / 2:
+        break
+      file = tempfile.TemporaryFile(dir=self.spill_dir)
+      spill = self.spilled[partition] = (file, [])
+      states = [(key, state) for key, state in self.groups.items() if self.partition(key) == partition]
+      for key, state in states:
+        del self.groups[key]
+      pickle.dump(states, file, pickle.HIGHEST_PROTOCOL)
+      self.bytes -= sizes[partition]
+      self.stats["spilled"] += 1
+
+  def write_spill(self, spill):
+    file, rows = spill
+    if rows:
+      pickle.dump(rows, file, pickle.HIGHEST_PROTOCOL)
+      rows.clear()
+
+  # End the open sessions and write the totals of every group, then summarize each spilled partition
+  def finish(self):
+    for key, state in self.groups.items():
+      if state.start is not None:
+        self.end_session(key, state)
+      self.write_totals(key, state)
+    self.groups = {}
+    self.bytes = 0
+    for partition, spill in self.spilled.items():
+      self.write_spill(spill)
+      file = spill[0]
+      file.seek(0)
+      aggregator = SessionAggregator(self.gap, list(self.counted), self.memory_bytes, self.spill_dir,
+                                     self.write_session, self.write_totals, self.stats, self.level + 1)
+      states = pickle.load(file)
+      for key, state in states:
+        aggregator.groups[key] = state
+        aggregator.bytes += group_bytes(state)
+      while True:
+        try:
+          rows = pickle.load(file)
+        except EOFError:
+          break
+        for row in rows:
+          aggregator.add(*row)
+      file.close()
+      aggregator.finish()
+    self.spilled = {}
+
+# Estimated memory used by a group
+def group_bytes(state):
+  return GROUP_BYTES + VALUE_BYTES * (len(state.tiles) + len(state.all_tiles) + len(state.problems))
+
+def format_time(timestamp):
+  return datetime.datetime.fromtimestamp(timestamp).isoformat(sep=" ", timespec="seconds")
+
+def summarize(filename, groups, timestamp_field, event_field, tile_field, problem_field, gap_minutes, counted_events,
+              output=None, totals_path=None, memory_mb=512, spill_dir=None, row_filter=None):
+  # Read the header as it will be parsed below, without a byte order mark
+  with ColumnReader(filename, []) as reader:
+    header = reader.header
+  # Without a tile or problem column, the counts of tiles and problems are left empty
+  tile_field = tile_field or default_column(header, DEFAULT_TILE)
+  problem_field = problem_field or default_column(header, DEFAULT_PROBLEM)
+  columns = ColumnValues(header, groups + [timestamp_field, event_field, tile_field, problem_field])
+  if (args.verbose):
+    sys.stderr.write(f"Grouping by {', '.join(groups)}; tiles from {tile_field or 'no column'}, "
+                     + f"problems from {problem_field or 'no column'}\n")
+
+  out = compressed.open_output(output, newline='')
+  writer = csv.writer(out, lineterminator='\n')
+  writer.writerow(groups + ["session", "start", "end", "seconds", "events"] + counted_events + ["tiles", "problems"])
+  totals_file = compressed.open_output(totals_path, newline='') if totals_path else None
+  totals_writer = csv.writer(totals_file, lineterminator='\n') if totals_file else None
+  if totals_writer:
+    totals_writer.writerow(groups + ["sessions", "seconds", "events", "tiles"])
+
+  def write_session(key, state, seconds):
+    writer.writerow(list(key) + [state.sessions, format_time(state.start), format_time(state.last), round(float(seconds), 3),
+                                 state.events] + state.counts + [len(state.tiles) if tile_field else '', " ".join(state.problems)])
+
+  def write_totals(key, state):
+    if totals_writer:
+      totals_writer.writerow(list(key) + [state.sessions, round(float(state.total_seconds), 3), state.total_events,
+                                          len(state.all_tiles) if tile_field else ''])
+
+  stats = {"out_of_order": 0, "spilled": 0}
+  aggregator = SessionAggregator(gap_minutes * 60, counted_events, memory_mb * 1e6, spill_dir, write_session, write_totals, stats)
+  group_count = len(groups)
+  non_numeric = 0
+  blank = 0
+  with ColumnReader(filename, columns.columns, row_filter) as reader:
+    progress = instrumentation.Progress(reader, args.verbose, args.summary)
+    add = progress.timed("transform", aggregator.add)
+    for values, start, end in progress.track(reader):
+      values = columns.get(values)
+      key = tuple(values[:group_count])
+      if not all(key):
+        blank += 1
+        continue
+      timestamp, event, tile, problem = values[group_count:]
+      try:
+        timestamp = int(timestamp)
+      except ValueError:
+        non_numeric += 1
+        continue
+      if (timestamp):
+        add(key, to_seconds(timestamp), event, tile, problem)
+    finish = progress.timed("write", aggregator.finish)
+    finish()
+    out.close()
+    if totals_file:
+      totals_file.close()
+    progress.finish(out_of_order=stats["out_of_order"], spilled_partitions=stats["spilled"], non_numeric=non_numeric, blank=blank)
+
+  if non_numeric > 0:
+    sys.stderr.write(f"Rows with non-numeric timestamps skipped: {non_numeric}\n")
+  if blank > 0 and args.verbose:
+    sys.stderr.write(f"Rows without a value in the group columns skipped: {blank}\n")
+  if stats["out_of_order"] > 0:
+    sys.stderr.write(f"Warning: {stats['out_of_order']} events are older than an earlier event of the same group; "
+                     + "sort the file by timestamp for exact sessions\n")
+  if stats["spilled"] > 0 and args.verbose:
+    sys.stderr.write(f"Partitions written to disk: {stats['spilled']}\n")
+
+
+if __name__ == '__main__':
+  args = parser.parse_args()
+  row_filter = rowfilter.from_arguments(parser, args)
+  with instrumentation.profiled(args.cprofile, args.cprofile_output):
+    summarize(args.filename, args.group or ["username"], args.column, args.event, args.tile, args.problem, args.gap, args.count or [],
+              args.output, args.totals, args.memory_mb, args.spill_dir, row_filter)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Parsing of the teachers column, which lists the teachers of a class as "First Last (1234), Other Teacher (5678)".
+# The first teacher listed is the primary teacher.
+#
+# A class's teacher string repeats on every row logged in that class, so parsed strings are memoized.
+
+import functools
+import re
+
+# One "name (id)" entry
+TEACHER_PATTERN = re.compile(r"\s*([^,()]*?)\s*\((\d+)\)")
+# Fallback for cells that are not in the usual format: the first two words and the first number
+NAME_PATTERN = re.compile(r"\w+\s\w+")
+ID_PATTERN = re.compile(r"\d+")
+
+# Return the (name, id) pairs of the teachers in a cell, primary teacher first; empty if none are found
+def parse_teachers(data):
+  entries = TEACHER_PATTERN.findall(data)
+  if entries:
+    return tuple(entries)
+  name = NAME_PATTERN.search(data)
+  number = ID_PATTERN.search(data)
+  if name and number:
+    return ((name.group(), number.group()),)
+  return ()
+
+class TeacherParser:
+  def __init__(self, cache_size=100000):
+    self.parse = functools.lru_cache(maxsize=cache_size)(parse_teachers)
+    # Every teacher name seen, mapped to its id
+    self.id_map = {}
+    # Non-empty cells in which no teacher id was found
+    self.unparsed = 0
+
+  # Return the primary teacher's id, or '' if the cell has no teachers
+  def primary_id(self, data):
+    teachers = self.parse(data)
+    if not teachers:
+      if data.strip():
+        self.unparsed += 1
+      return ''
+    for name, number in teachers:
+      self.id_map[name] = number
+    return teachers[0][1]
+
+  def stats(self):
+    info = self.parse.cache_info()
+    return f"Teacher cells parsed: {info.misses}; cache hits: {info.hits}; cells without a teacher id: {self.unparsed}"
+
+  # A warning about the cells without a teacher id, which are blanked rather than kept, or None if there were none
+  def warning(self):
+    if self.unparsed:
+      return f"Warning: {self.unparsed} teachers cells had no teacher id and were replaced with an empty value"
+    return None
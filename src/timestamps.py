@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+
+# Our log files have timestamp columns that use seconds or milliseconds since the Unix epoch.
+# Any value above this must be formatted in milliseconds.
+MS_THRESHOLD = 10000000000
+
+# Convert a timestamp to seconds since the epoch (a float if it was in milliseconds)
+def to_seconds(timestamp):
+  if (timestamp > MS_THRESHOLD):
+    return timestamp / 1000
+  return timestamp
+
+# Convert a timestamp to whole milliseconds since the epoch, which sorts and compares exactly
+def to_milliseconds(timestamp):
+  if (timestamp > MS_THRESHOLD):
+    return timestamp
+  return timestamp * 1000
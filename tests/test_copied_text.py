@@ -0,0 +1,140 @@
+import os
+import sys
+import random
+import unittest
+import collections
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from copied_text import CopiedTextRemover, remove_copied_text, token_key
+
+class RemoveCopiedTextTest(unittest.TestCase):
+    # (copied text, student text, expected result)
+    CASES = [
+        ("What do you notice? Explain how you know.", "What do you notice? I see a pattern. Explain how you know.", "I see a pattern."),
+        ("What do you notice?", "", ""),
+        ("", "my own answer", "my own answer"),
+        ("What do you notice?", "what do you notice", ""),
+        ("Explain how you know.", "Explain it to me, you know?", "Explain it to me, you know?"),
+        ("Show your work", "Show your work: 3 + 4 = 7", "3 + 4 = 7"),
+        ("Compare the two tables.", "compare the two tables. The first one grows faster.", "The first one grows faster."),
+    ]
+
+    def test_cases(self):
+        for copied, student, expected in self.CASES:
+            with self.subTest(copied=copied, student=student):
+                self.assertEqual(remove_copied_text(student, copied), expected)
+
+    def test_short_copy_removed_only_when_whole(self):
+        self.assertEqual(remove_copied_text("Ratios", "Ratios"), "")
+        self.assertEqual(remove_copied_text("ratios!", "Ratios"), "")
+        self.assertEqual(remove_copied_text("Ratios grow. I like ratios", "Ratios"), "Ratios grow. I like ratios")
+        self.assertEqual(remove_copied_text("My two tables", "Two tables"), "My two tables")
+
+    def test_remover_reused_for_many_texts(self):
+        remover = CopiedTextRemover("Use the diagram to show your thinking.")
+        self.assertEqual(remover.remove("Use the diagram to show your thinking. It doubles."), "It doubles.")
+        self.assertEqual(remover.remove("The diagram shows it."), "The diagram shows it.")
+
+def difflib_removal(student_text, copied_text):
+    """
+    The character-level removal with difflib that copied_text.py replaced, as the reference.
+
+    Returns:
+        - The characters of the student text that difflib does not match to the copied text.
+    """
+    if not copied_text or not student_text:
+        return student_text
+    matcher = SequenceMatcher(None, copied_text, student_text)
+    return ''.join(student_text[j1:j2] for tag, _, _, j1, j2 in matcher.get_opcodes() if tag in ('insert', 'replace')).strip()
+
+def score(kept_text, written):
+    """
+    Compares the words kept by a removal with the words the student wrote, ignoring case and punctuation.
+
+    Returns:
+        - The precision (fraction of kept words that the student wrote) and recall (fraction of the student's words kept).
+    """
+    kept = collections.Counter(token_key(word) for word in kept_text.split())
+    expected = collections.Counter(token_key(word) for word in written.split())
+    correct = sum((kept & expected).values())
+    # Keeping nothing is fully precise, and there is nothing to recall when the student wrote nothing
+    precision = correct / sum(kept.values()) if kept else 1.0
+    recall = correct / sum(expected.values()) if expected else 1.0
+    return precision, recall
+
+PROMPT = ("What do you notice about the ratio of the two numbers in each table? Explain how you know. "
+          + "Use the diagram to show your thinking.")
+
+class DifflibComparisonTest(unittest.TestCase):
+    # (name, student text, words the student wrote)
+    PAIRS = [
+        ("answers between the questions",
+         "What do you notice about the ratio of the two numbers in each table? They both double. Explain how you know. "
+         + "Because 2 times 3 is 6. Use the diagram to show your thinking. I drew apples.",
+         "They both double. Because 2 times 3 is 6. I drew apples."),
+        ("prompt partly edited",
+         "What do you notice about the ratio of two numbers in each table? They both double. Explain how you know it. "
+         + "Because 2 times 3 is 6.",
+         "They both double. it Because 2 times 3 is 6."),
+        ("prompt pasted twice", PROMPT + " " + PROMPT + " My answer is twelve.", "My answer is twelve."),
+        ("whitespace changed", PROMPT.replace(" ", "  ").replace("? ", "?\n") + "\nMy answer is twelve.", "My answer is twelve."),
+        ("punctuation and case changed",
+         PROMPT.lower().replace("?", "").replace(".", ",") + " My answer is twelve.", "My answer is twelve."),
+        ("no copied text", "The ratio is 2 to 3 because every row doubles.", "The ratio is 2 to 3 because every row doubles."),
+        ("only copied text", PROMPT, ""),
+    ]
+
+    def test_pairs(self):
+        for name, student, written in self.PAIRS:
+            with self.subTest(name):
+                precision, recall = score(remove_copied_text(student, PROMPT), written)
+                reference_precision, reference_recall = score(difflib_removal(student, PROMPT), written)
+                # Every word the student wrote is kept, and nothing is kept that difflib would have removed
+                self.assertEqual(recall, 1.0)
+                self.assertGreaterEqual(recall, reference_recall)
+                self.assertGreaterEqual(precision, reference_precision)
+
+    def test_same_result_as_difflib_when_the_copy_is_exact(self):
+        # When the prompt is copied unchanged at the start, both methods keep exactly the student's own text
+        for student in [PROMPT, PROMPT + " My answer is twelve.", PROMPT + " I think it doubles because 3 and 6 are in the table."]:
+            with self.subTest(student):
+                self.assertEqual(remove_copied_text(student, PROMPT).split(), difflib_removal(student, PROMPT).split())
+
+    def test_random_pairs(self):
+        # Prompts of generated sentences, copied with some words deleted, re-cased or appended, and answers after some
+        # sentences, as in benchmarks/copied_text.py
+        prompt_words = "what do you notice about the ratio of the numbers in each table explain how you know use the diagram".split()
+        student_words = "i think it doubles because when one side grows the other side grows too at the same rate".split()
+        rand = random.Random(7)
+        totals = {"words": [0, 0], "difflib": [0, 0]}
+        for pair in range(40):
+            sentences = [" ".join(rand.choice(prompt_words) for i in range(rand.randint(6, 12))).capitalize() + "?"
+                         for i in range(rand.randint(2, 8))]
+            answer = []
+            written = []
+            for sentence in sentences:
+                tokens = sentence.split()
+                if rand.random() < 0.2:
+                    del tokens[rand.randrange(1, len(tokens))]
+                if rand.random() < 0.2:
+                    tokens[0] = tokens[0].lower()
+                answer.extend(tokens)
+                if rand.random() < 0.5:
+                    own = [rand.choice(student_words) for i in range(rand.randint(4, 12))]
+                    answer.extend(own)
+                    written.extend(own)
+            for name, method in [("words", remove_copied_text), ("difflib", difflib_removal)]:
+                precision, recall = score(method(" ".join(answer), " ".join(sentences)), " ".join(written))
+                totals[name][0] += precision
+                totals[name][1] += recall
+        words_precision, words_recall = (total / 40 for total in totals["words"])
+        difflib_precision, difflib_recall = (total / 40 for total in totals["difflib"])
+        # The word-level removal keeps nearly all of the student's words, and keeps far less of the prompt than difflib
+        self.assertGreaterEqual(words_recall, 0.95)
+        self.assertGreaterEqual(words_recall, difflib_recall)
+        self.assertGreaterEqual(words_precision, 0.95)
+        self.assertGreater(words_precision, difflib_precision)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import io
+import csv
+import sys
+import gzip
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import compressed
+import csvchunks
+from csvreader import ColumnReader
+
+HEADER = b'id,name,parameters,note\n'
+# Records as they are written in the file, each with its line ending
+RECORDS = [
+    b'1,ann,"{""tileId"": ""t1"", ""args"": [{""text"": ""a, b""}]}",plain\n',
+    b'2,bob,"line one\nline two",\n',
+    b'3,"cat, jr","windows\r\nline",x\r\n',
+    b'4,dan,"""quoted"" at the start and ""end""",\n',
+    b'5,5" screen,12" x 9",it\'s "fine"\n',
+    b'6,a"b,"after a stray quote\n,still quoted",z\n',
+    b'\n',
+    b'7,,"",\n',
+    b'8,eve,"{""text"": ""one\n\ntwo\n""}",last\r\n',
+    b'9,"short row"\n',
+    b'10,fay,"no newline at the end",done',
+]
+
+def expected_rows(data):
+    # What the scripts get from csv.reader on a file opened in text mode, without the byte order mark and blank lines
+    return [row for row in csv.reader(io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline=None)) if row]
+
+class CsvFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.directory.name, name)
+        if name.endswith(".gz"):
+            with gzip.open(path, mode="wb") as file:
+                file.write(data)
+        else:
+            with open(path, mode="wb") as file:
+                file.write(data)
+        return path
+
+class ColumnReaderTest(CsvFileTest):
+    def check(self, name, data):
+        path = self.write(name, data)
+        expected = expected_rows(data)
+        header, rows = expected[0], expected[1:]
+        with ColumnReader(path, None) as reader:
+            self.assertEqual(reader.header, header)
+            self.assertEqual([row for row, start, end in reader], rows)
+        # Every subset of columns, in any order, gives the same values as the whole rows ('' for missing fields)
+        for columns in [header, ["id"], ["note", "id"], ["parameters"], ["name", "note"]]:
+            with self.subTest(columns=columns):
+                indexes = [header.index(column) for column in columns]
+                with ColumnReader(path, columns) as reader:
+                    self.assertEqual([values for values, start, end in reader],
+                                     [[row[index] if index < len(row) else '' for index in indexes] for row in rows])
+
+    def test_records(self):
+        self.check("records.csv", HEADER + b''.join(RECORDS))
+
+    def test_byte_order_mark(self):
+        self.check("bom.csv", b'\xef\xbb\xbf' + HEADER + b''.join(RECORDS))
+        self.check("bom-quoted.csv", b'\xef\xbb\xbf"id",name,parameters,note\n' + b''.join(RECORDS))
+
+    def test_crlf(self):
+        self.check("crlf.csv", (HEADER + b''.join(RECORDS)).replace(b'\n', b'\r\n'))
+
+    def test_record_offsets(self):
+        path = self.write("offsets.csv", HEADER + b''.join(RECORDS))
+        offsets = []
+        position = len(HEADER)
+        for record in RECORDS:
+            if record != b'\n':
+                offsets.append((position, position + len(record.rstrip(b'\r\n'))))
+            position += len(record)
+        with ColumnReader(path, ["id"]) as reader:
+            self.assertEqual([(start, end) for values, start, end in reader], offsets)
+
+    def test_compressed(self):
+        data = HEADER + b''.join(RECORDS)
+        # Small blocks, so that records, quoted fields and doubled quotes are split between blocks
+        for block_size in [1, 2, 3, 7, 64, 1 << 20]:
+            with self.subTest(block_size=block_size), mock.patch.object(compressed, "BLOCK_SIZE", block_size):
+                self.check("records.csv.gz", data)
+                self.check("bom.csv.gz", b'\xef\xbb\xbf' + data)
+
+class SplitFileTest(CsvFileTest):
+    def test_record_boundaries(self):
+        data = HEADER + b''.join(RECORDS)
+        path = self.write("records.csv", data)
+        # Offsets just after the newline at the end of each record
+        boundaries = [len(HEADER)]
+        for record in RECORDS[:-1]:
+            boundaries.append(boundaries[-1] + len(record))
+        # Every target, including those inside quoted fields, gives the first record boundary after it
+        for target in range(len(data)):
+            with self.subTest(target=target):
+                following = [boundary for boundary in boundaries if boundary > target]
+                self.assertEqual(csvchunks.record_boundaries(path, [target]), following[:1])
+        self.assertEqual(csvchunks.record_boundaries(path, range(len(data))), boundaries)
+
+    def test_chunks_parse_like_the_whole_file(self):
+        for name, prefix in [("records.csv", b''), ("bom.csv", b'\xef\xbb\xbf')]:
+            for line_ending in [b'\n', b'\r\n']:
+                data = prefix + (HEADER + b''.join(RECORDS)).replace(b'\n', line_ending)
+                path = self.write(name, data)
+                expected = expected_rows(data)
+                for chunks in range(1, len(data) + 2):
+                    with self.subTest(name=name, line_ending=line_ending, chunks=chunks):
+                        header_end, ranges = csvchunks.split_file(path, chunks)
+                        self.assertEqual(header_end, len(prefix) + len(HEADER.replace(b'\n', line_ending)))
+                        self.assertEqual([start for start, end in ranges[1:]], [end for start, end in ranges[:-1]])
+                        self.assertEqual(ranges[-1][1], len(data))
+                        rows = []
+                        for start, end in ranges:
+                            text = io.TextIOWrapper(io.BytesIO(csvchunks.read_range(path, start, end)), encoding="utf-8", newline=None)
+                            rows.extend(row for row in csv.reader(text) if row)
+                        self.assertEqual(rows, expected[1:])
+
+    def test_max_size(self):
+        data = HEADER + b''.join(RECORDS)
+        path = self.write("records.csv", data)
+        # Enough chunks that none is much over the limit
+        self.assertEqual(csvchunks.split_file(path, 1, max_size=100), csvchunks.split_file(path, -(-len(data) // 100)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+import logpipeline
+
+HEADER = "id,username,event,parameters\n"
+ROWS = [
+    ["1", "ann", "TEXT_TOOL_CHANGE", {"tileId": "t1", "args": [{"text": "hi"}]}],
+    ["2", "ann", "TEXT_TOOL_CHANGE", {"tileId": "t1", "args": [{"text": "hi"}]}],
+    ["3", "bob", "CREATE_TILE", {"tileId": "t2", "count": 3}],
+    ["4", "bob", "LOGIN", {}],
+    ["5", "cat", "LOGIN", {}],
+]
+
+class DedupeAfterExpandTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input = self.path("input.csv")
+        with open(self.input, encoding="utf-8", mode="w", newline="") as file:
+            file.write(HEADER)
+            for row_id, username, event, parameters in ROWS:
+                file.write(f'{row_id},{username},{event},"{json.dumps(parameters).replace(chr(34), chr(34) * 2)}"\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def run_recipe(self, recipe, output):
+        return logpipeline.run_pipeline(self.input, logpipeline.build_stages(recipe), output)
+
+    def test_whole_rows_with_missing_and_non_string_fields(self):
+        # Fields that are missing (None), objects, arrays and numbers are added to the rows by the expand stage
+        recipe = [{"stage": "expand", "column": "parameters", "fields": ["tileId", "args", "count"]},
+                  {"stage": "dedupe"}]
+        rows, written = self.run_recipe(recipe, self.path("output.csv"))
+        self.assertEqual((rows, written), (5, 5))
+
+    def test_key_columns_with_missing_fields(self):
+        recipe = [{"stage": "expand", "column": "parameters", "fields": ["tileId"]},
+                  {"stage": "dedupe", "columns": ["tileId", "username"]}]
+        rows, written = self.run_recipe(recipe, self.path("output.csv"))
+        # ann/t1 twice, bob/t2, bob/missing, cat/missing
+        self.assertEqual((rows, written), (5, 4))
+
+    def test_seen_file_shared_with_remove_duplicates(self):
+        seen = self.path("seen.npy")
+        output = self.path("output.csv")
+        recipe = [{"stage": "expand", "column": "parameters", "fields": ["tileId", "args", "count"]},
+                  {"stage": "dedupe", "seen": seen}]
+        self.run_recipe(recipe, output)
+        # Every row written by the stage is in the seen file, so the script removes all of them
+        result = subprocess.run([sys.executable, os.path.join(SRC, "remove-duplicates.py"), "-s", seen, output],
+                                capture_output=True, check=True)
+        self.assertEqual(result.stdout.decode("utf-8").splitlines()[1:], [])
+
+if __name__ == "__main__":
+    unittest.main()
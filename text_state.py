@@ -0,0 +1,86 @@
+import collections
+
+def multiset_difference(tokens, other):
+    """
+    Finds the tokens that are not matched by a token of the other list, counting repeats.
+
+    Returns:
+        - The unmatched tokens, in their original order.
+    """
+    available = collections.Counter(other)
+    result = []
+    for token in tokens:
+        if available[token] > 0:
+            available[token] -= 1
+        else:
+            result.append(token)
+    return result
+
+def changed_words(previous, current):
+    """
+    Compares two versions of a text, given as lists of words.
+
+    Only the region between the longest common prefix and the longest common suffix is
+    compared word by word, so the work beyond the prefix and suffix scan is proportional
+    to the size of the edit rather than to the size of the document.
+
+    Returns:
+        - The words added in the current version.
+        - The words removed from the previous version.
+    """
+    limit = min(len(previous), len(current))
+    start = 0
+    while start < limit and previous[start] == current[start]:
+        start += 1
+    end = 0
+    while end < limit - start and previous[-1 - end] == current[-1 - end]:
+        end += 1
+    old_middle = previous[start:len(previous) - end]
+    new_middle = current[start:len(current) - end]
+    return multiset_difference(new_middle, old_middle), multiset_difference(old_middle, new_middle)
+
+class TileTextTracker:
+    """
+    Keeps the current text of each (student, tileId) pair while text change events are
+    fed to it in timestamp order, and reports the words each event adds and removes.
+
+    Events that are older than the last event seen for their tile are still applied,
+    but are counted in 'out_of_order'; sort the log by timestamp first (eg, with
+    src/sort-by-column.py) to avoid them.
+    """
+
+    def __init__(self):
+        self.texts = {}  # (student, tileId) -> list of words of the current text
+        self.last_timestamps = {}
+        self.events = 0
+        self.out_of_order = 0
+
+    def update(self, student, tile_id, text, timestamp=None):
+        """
+        Applies a text change event.
+
+        Returns:
+            - The words added by the event, separated by spaces.
+            - The words removed by the event, separated by spaces.
+        """
+        key = (student, tile_id)
+        self.events += 1
+        if timestamp is not None:
+            last = self.last_timestamps.get(key)
+            if last is not None and timestamp < last:
+                self.out_of_order += 1
+            else:
+                self.last_timestamps[key] = timestamp
+        current = text.split()
+        added, removed = changed_words(self.texts.get(key, []), current)
+        self.texts[key] = current
+        return ' '.join(added), ' '.join(removed)
+
+    def final_texts(self):
+        """
+        Lists the latest text of every tile.
+
+        Returns:
+            - A list of (student, tileId, final text) tuples.
+        """
+        return [(student, tile_id, ' '.join(words)) for (student, tile_id), words in self.texts.items()]
@@ -1,7 +1,13 @@
+import bz2
+import csv
+import gzip
 import json
+import lzma
+import sys
 import pandas as pd
 import argparse
-from difflib import SequenceMatcher
+from copied_text import CopiedTextRemover
+from json_cache import memoize_decoding, cache_stats
 
 def extract_text(json_obj):
     """
@@ -18,51 +24,73 @@ def extract_text(json_obj):
         return [text for item in json_obj for text in extract_text(item)]  # Extract text from lists
     return []  # If not a dict or list, return an empty list
 
-def text_change_text(row):
+# Output files with these extensions are compressed, as pandas does for the other files
+COMPRESSED_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+def open_output_file(output_file):
     """
-    Extracts text from 'TEXT_TOOL_CHANGE' events along with its associated tileId.
+    Opens a CSV file for writing, compressed if its name ends in .gz, .bz2 or .xz.
 
     Returns:
-        - The extracted student-entered text.
-        - The tileId associated with the text (if available).
+        - A text file object.
     """
-    try:
-        parameters = json.loads(row['parameters'])  # Load the parameters field as JSON
-        
-        # Ensure the event type is 'TEXT_TOOL_CHANGE' and check for 'args'
-        if row['event'] == 'TEXT_TOOL_CHANGE' and isinstance(parameters.get('args'), list):
-            if isinstance(parameters['args'][0].get('text'), list):  
-                return '', parameters.get('tileId', '')  # Return empty text if it's stored as a list (avoid errors)
-            return parameters['args'][0].get('text', ''), parameters.get('tileId', '')  # Return extracted text and tileId
-        
-    except (json.JSONDecodeError, KeyError, TypeError):
-        pass  # Safely handle cases where JSON is invalid or missing expected fields
-    
-    return '', ''  # Default return values if extraction fails
+    for extension, opener in COMPRESSED_OPENERS.items():
+        if output_file.lower().endswith(extension):
+            return opener(output_file, mode='wt', encoding='utf-8', newline='')
+    return open(output_file, encoding='utf-8', mode='w', newline='')
+
+# Events whose parameters are decoded; the parameters of every other event are never parsed
+EXTRACTED_EVENTS = ['TEXT_TOOL_CHANGE', 'COPY_TILE']
 
-def copy_tile_text(row):
+def event_fields(event, parameters_json):
     """
-    Extracts copied text from 'COPY_TILE' events and associates it with the tileId.
+    Decodes the parameters of a TEXT_TOOL_CHANGE or COPY_TILE event once and extracts
+    everything needed from them.
 
     Returns:
-        - The extracted copied text.
-        - The tileId associated with the copied text.
+        - The text change content and its tileId (for 'TEXT_TOOL_CHANGE' events).
+        - The copied text and its tileId (for 'COPY_TILE' events of 'Text' tiles).
     """
     try:
-        parameters = json.loads(row['parameters'])  # Load JSON data
-        
-        if row['event'] == 'COPY_TILE':  # Check if the event is 'COPY_TILE'
+        parameters = json.loads(parameters_json)  # Load the parameters field as JSON
+
+        # Ensure the event type is 'TEXT_TOOL_CHANGE' and check for 'args'
+        if event == 'TEXT_TOOL_CHANGE' and isinstance(parameters.get('args'), list):
+            if isinstance(parameters['args'][0].get('text'), list):
+                return '', parameters.get('tileId', ''), '', ''  # Return empty text if it's stored as a list (avoid errors)
+            return parameters['args'][0].get('text', ''), parameters.get('tileId', ''), '', ''  # Return extracted text and tileId
+
+        if event == 'COPY_TILE':
             serialized_object = parameters.get('serializedObject', {})  # Get the copied object's data
-            
+
             # Ensure copied tile contains text and is of type 'Text'
             if serialized_object.get('type') == 'Text' and 'text' in serialized_object:
-                extracted_text = serialized_object['text']
-                return extracted_text, parameters.get('tileId', '')  # Return copied text and tileId
-        
-    except (json.JSONDecodeError, KeyError, TypeError):
-        pass  # Handle unexpected JSON parsing errors
-    
-    return '', ''  # Default return values if extraction fails
+                return '', '', serialized_object['text'], parameters.get('tileId', '')  # Return copied text and tileId
+
+    except (json.JSONDecodeError, KeyError, TypeError, IndexError, AttributeError):
+        pass  # Safely handle cases where JSON is invalid or missing expected fields
+
+    return '', '', '', ''  # Default return values if extraction fails
+
+cached_event_fields = memoize_decoding(event_fields)
+
+def extract_event_fields(df):
+    """
+    Extracts text changes, copied text and their tileIds in a single pass.
+
+    Rows are selected with a vectorized mask on the 'event' column, so only the
+    TEXT_TOOL_CHANGE and COPY_TILE rows have their parameters decoded.
+
+    Returns:
+        - A DataFrame with 'text_change', 'text_tileId', 'copied_text' and 'copy_tileId'
+          columns, holding empty strings for all other rows.
+    """
+    columns = ['text_change', 'text_tileId', 'copied_text', 'copy_tileId']
+    mask = df['event'].isin(EXTRACTED_EVENTS).to_numpy()
+    selected = df.loc[mask]
+    extracted = pd.DataFrame([cached_event_fields(event, parameters) for event, parameters in zip(selected['event'], selected['parameters'])],
+                             index=selected.index, columns=columns)
+    return extracted.reindex(df.index, fill_value='')
 
 def combine_text(text_change_content):
     """
@@ -79,6 +107,8 @@ def combine_text(text_change_content):
         pass  # Handle cases where JSON is invalid or missing
     return ''  # Default return if extraction fails
 
+cached_combine_text = memoize_decoding(combine_text)
+
 def clean_copied_text(copied_text):
     """
     Extracts and cleans copied text from JSON format.
@@ -94,29 +124,9 @@ def clean_copied_text(copied_text):
         pass  # Handle errors
     return ''  # Default return if extraction fails
 
-def remove_copied_text(student_text, copied_text):
-    """
-    Uses difflib to remove copied portions from the student's text.
-
-    This function compares the copied text with the student text and removes
-    sections that are exact matches.
+cached_clean_copied_text = memoize_decoding(clean_copied_text)
 
-    Returns:
-        - Student text with copied portions removed.
-    """
-    if not copied_text or not student_text:
-        return student_text  # If either text is empty, return original student text
-    
-    matcher = SequenceMatcher(None, copied_text, student_text)  # Compare copied vs. student text (Difflib)
-    result = []
-    
-    for tag, _, _, j1, j2 in matcher.get_opcodes(): #Difflib (I am not super familiar with difflib so maybe the issue lies here? Or it is just some fault in the logic?)
-        if tag in ('insert', 'replace'):  # Keep only the newly inserted or modified parts
-            result.append(student_text[j1:j2])
-    
-    return ''.join(result).strip()  # Return cleaned text with copied portions removed
-
-def compute_student_text(row, copy_dict):
+def compute_student_text(row, removers):
     """
     Removes copied text from student text based on a mapping of tileId to copied text.
 
@@ -125,57 +135,109 @@ def compute_student_text(row, copy_dict):
     Returns:
         - Cleaned student-only text.
     """
-    tile_id = row['tileId']  # Get the tile ID
-    copied_text = copy_dict.get(tile_id, '')  # Find copied text for this tile
-    
+    remover = removers.get(row['tileId'])  # Find the copied text for this tile
     student_text = row['combined_text']  # Get the student's written text
-    cleaned_text = remove_copied_text(student_text, copied_text)  # Remove copied portions
+    if remover is None:
+        return student_text
+    return remover.remove(student_text)  # Remove copied portions
 
-    return cleaned_text  # Return cleaned student-only text
+def build_copy_index(df):
+    """
+    Builds a compact index of COPY_TILE events keyed by the tileId of the copy.
 
-def process_student_logs(input_file, output_file):
+    Returns:
+        - A dictionary mapping each copied tileId to the list of its cleaned copied texts.
+    """
+    copies = df[df['copy_tileId'] != '']  # Only COPY_TILE events of 'Text' tiles have a copy_tileId
+    copy_index = {}
+    for tile_id, copied_text in zip(copies['copy_tileId'], copies['cleaned_copied_text']):
+        copy_index.setdefault(tile_id, []).append(copied_text)
+    return copy_index
+
+def write_matched_pairs(df, copy_index, output_file):
+    """
+    Streams TEXT_TOOL_CHANGE rows against the copy index, writing one row for each
+    pair of a text change and a copy of the same tile.
+
+    Only the index is kept in memory, so a tile that is copied and edited many
+    times does not build up a cross product of rows.
+
+    Returns:
+        - A dictionary mapping each copied tileId to its number of text changes.
+    """
+    change_counts = dict.fromkeys(copy_index, 0)
+    changes = df[df['event'] == 'TEXT_TOOL_CHANGE']
+    with open_output_file(output_file) as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(['Matching Tile ID', 'Student Edited Text', 'Copied Text', 'Final Student-Only Text'])
+        for tile_id, combined_text, student_only_text in zip(changes['tileId'], changes['combined_text'], changes['student_only_text']):
+            copied_texts = copy_index.get(tile_id)
+            if copied_texts:
+                change_counts[tile_id] += 1
+                for copied_text in copied_texts:
+                    writer.writerow([tile_id, combined_text, copied_text, student_only_text])
+    return change_counts
+
+def write_match_counts(copy_index, change_counts, counts_file):
+    """
+    Writes the number of copies, text changes and matched rows for each copied tile,
+    largest first, so that tiles with a disproportionate share of the output are easy to spot.
+    """
+    counts = pd.DataFrame({
+        'Tile ID': list(copy_index),
+        'Copies': [len(copied_texts) for copied_texts in copy_index.values()],
+        'Text Changes': [change_counts[tile_id] for tile_id in copy_index],
+    })
+    counts['Matched Rows'] = counts['Copies'] * counts['Text Changes']
+    counts.sort_values('Matched Rows', ascending=False, kind='stable').to_csv(counts_file, index=False)
+
+def process_student_logs(input_file, output_file, counts_file=None, min_match=3):
     """
     Processes student logs to extract, clean, and remove copied text.
 
     Steps:
-        1. Extract text changes (TEXT_TOOL_CHANGE).
-        2. Extract copied text (COPY_TILE).
-        3. Map copied text to tile IDs.
-        4. Remove copied portions from student text.
-        5. Save the cleaned data to a CSV file.
+        1. Extract text changes (TEXT_TOOL_CHANGE) and copied text (COPY_TILE) in one pass.
+        2. Map the cleaned copied text to tile IDs.
+        3. Remove copied runs of words from student text.
+        4. Pair text changes with the copies of their tile and save them to a CSV file.
+        5. Optionally save the number of matches per copied tile.
     """
     df = pd.read_csv(input_file)  # Load CSV file
     
-    # Extract text changes and associated tileId
-    df[['text_change', 'text_tileId']] = df.apply(lambda row: pd.Series(text_change_text(row)), axis=1)
-    
-    # Extract copied text and tileId from COPY_TILE events
-    df[['copied_text', 'copy_tileId']] = df.apply(lambda row: pd.Series(copy_tile_text(row)), axis=1)
+    # Extract text changes, copied text and their tileIds from TEXT_TOOL_CHANGE and COPY_TILE events
+    df[['text_change', 'text_tileId', 'copied_text', 'copy_tileId']] = extract_event_fields(df)
     
-    # Create a dictionary mapping copy_tileId to copied text
-    copy_dict = df.set_index('copy_tileId')['copied_text'].dropna().to_dict()
-
     # Combine extracted text change content into a single string
-    df['combined_text'] = df['text_change'].apply(combine_text)
+    df['combined_text'] = df['text_change'].apply(cached_combine_text)
 
     # Clean extracted copied text
-    df['cleaned_copied_text'] = df['copied_text'].apply(clean_copied_text)
+    df['cleaned_copied_text'] = df['copied_text'].apply(cached_clean_copied_text)
+
+    # Index the cleaned copied text of each copied tile once, for removing it from every text change of the tile
+    copies = df[df['copy_tileId'] != '']
+    removers = {tile_id: CopiedTextRemover(copied_text, min_match)
+                for tile_id, copied_text in zip(copies['copy_tileId'], copies['cleaned_copied_text'])}
 
     # Remove copied text from student responses
-    df['student_only_text'] = df.apply(lambda row: compute_student_text(row, copy_dict), axis=1)
-    
-    # Match tile IDs to pair related student and copied text
-    df_matched_pairs = df.merge(df, left_on='tileId', right_on='copy_tileId', suffixes=('_text_change', '_copied'))
-    df_matched_pairs = df_matched_pairs[['tileId_text_change', 'combined_text_text_change', 'cleaned_copied_text_copied', 'student_only_text_text_change']]
-    df_matched_pairs.columns = ['Matching Tile ID', 'Student Edited Text', 'Copied Text', 'Final Student-Only Text']
+    df['student_only_text'] = df.apply(lambda row: compute_student_text(row, removers), axis=1)
     
-    # Save processed data
-    df_matched_pairs.to_csv(output_file, index=False)
+    # Pair each text change with the copies of its tile
+    copy_index = build_copy_index(df)
+    change_counts = write_matched_pairs(df, copy_index, output_file)
+    if counts_file:
+        write_match_counts(copy_index, change_counts, counts_file)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process student logs to extract and clean text while removing copied portions.")
     parser.add_argument("input_file", help="Path to the input CSV file.")
     parser.add_argument("output_file", help="Path to save the processed CSV file.")
+    parser.add_argument("--match-counts", help="Path to save the number of copies, text changes and matched rows per copied tile.")
+    parser.add_argument("--min-match", type=int, default=3, help="Minimum number of consecutive words that count as copied text (default: 3).")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print how many JSON cells were decoded and how many were repeats.")
     args = parser.parse_args()
     
-    process_student_logs(args.input_file, args.output_file)
+    process_student_logs(args.input_file, args.output_file, args.match_counts, args.min_match)
+    if args.verbose:
+        sys.stderr.write(cache_stats("parameters", cached_event_fields) + "\n")
+        sys.stderr.write(cache_stats("text changes", cached_combine_text) + "\n")
+        sys.stderr.write(cache_stats("copied text", cached_clean_copied_text) + "\n")